@@ -0,0 +1,353 @@
+"""run_benchmarks.py.
+
+Time and memory-profile each stage of the repo's pipeline on synthetic data, and save the results as json.
+
+For each scale, a synthetic collection and MALLET state file are generated (see `synthetic.py`) and each stage
+is run on them: preparing the doc-terms file and dfr-browser metadata from json documents (`prepare-data`),
+counting the state file and scaling the topics (`topic-modeling`), converting the counts to dfr-browser data
+files (`dfr-browser`), counting word frequencies and running the Wilcoxon rank sum test (`comparison`), and
+training and applying a classifier (`classification`). The time taken and the peak memory allocated by each
+stage are saved to a json file, which can be compared with the results of an earlier version to find stages
+that have become slower or use more memory.
+
+Run every stage at the small and medium scales and save the results:
+python scripts/run_benchmarks.py --scales small medium --output results/benchmarks.json
+
+Compare the results with an earlier run:
+python scripts/run_benchmarks.py --compare results/baseline.json results/benchmarks.json
+
+"""
+
+import argparse
+import contextlib
+import importlib
+import importlib.util
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timezone
+
+from synthetic import generate_corpus, generate_state
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir)
+
+# The scripts folders of the modules that are benchmarked
+for module in ['topic-modeling', 'dfr-browser', 'comparison', 'classification']:
+    sys.path.append(os.path.join(REPO_DIR, module, 'scripts'))
+
+from report import SilentReporter, set_reporter
+
+# The settings for each scale of synthetic data (see `generate_corpus()`)
+SCALES = {
+    'tiny': {'num_docs': 100, 'num_words': 1000, 'doc_length': 100, 'num_topics': 10},
+    'small': {'num_docs': 1000, 'num_words': 5000, 'doc_length': 200, 'num_topics': 20},
+    'medium': {'num_docs': 10000, 'num_words': 20000, 'doc_length': 300, 'num_topics': 50},
+    'large': {'num_docs': 50000, 'num_words': 50000, 'doc_length': 400, 'num_topics': 100}
+}
+
+# The largest number of documents compared by the comparison stages, which build dense word x document tables
+COMPARISON_SAMPLE = 500
+
+def load_prepare_data():
+    """Import `prepare-data/scripts/prepare-data.py`, whose name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location('prepare_data',
+                                                  os.path.join(REPO_DIR, 'prepare-data', 'scripts', 'prepare-data.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def stage_prepare_data(data, work_dir):
+    """Create a doc-terms file from the json documents."""
+    prepare = load_prepare_data()
+    import_file = work_dir + '/doc-terms.txt'
+    return lambda: prepare.prepare_data(data['json_dir'], import_file, False, None, work_dir + '/log.txt', None)
+
+def stage_dfrb_metadata(data, work_dir):
+    """Create the dfr-browser metadata files from the json documents."""
+    prepare = load_prepare_data()
+    metadata_dir = work_dir + '/metadata'
+    return lambda: prepare.dfrb_metadata(metadata_dir, metadata_dir + '/metadata.csv', metadata_dir + '/meta.temp.csv',
+                                         metadata_dir + '/meta.csv', data['json_dir'], None)
+
+def stage_aggregate_state(data, work_dir):
+    """Count the topic assignments in the state file."""
+    from mallet_state import aggregate_state
+    return lambda: aggregate_state(data['state_file'])
+
+def stage_load_model_arrays(data, work_dir):
+    """Load the counts from the arrays saved after training, instead of counting them in the state file."""
+    from model_arrays import load_model_arrays, save_model_arrays
+    state_file = work_dir + '/topic-state.gz'
+    shutil.copyfile(data['state_file'], state_file)
+    save_model_arrays(state_file, counts=data['counts'])
+    def run():
+        arrays = load_model_arrays(state_file)
+        # read the arrays, which are only memory-mapped when they are loaded
+        return arrays['doc_topic'].sum(), arrays['topic_term'].sum(), arrays['doc_topics'].sum()
+    return run
+
+def stage_convert_mallet_data(data, work_dir):
+    """Convert the state file to the distributions used to scale the topics."""
+    from scale_topics import convert_mallet_data
+    return lambda: convert_mallet_data(data['state_file'])
+
+def stage_get_topic_coordinates(data, work_dir):
+    """Scale the topics."""
+    from scale_topics import convert_mallet_data, get_topic_coordinates
+    # imported here so the time taken to import it is not counted (the script imports it when it is first used)
+    for module in ['scipy.spatial.distance', 'scipy.stats']:
+        importlib.import_module(module)
+    converted = convert_mallet_data(counts=data['counts'])
+    return lambda: get_topic_coordinates(**converted)
+
+def stage_dfrb_conversion(data, work_dir):
+    """Write the dfr-browser topic-words and doc-topics files from the counts."""
+    from dfrb_data import convert_counts
+    return lambda: convert_counts(data['counts'], work_dir + '/tw.json', work_dir + '/dt.json.zip')
+
+def comparison_samples(data, work_dir):
+    """Write doc-terms files for two samples of documents to compare."""
+    with open(data['doc_terms']) as f:
+        rows = f.readlines()
+    size = min(COMPARISON_SAMPLE, len(rows) // 2)
+    samples = []
+    for i, sample in enumerate([rows[:size], rows[size:2 * size]]):
+        samples.append(work_dir + '/sample' + str(i + 1) + '-doc-terms.txt')
+        with open(samples[-1], 'w') as f:
+            f.writelines(sample)
+    return samples
+
+def stage_findFreq(data, work_dir):
+    """Build the word frequency tables for a sample of documents."""
+    from compare_word_frequencies import findFreq
+    sample = comparison_samples(data, work_dir)[0]
+    return lambda: findFreq(sample)
+
+def stage_wrs_test(data, work_dir):
+    """Run the Wilcoxon rank sum test on two samples of documents."""
+    import compare_word_frequencies as cwf
+    samples = comparison_samples(data, work_dir)
+    df1_relative, df1_freqs = cwf.findFreq(samples[0])
+    df2_relative, df2_freqs = cwf.findFreq(samples[1])
+    df1_relative, df1_freqs, df2_relative, df2_freqs = cwf.edit_freq_dataframes(df1_relative, df1_freqs,
+                                                                                df2_relative, df2_freqs)
+    files = [work_dir + '/' + name for name in ['c1.csv', 'c2.csv', 'c1-raw.csv', 'c2-raw.csv']]
+    df1, df2, words_c1, words_c2 = cwf.match_dataframes_and_save(5, df1_freqs, df1_relative, df2_freqs, df2_relative,
+                                                                 *files)
+    vocablist = work_dir + '/vocablist.txt'
+    cwf.get_vocablist(df1, df2, words_c1, words_c2, vocablist)
+    return lambda: cwf.wrs_test(files[0], files[2], files[1], files[3], vocablist, work_dir + '/results.csv')
+
+def stage_classification(data, work_dir):
+    """Train a classifier on the training data and classify the collection."""
+    import pandas as pd
+    from classify import classify_collection, train_classifier
+    training = pd.read_csv(data['training'])
+    def run():
+        vect, clf = train_classifier(training['text'], training['label'], 'logreg')
+        return classify_collection(data['doc_terms'], vect, clf, work_dir + '/results.csv')
+    return run
+
+# The stages, in the order they are run
+STAGES = {
+    'prepare_data': stage_prepare_data,
+    'dfrb_metadata': stage_dfrb_metadata,
+    'aggregate_state': stage_aggregate_state,
+    'load_model_arrays': stage_load_model_arrays,
+    'convert_mallet_data': stage_convert_mallet_data,
+    'get_topic_coordinates': stage_get_topic_coordinates,
+    'dfrb_conversion': stage_dfrb_conversion,
+    'findFreq': stage_findFreq,
+    'wrs_test': stage_wrs_test,
+    'classification': stage_classification
+}
+
+def measure(run, repeat=1, memory=True):
+    """Time a function and measure the memory it allocates.
+
+    The function is run `repeat` times and timed, then run once more with `tracemalloc` to find the peak
+    memory allocated by Python and numpy (tracing memory slows code down, so it is not timed). Anything the
+    function prints is discarded.
+
+    Returns:
+    - dict: The time taken by each run in seconds (`times`), the fastest (`seconds`), and the peak memory
+      allocated in bytes (`peak_memory`), if measured.
+    """
+    times = []
+    with contextlib.redirect_stdout(io.StringIO()):
+        for i in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        result = {'seconds': min(times), 'times': times}
+        if memory:
+            tracemalloc.start()
+            try:
+                run()
+                result['peak_memory'] = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+    return result
+
+def prepare_scale(scale, settings, work_dir, seed=0):
+    """Generate the synthetic data for a scale.
+
+    Returns:
+    - dict: The paths to the json folder, doc-terms file, training data and state file, and the counts of
+      the state file.
+    """
+    from mallet_state import aggregate_state
+    data_dir = work_dir + '/' + scale
+    corpus = generate_corpus(data_dir, seed=seed, **settings)
+    state_file = generate_state(data_dir + '/topic-state.gz', corpus)
+    return {
+        'json_dir': os.path.abspath(corpus['json_dir']),
+        'doc_terms': corpus['doc_terms'],
+        'training': corpus['training'],
+        'state_file': state_file,
+        'counts': aggregate_state(state_file)
+    }
+
+def version_info():
+    """Describe the version of the code and the environment the benchmarks are run in."""
+    try:
+        commit = subprocess.run(['git', 'describe', '--always', '--dirty'], cwd=REPO_DIR, capture_output=True,
+                                text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'date': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count()
+    }
+
+def run_benchmarks(scales=('small',), stages=None, repeat=1, memory=True, work_dir=None, output=None, seed=0):
+    """Run the benchmarks.
+
+    A stage that raises an error (because one of its dependencies is not installed, for instance) is recorded
+    as failed, and the other stages are still run.
+
+    Parameters:
+    - scales (list): The names of the scales to run (see `SCALES`).
+    - stages (list): The names of the stages to run (see `STAGES`). By default, all of them.
+    - repeat (int): The number of times to time each stage.
+    - memory (bool): Measure the peak memory allocated by each stage.
+    - work_dir (str): The folder to generate the data in. By default, a temporary folder that is deleted
+      afterwards.
+    - output (str): Path to the json file to save the results to.
+    - seed (int): The random seed for the synthetic data.
+
+    Returns:
+    - dict: The version information, the settings for each scale and the results for each stage and scale.
+    """
+    if stages is None:
+        stages = list(STAGES)
+    temp_dir = None
+    if work_dir is None:
+        temp_dir = work_dir = tempfile.mkdtemp(prefix='we1s-benchmarks-')
+    report = {'version': version_info(), 'scales': {}, 'results': []}
+    # the stages' own messages are not shown
+    previous_reporter = set_reporter(SilentReporter())
+    try:
+        for scale in scales:
+            settings = SCALES[scale]
+            report['scales'][scale] = settings
+            print('Generating ' + scale + ' data...')
+            data = prepare_scale(scale, settings, work_dir, seed)
+            for stage in stages:
+                stage_dir = work_dir + '/' + scale + '/' + stage
+                os.makedirs(stage_dir, exist_ok=True)
+                result = {'stage': stage, 'scale': scale}
+                try:
+                    with contextlib.redirect_stdout(io.StringIO()):
+                        run = STAGES[stage](data, stage_dir)
+                    result.update(measure(run, repeat, memory))
+                    result['status'] = 'ok'
+                    print('%s (%s): %.3f s' % (stage, scale, result['seconds']))
+                except Exception as err:
+                    result['status'] = 'error'
+                    result['error'] = type(err).__name__ + ': ' + str(err)
+                    print('%s (%s): failed (%s)' % (stage, scale, result['error']))
+                report['results'].append(result)
+    finally:
+        set_reporter(previous_reporter)
+        if temp_dir is not None:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+    if output is not None:
+        os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+        with open(output, 'w') as f:
+            json.dump(report, f, indent=4)
+        print('Saved results to ' + output)
+    return report
+
+def compare_results(baseline, current, tolerance=0.2):
+    """Compare two sets of benchmark results.
+
+    Parameters:
+    - baseline (dict or str): The earlier results, or the path to their json file.
+    - current (dict or str): The new results, or the path to their json file.
+    - tolerance (float): The fraction by which a stage may become slower or use more memory before it is
+      reported as a regression.
+
+    Returns:
+    - list: A dict for each stage and scale in both sets of results, with the time and memory of each and
+      whether the stage has regressed.
+    """
+    reports = []
+    for results in [baseline, current]:
+        if isinstance(results, str):
+            with open(results) as f:
+                results = json.load(f)
+        reports.append({(r['stage'], r['scale']): r for r in results['results'] if r.get('status') == 'ok'})
+    comparison = []
+    for key, new in reports[1].items():
+        old = reports[0].get(key)
+        if old is None:
+            continue
+        row = {'stage': key[0], 'scale': key[1], 'old_seconds': old['seconds'], 'new_seconds': new['seconds'],
+               'old_peak_memory': old.get('peak_memory'), 'new_peak_memory': new.get('peak_memory')}
+        row['slower'] = new['seconds'] > old['seconds'] * (1 + tolerance)
+        row['more_memory'] = row['old_peak_memory'] is not None and row['new_peak_memory'] is not None and \
+            row['new_peak_memory'] > row['old_peak_memory'] * (1 + tolerance)
+        comparison.append(row)
+    return comparison
+
+def main(argv=None):
+    """Run the benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description='Benchmark the WE1S pipeline on synthetic data.')
+    parser.add_argument('--scales', nargs='+', default=['small'], choices=list(SCALES),
+                        help='the scales of data to run (default: small)')
+    parser.add_argument('--stages', nargs='+', choices=list(STAGES), help='the stages to run (default: all)')
+    parser.add_argument('--repeat', type=int, default=1, help='the number of times to time each stage (default: 1)')
+    parser.add_argument('--no-memory', action='store_true', help='do not measure memory use')
+    parser.add_argument('--work-dir', help='the folder to generate data in (default: a temporary folder)')
+    parser.add_argument('--output', help='the json file to save the results to')
+    parser.add_argument('--seed', type=int, default=0, help='the random seed for the synthetic data (default: 0)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'CURRENT'),
+                        help='compare two results files instead of running the benchmarks')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='the fraction a stage may slow down before it is reported (default: 0.2)')
+    args = parser.parse_args(argv)
+    if args.compare:
+        regressions = 0
+        for row in compare_results(args.compare[0], args.compare[1], args.tolerance):
+            flags = [flag for flag in ['slower', 'more_memory'] if row[flag]]
+            regressions += bool(flags)
+            print('%s (%s): %.3f s -> %.3f s %s' % (row['stage'], row['scale'], row['old_seconds'],
+                                                     row['new_seconds'], ' '.join(flags)))
+        return 1 if regressions else 0
+    report = run_benchmarks(args.scales, args.stages, args.repeat, not args.no_memory, args.work_dir, args.output,
+                            args.seed)
+    return 1 if any(r['status'] == 'error' for r in report['results']) else 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,168 @@
+"""synthetic.py.
+
+Generate synthetic WE1S-style data for benchmarking the code in this repo.
+
+Creates a folder of json documents in the format of `json.zip` (with `bag_of_words`, `title`, `pub`,
+`pub_date` and `length` fields), the matching doc-terms file, labelled training data for the classification
+module and a gzipped MALLET state file, at any scale. Word frequencies follow a Zipf distribution, and each
+document's words are drawn from a mixture of synthetic topics, so the data has roughly the shape of real
+news articles. The same seed always produces the same data.
+
+Sample usage:
+corpus = generate_corpus('bench/small', num_docs=500, num_words=5000, doc_length=200)
+state_file = generate_state('bench/small/topic-state10.gz', corpus, num_topics=10)
+
+"""
+
+import csv
+import gzip
+import json
+import os
+import numpy as np
+
+# Sources and search terms used in synthetic filenames, in the format of WE1S filenames
+SOURCES = ['universitywire', 'thenewyorktimes', 'thewashingtonpost', 'usatoday', 'thedallasmorningnews']
+SEARCHES = ['bodypluralhumanitiesorhleadpluralhumanities', 'bodysciencesorhleadsciences']
+
+def make_vocab(num_words, seed=0):
+    """Make a list of `num_words` distinct pronounceable synthetic words."""
+    rng = np.random.default_rng(seed)
+    consonants = list('bcdfghjklmnprstvwz')
+    vowels = list('aeiou')
+    vocab = []
+    seen = set()
+    while len(vocab) < num_words:
+        syllables = rng.integers(1, 4)
+        word = ''.join(rng.choice(consonants) + rng.choice(vowels) for i in range(syllables))
+        word += rng.choice(consonants)
+        if word not in seen:
+            seen.add(word)
+            vocab.append(word)
+    return vocab
+
+def topic_word_probabilities(num_topics, num_words, seed=0):
+    """Make topics x words probabilities in which each topic favours a different set of Zipf-distributed words."""
+    rng = np.random.default_rng(seed)
+    zipf = 1 / np.arange(1, num_words + 1)
+    probabilities = np.empty((num_topics, num_words))
+    for t in range(num_topics):
+        probabilities[t] = zipf[rng.permutation(num_words)] if t else zipf
+    probabilities /= probabilities.sum(axis=1, keepdims=True)
+    return probabilities
+
+def generate_corpus(out_dir, num_docs=1000, num_words=10000, doc_length=200, num_topics=20, docs_per_dir=1000,
+                    seed=0):
+    """Generate a synthetic collection.
+
+    Writes the json documents to `{out_dir}/json/{n}/`, in subfolders of `docs_per_dir` documents as in
+    `json.zip`, the collection's doc-terms file to `{out_dir}/doc-terms.txt` and a classification training
+    file to `{out_dir}/training.csv`, in which documents mostly about the first half of the topics are
+    labelled positive.
+
+    Parameters:
+    - out_dir (str): The folder to write the data to.
+    - num_docs (int): The number of documents.
+    - num_words (int): The size of the vocabulary.
+    - doc_length (int): The average number of words in a document.
+    - num_topics (int): The number of topics the words are drawn from.
+    - docs_per_dir (int): The number of json documents in each subfolder.
+    - seed (int): The random seed.
+
+    Returns:
+    - dict: The paths of the files written, the filenames of the documents, the document topics and words
+      (for `generate_state()`) and the settings used.
+    """
+    rng = np.random.default_rng(seed)
+    vocab = make_vocab(num_words, seed)
+    probabilities = topic_word_probabilities(num_topics, num_words, seed)
+    json_dir = out_dir + '/json'
+    os.makedirs(json_dir, exist_ok=True)
+    filenames = []
+    topics = []
+    words = []
+    labels = []
+    with open(out_dir + '/doc-terms.txt', 'w') as doc_terms:
+        for i in range(num_docs):
+            subdir = json_dir + '/' + str(i // docs_per_dir)
+            if i % docs_per_dir == 0:
+                os.makedirs(subdir, exist_ok=True)
+            year = 2000 + i % 20
+            source = SOURCES[i % len(SOURCES)]
+            search = SEARCHES[i % len(SEARCHES)]
+            filename = '%d_%d_%s_%s_%d-01-01_%d-12-31_%d_%d_0.json' % (i, i, source, search, year, year, i % 97, i)
+            # each document is mostly about a few topics
+            mixture = rng.dirichlet(np.full(num_topics, 0.1))
+            length = max(1, int(rng.poisson(doc_length)))
+            doc_topics = rng.choice(num_topics, size=length, p=mixture)
+            doc_words = np.empty(length, dtype=np.int64)
+            for t in np.unique(doc_topics):
+                mask = doc_topics == t
+                doc_words[mask] = rng.choice(num_words, size=mask.sum(), p=probabilities[t])
+            types, counts = np.unique(doc_words, return_counts=True)
+            bag = {vocab[w]: int(c) for w, c in zip(types, counts)}
+            doc = {
+                'name': filename[:-5],
+                'title': ' '.join(vocab[w] for w in doc_words[:6]).title(),
+                'pub': source,
+                'pub_date': '%d-%02d-%02d' % (year, i % 12 + 1, i % 28 + 1),
+                'length': length,
+                'bag_of_words': bag
+            }
+            with open(subdir + '/' + filename, 'w') as f:
+                json.dump(doc, f)
+            doc_terms.write(filename + ' ' + str(i) + ' ' +
+                            ' '.join(' '.join([vocab[w]] * int(c)) for w, c in zip(types, counts)) + '\n')
+            filenames.append(filename)
+            topics.append(doc_topics)
+            words.append(doc_words)
+            labels.append(int(mixture[:num_topics // 2].sum() > 0.5))
+    with open(out_dir + '/training.csv', 'w', newline='') as f:
+        csv_writer = csv.writer(f)
+        csv_writer.writerow(['filename', 'text', 'label'])
+        for filename, doc_words, label in zip(filenames, words, labels):
+            csv_writer.writerow([filename, ' '.join(sorted(vocab[w] for w in doc_words)), label])
+    return {
+        'json_dir': json_dir,
+        'doc_terms': out_dir + '/doc-terms.txt',
+        'training': out_dir + '/training.csv',
+        'filenames': filenames,
+        'vocab': vocab,
+        'topics': topics,
+        'words': words,
+        'settings': {'num_docs': num_docs, 'num_words': num_words, 'doc_length': doc_length,
+                     'num_topics': num_topics, 'seed': seed}
+    }
+
+def generate_state(state_file, corpus, num_topics=None, alpha=5.0, beta=0.01):
+    """Write a gzipped MALLET state file for a corpus made by `generate_corpus()`.
+
+    Each token is assigned the topic it was drawn from, so the state file looks like that of a trained model.
+
+    Parameters:
+    - state_file (str): Path to the state file to write.
+    - corpus (dict): The output of `generate_corpus()`.
+    - num_topics (int): The number of topics in the model. Defaults to the number of topics the corpus was
+      generated from. Token topics are wrapped if it is smaller.
+    - alpha (float): The sum of the alpha hyperparameters, as reported by MALLET.
+    - beta (float): The beta hyperparameter.
+
+    Returns:
+    - str: The path to the state file.
+    """
+    if num_topics is None:
+        num_topics = corpus['settings']['num_topics']
+    vocab = corpus['vocab']
+    # MALLET numbers word types in the order they are first seen
+    type_index = {}
+    with gzip.open(state_file, 'wt', encoding='utf-8', compresslevel=1) as f:
+        f.write('#doc source pos typeindex type topic\n')
+        f.write('#alpha : ' + ' '.join([str(alpha / num_topics)] * num_topics) + '\n')
+        f.write('#beta : ' + str(beta) + '\n')
+        for doc, (filename, doc_topics, doc_words) in enumerate(zip(corpus['filenames'], corpus['topics'],
+                                                                    corpus['words'])):
+            rows = []
+            for pos, (topic, word) in enumerate(zip(doc_topics.tolist(), doc_words.tolist())):
+                index = type_index.setdefault(word, len(type_index))
+                rows.append('%d %s %d %d %s %d\n' % (doc, filename, pos, index, vocab[word], topic % num_topics))
+            f.write(''.join(rows))
+    return state_file
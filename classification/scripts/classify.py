@@ -0,0 +1,750 @@
+"""classify.py.
+
+Train, evaluate and apply the binary classifiers used in `classification.ipynb`.
+
+`cross_validate_models()` evaluates the logistic regression and SVM classifiers with 10-fold cross-validation.
+Each fold is fit once per classifier and scored on all the metrics at the same time (accuracy, AUC,
+recall, precision and F1), rather than once per metric. The word counts for each fold are computed once and
+shared by both classifiers (the SVM's tf-idf weights are computed from the same counts), can be cached on disk,
+and folds can be run in parallel.
+
+`classify_collection()` applies a trained classifier to a collection's `doc-terms` file. It reads the file in
+batches of rows, skipping the documents in the training data, and writes the label the classifier gives each
+document to a csv file as it goes, so the memory it uses does not grow with the size of the collection.
+`classify_all()` fits each classifier once, saves it with its vectorizer, and applies all of them to several
+collections in parallel.
+
+For large amounts of training data, the `linear_svm` and `sgd` models are faster alternatives to the `logreg`
+and `svm` models. They use a hashing vectorizer, which needs no vocabulary (so there is nothing to learn or
+save with the model), and linear solvers that scale linearly with the number of documents. `sgd` can also be
+trained in batches with `train_in_batches()`. `benchmark_models()` compares the fit time, prediction speed
+and accuracy of the models on the training data.
+
+Sample usage:
+X, Y = load_training_data('humanities')
+scores = cross_validate_models(X, Y, cv=10, n_jobs=-1)
+print_scores(scores)
+
+vect, clf = train_classifier(X, Y, 'logreg')
+classify_collection('../data/doc-terms/c14-doc-terms.txt', vect, clf, 'results/c14humanities-results.csv',
+                    skip=training_filenames('humanities'))
+classify_all(['c14', 'c18', 'c20', 'c21'], ['humanities', 'science'], '../data/doc-terms', workers=4)
+benchmark_models(['humanities', 'obits'])
+
+The bags of words in the training data and doc-terms files are already tokenized, with each word repeated
+once for each time it occurs. Rather than running the vectorizers' tokenizers over these strings every time a
+model is fit or applied, `term_counts()` counts each document's words in one pass and tokenizes each distinct
+word only once. The vectorizers are then fit from the counts with `fit_vectorizer()` and applied with
+`vectorize_texts()`, giving the same results as `fit_transform()` and `transform()`.
+
+The classifiers can also be evaluated, compared and applied from the command line, in the classification
+module directory:
+python scripts/classify.py evaluate humanities --models logreg svm
+python scripts/classify.py benchmark humanities obits
+python scripts/classify.py classify --collections c14 c18 --selections humanities science --doc-terms-dir ../data/doc-terms
+
+For use with classification.ipynb v 2.1.
+
+"""
+
+import argparse
+import csv
+import os
+import sys
+import time
+import numpy as np
+import pandas as pd
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+# scikit-learn, joblib and scipy are slow to import, so they are imported in the functions that use them
+# and `python scripts/classify.py --help` does not have to wait for them
+
+# This folder, so the worker processes of `classify_all()` can import this script by name
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# The reporter is shared with the topic-modeling module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'topic-modeling', 'scripts'))
+from report import add_report_arguments, get_reporter, in_ipython, setup_reporting
+
+# Training data for each classification
+TRAINING_FILES = {
+    'humanities': ('humanities/hum-positive.csv', 'humanities/hum-negative.csv'),
+    'science': ('science/sci-positive.csv', 'science/sci-negative.csv'),
+    'announcements': ('announcements/announce-positive.csv', 'announcements/announce-negative.csv'),
+    'obits': ('obits/obits-positive.csv', 'obits/obits-negative.csv')
+}
+
+# The classifiers we use, and the word weights each one is trained on
+MODELS = {
+    'logreg': 'count',
+    'svm': 'tfidf',
+    'linear_svm': 'hashing',
+    'sgd': 'hashing'
+}
+
+# The number of columns the hashing vectorizer maps words to
+HASHING_FEATURES = 2 ** 20
+
+METRICS = ['accuracy', 'roc_auc', 'recall', 'precision', 'f1']
+
+# The collections we classified for the article
+COLLECTIONS = ['c14', 'c18', 'c20', 'c21']
+
+# Classifiers loaded by `load_classifier()`, kept so that worker processes share them with the notebook
+_classifiers = {}
+
+METRIC_NAMES = {
+    'accuracy': 'Accuracy',
+    'roc_auc': 'AUC',
+    'recall': 'Sensitivity/Recall score',
+    'precision': 'Precision score',
+    'f1': 'F1 score'
+}
+
+def load_training_data(classification_selection, classification_dir='.'):
+    """Load the positive and negative training data for a classification.
+
+    Parameters:
+    - classification_selection (str): `humanities`, `science`, `announcements` or `obits`.
+    - classification_dir (str): Path to the classification module.
+
+    Returns:
+    - X (series): The bag of words of each document.
+    - Y (series): The label of each document (1 for positive, 0 for negative).
+    """
+    positive_file, negative_file = TRAINING_FILES[classification_selection]
+    positive = pd.read_csv(classification_dir + '/' + positive_file)
+    negative = pd.read_csv(classification_dir + '/' + negative_file)
+    # add labels, positive = 1 and negative = 0
+    positive['label'] = 1
+    negative['label'] = 0
+    corpus = pd.concat([positive, negative], ignore_index=True)
+    return corpus['text'], corpus['label']
+
+def make_model(model):
+    """Create an untrained classifier.
+
+    The models are `logreg` (logistic regression), `svm` (a support vector machine with a linear kernel),
+    `linear_svm` (a linear support vector machine using the faster `liblinear` solver) and `sgd` (a linear
+    support vector machine trained by stochastic gradient descent).
+    """
+    from sklearn import svm
+    from sklearn.linear_model import LogisticRegression, SGDClassifier
+    if model == 'logreg':
+        return LogisticRegression()
+    elif model == 'svm':
+        return svm.SVC(C=1.0, kernel='linear')
+    elif model == 'linear_svm':
+        return svm.LinearSVC(C=1.0)
+    elif model == 'sgd':
+        return SGDClassifier(alpha=1e-5, random_state=0)
+    raise ValueError('The model must be one of ' + ', '.join(MODELS) + '.')
+
+def make_vectorizer(model):
+    """Create the vectorizer used with a model.
+
+    `CountVectorizer` for `logreg`, `TfidfVectorizer` for `svm`, and a `HashingVectorizer` (which normalizes
+    the counts of each document) for `linear_svm` and `sgd`.
+    """
+    from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer, TfidfVectorizer
+    if MODELS[model] == 'tfidf':
+        return TfidfVectorizer()
+    elif MODELS[model] == 'hashing':
+        return HashingVectorizer(n_features=HASHING_FEATURES, alternate_sign=False)
+    return CountVectorizer()
+
+def make_pipeline(model):
+    """Create the pipeline of vectorizer and classifier used for a model in `classification.ipynb`."""
+    from sklearn.feature_extraction.text import CountVectorizer
+    from sklearn.pipeline import Pipeline
+    if model == 'logreg':
+        return Pipeline([('vect', CountVectorizer()), ('linear_model', make_model(model))])
+    return Pipeline([('vect', make_vectorizer(model)), (model, make_model(model))])
+
+def count_tokens(texts):
+    """Count the tokens in bags of words in one pass.
+
+    Parameters:
+    - texts (list): The bags of words, as strings of space-separated tokens. Missing bags of words (`NaN`)
+      are treated as empty.
+
+    Returns:
+    - counts (sparse matrix): Documents x tokens counts.
+    - tokens (list): The distinct tokens, in the order of the columns of `counts`.
+    """
+    from scipy import sparse
+    vocabulary = {}
+    indices = []
+    data = []
+    indptr = [0]
+    for text in texts:
+        if isinstance(text, str):
+            for token, count in Counter(text.split()).items():
+                indices.append(vocabulary.setdefault(token, len(vocabulary)))
+                data.append(count)
+        indptr.append(len(indices))
+    counts = sparse.csr_matrix((np.array(data, dtype=np.int64), np.array(indices, dtype=np.int32), indptr),
+                               shape=(len(indptr) - 1, len(vocabulary)))
+    return counts, list(vocabulary)
+
+def term_counts(texts):
+    """Count the terms in bags of words as `CountVectorizer` would, tokenizing each distinct token only once.
+
+    The tokens are lowercased and split into terms by `CountVectorizer`'s tokenizer, and the counts of
+    tokens with the same terms are combined.
+
+    Returns:
+    - counts (sparse matrix): Documents x terms counts.
+    - terms (list): The terms, in alphabetical order.
+    """
+    from scipy import sparse
+    from sklearn.feature_extraction.text import CountVectorizer
+    counts, tokens = count_tokens(texts)
+    vect = CountVectorizer()
+    try:
+        mapping = vect.fit_transform(tokens)
+    except ValueError:
+        # no words at all
+        return sparse.csr_matrix((counts.shape[0], 0), dtype=np.int64), []
+    terms = vect.get_feature_names_out().tolist()
+    counts = (counts @ mapping).tocsr()
+    counts.sort_indices()
+    return counts, terms
+
+def weight_counts(counts, terms, vect):
+    """Convert documents x terms counts to the features produced by a vectorizer.
+
+    Parameters:
+    - counts (sparse matrix): Documents x terms counts from `term_counts()`.
+    - terms (list): The terms.
+    - vect (vectorizer): A vectorizer returned by `fit_vectorizer()` or `make_vectorizer()`.
+
+    Returns:
+    - sparse matrix: The same matrix as `vect.transform()` would return for the original bags of words.
+    """
+    from scipy import sparse
+    from sklearn.feature_extraction.text import HashingVectorizer, TfidfVectorizer
+    from sklearn.preprocessing import normalize
+    if isinstance(vect, HashingVectorizer):
+        mapping = HashingVectorizer(n_features=vect.n_features, alternate_sign=vect.alternate_sign,
+                                    norm=None).transform(terms)
+        return normalize((counts @ mapping).astype(np.float64), norm=vect.norm)
+    columns = np.array([vect.vocabulary_.get(term, -1) for term in terms], dtype=np.int64)
+    rows = np.flatnonzero(columns >= 0)
+    mapping = sparse.csr_matrix((np.ones(len(rows), dtype=np.int64), (rows, columns[rows])),
+                                shape=(len(terms), len(vect.vocabulary_)))
+    features = (counts @ mapping).tocsr()
+    features.sort_indices()
+    if isinstance(vect, TfidfVectorizer):
+        features = normalize(features.astype(np.float64) @ sparse.diags(vect.idf_), norm=vect.norm)
+    return features
+
+def fit_vectorizer(counts, terms, model):
+    """Fit the vectorizer for a model from term counts, as `make_vectorizer(model).fit_transform()` would.
+
+    Parameters:
+    - counts (sparse matrix): Documents x terms counts from `term_counts()`.
+    - terms (list): The terms.
+    - model (str): The name of the model.
+
+    Returns:
+    - vect (vectorizer): The fitted vectorizer, which can also be used on bags of words.
+    - features (sparse matrix): The features of the documents.
+    """
+    from sklearn.feature_extraction.text import CountVectorizer, TfidfTransformer, TfidfVectorizer
+    if MODELS[model] == 'hashing':
+        vect = make_vectorizer(model)
+        return vect, weight_counts(counts, terms, vect)
+    keep = np.flatnonzero(counts.getnnz(axis=0))
+    vocabulary = {terms[i]: j for j, i in enumerate(keep)}
+    if MODELS[model] == 'tfidf':
+        vect = TfidfVectorizer(vocabulary=vocabulary)
+        vect.idf_ = TfidfTransformer().fit(counts[:, keep]).idf_
+    else:
+        vect = CountVectorizer(vocabulary=vocabulary)
+    vect.vocabulary_ = vocabulary
+    vect.fixed_vocabulary_ = True
+    return vect, weight_counts(counts, terms, vect)
+
+def vectorize_texts(texts, vect):
+    """Apply a fitted vectorizer to bags of words, tokenizing each distinct token only once."""
+    return weight_counts(*term_counts(texts), vect)
+
+def fit_and_score(model, counts_train, counts_test, Y_train, Y_test, metrics=METRICS):
+    """Fit a model on the training documents of a fold and score its predictions on the test documents.
+
+    Parameters:
+    - model (str): The name of the model (see `make_model()`).
+    - counts_train, counts_test (sparse matrix): Word counts of the training and test documents (hashed
+      features for the `hashing` models).
+    - Y_train, Y_test (array): Labels of the training and test documents.
+    - metrics (list): The metrics to compute.
+
+    Returns:
+    - dict: The score for each metric, the time taken to fit and to score the model, and the time taken to
+      predict the labels of the test documents.
+    """
+    from sklearn.feature_extraction.text import TfidfTransformer
+    from sklearn.metrics import accuracy_score, f1_score, precision_score, recall_score, roc_auc_score
+    start = time.perf_counter()
+    if MODELS[model] == 'tfidf':
+        tfidf = TfidfTransformer()
+        X_train = tfidf.fit_transform(counts_train)
+        X_test = tfidf.transform(counts_test)
+    else:
+        X_train, X_test = counts_train, counts_test
+    clf = make_model(model)
+    clf.fit(X_train, Y_train)
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    predictions = clf.predict(X_test)
+    predict_time = time.perf_counter() - start
+    scores = {}
+    for metric in metrics:
+        if metric == 'accuracy':
+            scores[metric] = accuracy_score(Y_test, predictions)
+        elif metric == 'roc_auc':
+            scores[metric] = roc_auc_score(Y_test, clf.decision_function(X_test))
+        elif metric == 'recall':
+            scores[metric] = recall_score(Y_test, predictions)
+        elif metric == 'precision':
+            scores[metric] = precision_score(Y_test, predictions)
+        elif metric == 'f1':
+            scores[metric] = f1_score(Y_test, predictions)
+        else:
+            raise ValueError('Unknown metric: ' + metric)
+    scores['fit_time'] = fit_time
+    scores['score_time'] = time.perf_counter() - start
+    scores['predict_time'] = predict_time
+    return scores
+
+def cross_validate_models(X, Y, models=('logreg', 'svm'), cv=10, metrics=METRICS, n_jobs=None, cache_dir=None):
+    """Evaluate classifiers with k-fold cross-validation, scoring every metric from a single fit per fold.
+
+    Gives the same scores as calling `cross_val_score` on the pipelines from `make_pipeline()` once for each
+    metric, but the words are counted once for all the documents (see `term_counts()`), each fold's counts
+    are shared by all the models, and each model is fit once per fold. The vocabulary of each fold is
+    learned from its training documents only, as it is by the pipelines.
+
+    Parameters:
+    - X (series): The bag of words of each document.
+    - Y (series): The label of each document.
+    - models (list): The models to evaluate (see `make_model()`).
+    - cv (int): The number of folds.
+    - metrics (list): The metrics to compute (see `METRICS`).
+    - n_jobs (int): The number of folds to fit at the same time. -1 uses all CPUs.
+    - cache_dir (str): If given, save the word counts in this directory and reuse them the next time the
+      same data is cross-validated.
+
+    Returns:
+    - dict: For each model, a dict with an array of the fold scores for each metric (named
+      `test_accuracy`, etc., as in `cross_validate`) and the `fit_time`, `score_time` and `predict_time` of
+      each fold.
+    """
+    from joblib import Memory, Parallel, delayed
+    from sklearn.model_selection import StratifiedKFold
+    X = np.asarray(X)
+    Y = np.asarray(Y)
+    folds = list(StratifiedKFold(n_splits=cv).split(X, Y))
+    count = term_counts
+    if cache_dir is not None:
+        count = Memory(cache_dir, verbose=0).cache(term_counts)
+    counts, terms = count(X)
+    fold_counts = []
+    for train, test in folds:
+        # only the terms in the fold's training documents
+        keep = np.flatnonzero(counts[train].getnnz(axis=0))
+        fold_counts.append((counts[train][:, keep], counts[test][:, keep]))
+    hashed = None
+    if any(MODELS[model] == 'hashing' for model in models):
+        hashed = weight_counts(counts, terms, make_vectorizer('sgd'))
+    jobs = []
+    for model in models:
+        for i, (train, test) in enumerate(folds):
+            if MODELS[model] == 'hashing':
+                features = (hashed[train], hashed[test])
+            else:
+                features = fold_counts[i]
+            jobs.append(delayed(fit_and_score)(model, features[0], features[1], Y[train], Y[test], metrics))
+    results = Parallel(n_jobs=n_jobs)(jobs)
+    scores = {}
+    for m, model in enumerate(models):
+        fold_scores = results[m * len(folds):(m + 1) * len(folds)]
+        scores[model] = {}
+        for metric in metrics:
+            scores[model]['test_' + metric] = np.array([s[metric] for s in fold_scores])
+        scores[model]['fit_time'] = np.array([s['fit_time'] for s in fold_scores])
+        scores[model]['score_time'] = np.array([s['score_time'] for s in fold_scores])
+        scores[model]['predict_time'] = np.array([s['predict_time'] for s in fold_scores])
+    return scores
+
+def print_scores(scores):
+    """Print the mean and spread (2 standard deviations) of each metric for each model."""
+    for model, model_scores in scores.items():
+        get_reporter().text(model)
+        for key, values in model_scores.items():
+            if key.startswith('test_'):
+                name = METRIC_NAMES.get(key[5:], key[5:])
+                get_reporter().text("%s: %0.2f (+/- %0.2f)" % (name, values.mean(), values.std() * 2))
+
+def train_classifier(X, Y, model='logreg'):
+    """Train a classifier on all of the training data, as in section 2 of the notebook.
+
+    Returns:
+    - vect (vectorizer): The vectorizer fitted to the training data.
+    - clf (classifier): The trained classifier.
+    """
+    vect, features = fit_vectorizer(*term_counts(X), model)
+    clf = make_model(model)
+    clf.fit(features, Y)
+    return vect, clf
+
+def train_in_batches(batches, model='sgd', epochs=1):
+    """Train a classifier on batches of training data, for training data too large to load at once.
+
+    Only models whose vectorizer needs no vocabulary and whose classifier can be updated a batch at a
+    time (`sgd`) can be trained this way.
+
+    Parameters:
+    - batches (function): A function that returns an iterator over the batches, each a tuple of the bags of
+      words and the labels of the documents in the batch. It is called once for each epoch.
+    - model (str): The name of the model.
+    - epochs (int): The number of passes over the training data.
+
+    Returns:
+    - vect (vectorizer): The vectorizer.
+    - clf (classifier): The trained classifier.
+    """
+    if MODELS.get(model) != 'hashing' or not hasattr(make_model(model), 'partial_fit'):
+        raise ValueError('Only the `sgd` model can be trained in batches.')
+    vect = make_vectorizer(model)
+    clf = make_model(model)
+    for epoch in range(epochs):
+        for X_batch, Y_batch in batches():
+            clf.partial_fit(vectorize_texts(X_batch, vect), Y_batch, classes=[0, 1])
+    return vect, clf
+
+def training_filenames(classification_selection, classification_dir='.'):
+    """Get the set of filenames in the positive and negative training data for a classification.
+
+    Returns:
+    - positive (set): The filenames of the positive training documents.
+    - negative (set): The filenames of the negative training documents.
+    """
+    filenames = []
+    for file in TRAINING_FILES[classification_selection]:
+        with open(classification_dir + '/' + os.path.splitext(file)[0] + '.txt') as f:
+            filenames.append(set(row.strip() for row in f if row.strip()))
+    return filenames[0], filenames[1]
+
+def split_collection(collection, positive, negative, unseen_filenames, classified_p_filenames, classified_n_filenames):
+    """Write the filenames of the documents in a collection that are and are not in the training data.
+
+    Parameters:
+    - collection (str): Path to the collection's doc-terms file.
+    - positive, negative (set): The filenames of the positive and negative training documents.
+    - unseen_filenames (str): Path to the file listing the documents not in the training data.
+    - classified_p_filenames, classified_n_filenames (str): Paths to the files listing the documents in the
+      positive and negative training data.
+    """
+    with open(unseen_filenames, 'w') as f_unseen, open(classified_p_filenames, 'w') as f_cp, \
+            open(classified_n_filenames, 'w') as f_cn, open(collection) as f_collection:
+        for row in f_collection:
+            filename = row.strip().split(' ', 1)[0]
+            if filename in positive:
+                f_cp.write(filename + '\n')
+            elif filename in negative:
+                f_cn.write(filename + '\n')
+            else:
+                f_unseen.write(filename + '\n')
+
+def read_doc_terms(collection, batch_size=10000, skip=()):
+    """Read a collection's doc-terms file in batches of rows.
+
+    Each row of a doc-terms file is the document's filename and label followed by its bag of words.
+    Documents without any words are left out, as are the documents in `skip`.
+
+    Parameters:
+    - collection (str): Path to the collection's doc-terms file.
+    - batch_size (int): The number of documents in each batch.
+    - skip (set): Filenames of documents to leave out (the training documents, for instance).
+
+    Yields:
+    - filenames (list): The filenames of the documents in the batch.
+    - texts (list): The bags of words of the documents in the batch.
+    """
+    filenames = []
+    texts = []
+    with open(collection) as f:
+        for row in f:
+            row = row.strip().split(' ', 2)
+            if len(row) < 3 or row[0] in skip:
+                continue
+            filenames.append(row[0])
+            texts.append(row[2])
+            if len(filenames) == batch_size:
+                yield filenames, texts
+                filenames = []
+                texts = []
+    if filenames:
+        yield filenames, texts
+
+def classify_collection(collection, vect, clf, output_file, skip=(), batch_size=10000):
+    """Classify the documents in a collection's doc-terms file in batches.
+
+    Each batch of documents is vectorized with the fitted vectorizer (see `vectorize_texts()`) and classified, and the results are
+    appended to `output_file`, a csv file with the columns `filename`, `label` and `score`. The score is the
+    probability that the document is positive for classifiers that estimate probabilities (logistic
+    regression), and the classifier's decision function otherwise (the distance from the SVM's
+    hyperplane, positive for positive documents).
+
+    Parameters:
+    - collection (str): Path to the collection's doc-terms file.
+    - vect (vectorizer): The vectorizer fitted to the training data.
+    - clf (classifier): The trained classifier.
+    - output_file (str): Path to the csv file to write.
+    - skip (set or tuple of sets): Filenames of documents not to classify, such as the sets returned by
+      `training_filenames()`.
+    - batch_size (int): The number of documents to classify at a time.
+
+    Returns:
+    - dict: The number of documents given each label.
+    """
+    if isinstance(skip, tuple):
+        skip = set().union(*skip)
+    counts = {}
+    with open(output_file, 'w', newline='') as f:
+        csv_writer = csv.writer(f)
+        csv_writer.writerow(['filename', 'label', 'score'])
+        for filenames, texts in read_doc_terms(collection, batch_size, skip):
+            X_batch = vectorize_texts(texts, vect)
+            labels = clf.predict(X_batch)
+            if hasattr(clf, 'predict_proba'):
+                scores = clf.predict_proba(X_batch)[:, list(clf.classes_).index(1)]
+            else:
+                scores = clf.decision_function(X_batch)
+            csv_writer.writerows(zip(filenames, labels.tolist(), scores.tolist()))
+            for label in labels.tolist():
+                counts[label] = counts.get(label, 0) + 1
+    return counts
+
+def split_results(results_file, positive_file, negative_file):
+    """Write the filenames of the documents classified as positive and negative by `classify_collection()`.
+
+    The files have the same form as those written by `save_results()` in the notebook, one filename per line.
+    """
+    with open(results_file, newline='') as f, open(positive_file, 'w') as pf, open(negative_file, 'w') as nf:
+        for row in csv.DictReader(f):
+            if row['label'] == '1':
+                pf.write(row['filename'] + '\n')
+            else:
+                nf.write(row['filename'] + '\n')
+
+def classifier_path(classification_selection, model='logreg', models_dir='models'):
+    """Return the path to the saved classifier and vectorizer for a classification."""
+    return models_dir + '/' + classification_selection + '-' + model + '.joblib'
+
+def save_classifier(vect, clf, path):
+    """Save a trained classifier and its vectorizer to `path`.
+
+    The file is written uncompressed so that its arrays can be memory-mapped when it is loaded.
+    """
+    import joblib
+    joblib.dump({'vect': vect, 'clf': clf}, path + '.tmp')
+    os.replace(path + '.tmp', path)
+
+def load_classifier(path):
+    """Load a classifier and its vectorizer saved by `save_classifier()`.
+
+    The classifier's arrays are memory-mapped read-only, and classifiers that have already been loaded
+    are reused, so processes that classify collections at the same time share one copy.
+
+    Returns:
+    - vect (vectorizer): The fitted vectorizer.
+    - clf (classifier): The trained classifier.
+    """
+    import joblib
+    mtime = os.path.getmtime(path)
+    if path not in _classifiers or _classifiers[path][0] != mtime:
+        saved = joblib.load(path, mmap_mode='r')
+        _classifiers[path] = (mtime, saved['vect'], saved['clf'])
+    return _classifiers[path][1], _classifiers[path][2]
+
+def fit_classifiers(classification_selections, model='logreg', classification_dir='.', models_dir='models',
+                    force=False):
+    """Train a classifier for each classification and save it with its vectorizer.
+
+    A saved classifier is reused if it is newer than its training data, unless `force` is True.
+
+    Parameters:
+    - classification_selections (list): The classifications to train (`humanities`, `science`, etc.).
+    - model (str): The name of the model (see `make_model()`).
+    - classification_dir (str): Path to the classification module.
+    - models_dir (str): Path to the folder to save the classifiers in.
+    - force (bool): Train the classifiers even if they have been saved.
+
+    Returns:
+    - dict: The path to the saved classifier for each classification.
+    """
+    os.makedirs(models_dir, exist_ok=True)
+    paths = {}
+    for selection in classification_selections:
+        path = classifier_path(selection, model, models_dir)
+        training = [classification_dir + '/' + file for file in TRAINING_FILES[selection]]
+        if force or not os.path.exists(path) or \
+                os.path.getmtime(path) < max(os.path.getmtime(file) for file in training):
+            X, Y = load_training_data(selection, classification_dir)
+            vect, clf = train_classifier(X, Y, model)
+            save_classifier(vect, clf, path)
+            get_reporter().text('Trained ' + model + ' classifier for ' + selection + '.')
+        paths[selection] = path
+    return paths
+
+def classify_with_saved(collection_file, classifier_file, output_file, skip=(), batch_size=10000):
+    """Classify a collection with a classifier saved by `save_classifier()` (see `classify_collection()`)."""
+    vect, clf = load_classifier(classifier_file)
+    return classify_collection(collection_file, vect, clf, output_file, skip, batch_size)
+
+def classify_all(collections, classification_selections, doc_terms_dir, model='logreg', classification_dir='.',
+                 models_dir='models', results_dir='results', workers=1, batch_size=10000, force=False):
+    """Apply several classifiers to several collections.
+
+    Each classifier is trained once (or loaded, if it has been saved), and each collection is then classified
+    with each classifier. If `workers` is more than 1, the (classifier, collection) pairs are run in separate
+    processes. The classifiers are loaded before the processes start, so the processes share them rather than
+    each loading their own copy. The results for each pair are saved to `{results_dir}/{collection}{classification}-results.csv`
+    (see `classify_collection()`), leaving out the documents in that classification's training data.
+
+    Parameters:
+    - collections (list): The collections to classify (`c14`, `c18`, etc.).
+    - classification_selections (list): The classifications to apply (`humanities`, `science`, etc.).
+    - doc_terms_dir (str): Path to the folder containing the collections' doc-terms files.
+    - model (str): The name of the model (see `make_model()`).
+    - classification_dir (str): Path to the classification module.
+    - models_dir (str): Path to the folder to save the classifiers in.
+    - results_dir (str): Path to the folder to save the results in.
+    - workers (int): The number of collections to classify at the same time.
+    - batch_size (int): The number of documents to classify at a time.
+    - force (bool): Train the classifiers even if they have been saved.
+
+    Returns:
+    - dict: The number of documents given each label, for each (classification, collection) pair. Pairs that
+      could not be classified are reported and left out.
+    """
+    paths = fit_classifiers(classification_selections, model, classification_dir, models_dir, force)
+    os.makedirs(results_dir, exist_ok=True)
+    jobs = {}
+    for selection in classification_selections:
+        load_classifier(paths[selection])
+        skip = set().union(*training_filenames(selection, classification_dir))
+        for collection in collections:
+            jobs[(selection, collection)] = (doc_terms_dir + '/' + collection + '-doc-terms.txt', paths[selection],
+                                             results_dir + '/' + collection + selection + '-results.csv', skip,
+                                             batch_size)
+    results = {}
+    if workers > 1:
+        # When this script is loaded with `%run` or run from the command line, its functions belong to
+        # `__main__`, which worker processes started with spawn (the default on macOS and Windows) cannot
+        # import, so the workers are given the function from the script imported by name
+        import classify as module
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(module.classify_with_saved, *args): key for key, args in jobs.items()}
+            for future in as_completed(futures):
+                selection, collection = futures[future]
+                try:
+                    results[(selection, collection)] = future.result()
+                    get_reporter().text('Classified ' + collection + ' with the ' + selection + ' classifier: ' +
+                                        str(results[(selection, collection)].get(1, 0)) + ' positive documents.')
+                except Exception as err:
+                    get_reporter().error('Error classifying ' + collection + ' with the ' + selection + ' classifier: ' + str(err))
+    else:
+        for (selection, collection), args in jobs.items():
+            try:
+                results[(selection, collection)] = classify_with_saved(*args)
+                get_reporter().text('Classified ' + collection + ' with the ' + selection + ' classifier: ' +
+                                    str(results[(selection, collection)].get(1, 0)) + ' positive documents.')
+            except Exception as err:
+                get_reporter().error('Error classifying ' + collection + ' with the ' + selection + ' classifier: ' + str(err))
+    return results
+
+def benchmark_models(classification_selections, models=tuple(MODELS), classification_dir='.', cv=10, n_jobs=None):
+    """Compare the speed and accuracy of the models on the training data.
+
+    Each model is cross-validated on the training data for each classification (see `cross_validate_models()`).
+    Classifications whose training data is missing are skipped.
+
+    Parameters:
+    - classification_selections (list): The classifications to use (`humanities`, `science`, etc.).
+    - models (list): The models to compare. The first is the one the others are compared to.
+    - classification_dir (str): Path to the classification module.
+    - cv (int): The number of folds.
+    - n_jobs (int): The number of folds to fit at the same time.
+
+    Returns:
+    - dataframe: For each classification and model, the mean time taken to fit a fold, the number of documents
+      classified per second, the mean accuracy and F1 score, and the difference between the model's accuracy
+      and that of the first model.
+    """
+    rows = []
+    for selection in classification_selections:
+        try:
+            X, Y = load_training_data(selection, classification_dir)
+        except FileNotFoundError as err:
+            get_reporter().warning('Skipping ' + selection + ': ' + str(err))
+            continue
+        scores = cross_validate_models(X, Y, models, cv, ['accuracy', 'f1'], n_jobs)
+        baseline = scores[models[0]]['test_accuracy'].mean()
+        for model in models:
+            rows.append({
+                'classification': selection,
+                'model': model,
+                'fit_time': scores[model]['fit_time'].mean(),
+                'docs_per_second': len(X) / scores[model]['predict_time'].sum(),
+                'accuracy': scores[model]['test_accuracy'].mean(),
+                'f1': scores[model]['test_f1'].mean(),
+                'accuracy_change': scores[model]['test_accuracy'].mean() - baseline
+            })
+    return pd.DataFrame(rows)
+
+def main(argv=None):
+    """Evaluate, compare or apply the classifiers from the command line."""
+    parser = argparse.ArgumentParser(description='Train, evaluate and apply the binary classifiers.')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    evaluate = subparsers.add_parser('evaluate', help='cross-validate classifiers on the training data')
+    evaluate.add_argument('selection', choices=list(TRAINING_FILES), help='the classification to evaluate')
+    evaluate.add_argument('--models', nargs='+', choices=list(MODELS), default=['logreg', 'svm'],
+                          help='the models to evaluate (default: logreg svm)')
+    evaluate.add_argument('--cv', type=int, default=10, help='the number of folds (default: 10)')
+    evaluate.add_argument('--jobs', type=int, help='the number of folds to fit at the same time')
+    benchmark = subparsers.add_parser('benchmark', help='compare the speed and accuracy of the models')
+    benchmark.add_argument('selections', nargs='+', choices=list(TRAINING_FILES), help='the classifications to use')
+    benchmark.add_argument('--models', nargs='+', choices=list(MODELS), default=list(MODELS),
+                           help='the models to compare (default: all)')
+    benchmark.add_argument('--cv', type=int, default=10, help='the number of folds (default: 10)')
+    benchmark.add_argument('--jobs', type=int, help='the number of folds to fit at the same time')
+    classify = subparsers.add_parser('classify', help='apply classifiers to collections')
+    classify.add_argument('--collections', nargs='+', default=COLLECTIONS, help='the collections to classify')
+    classify.add_argument('--selections', nargs='+', choices=list(TRAINING_FILES), required=True,
+                          help='the classifications to apply')
+    classify.add_argument('--doc-terms-dir', required=True, help='the folder containing the collections\' doc-terms files')
+    classify.add_argument('--model', choices=list(MODELS), default='logreg', help='the model to use (default: logreg)')
+    classify.add_argument('--models-dir', default='models', help='the folder to save the classifiers in (default: models)')
+    classify.add_argument('--results-dir', default='results', help='the folder to save the results in (default: results)')
+    classify.add_argument('--workers', type=int, default=1, help='the number of collections to classify at once (default: 1)')
+    classify.add_argument('--force', action='store_true', help='train the classifiers even if they have been saved')
+    for subparser in [evaluate, benchmark, classify]:
+        add_report_arguments(subparser)
+    args = parser.parse_args(argv)
+    setup_reporting(args)
+    if args.command == 'evaluate':
+        X, Y = load_training_data(args.selection)
+        print_scores(cross_validate_models(X, Y, args.models, args.cv, n_jobs=args.jobs))
+    elif args.command == 'benchmark':
+        get_reporter().text(benchmark_models(args.selections, args.models, cv=args.cv, n_jobs=args.jobs).to_string())
+    else:
+        classify_all(args.collections, args.selections, args.doc_terms_dir, args.model, models_dir=args.models_dir,
+                     results_dir=args.results_dir, workers=args.workers, force=args.force)
+    return 1 if get_reporter().num_errors else 0
+
+# The notebooks load this script with `%run`, which also runs it as `__main__`
+if __name__ == '__main__' and not in_ipython():
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,193 @@
+"""chi_sq_test.py.
+
+Build contingency tables from doc-terms files and lists of filenames and run chi-square tests for independence on them.
+
+`chi_sq_test.ipynb` runs a single test on a contingency table prepared by hand. The functions here build the
+tables directly from the data instead: one table per term (or per set of keywords) counting the documents in
+each category that do and do not contain it, or one table of categories by collection or publication year.
+Per-term tables are built in a single pass through the doc-terms file and tested all at once.
+
+Sample usage:
+category_files = {'hum': data_dir + '/tables/about-hum-files.txt', 'sci': data_dir + '/tables/about-sci-all-filenames.txt'}
+results = chi_sq_terms(collection, category_files, min_docs=5, results_csv='results/chi-sq-terms.csv')
+
+For use with chi_sq_test.ipynb v 2.0.
+
+"""
+
+import re
+from collections import Counter
+import numpy as np
+import pandas as pd
+from scipy.stats import chi2
+
+def read_categories(category_files):
+    '''Reads the lists of filenames for each category. `category_files` is a dict of category names and paths to lists of filenames (one per line). Returns the list of category names and a dict mapping each filename to the number of its category. If a filename is listed in more than one category, the first category wins.'''
+    names = list(category_files)
+    categories = {}
+    for i, name in enumerate(names):
+        with open(category_files[name]) as f:
+            for row in f:
+                row = row.strip()
+                if row != '' and row not in categories:
+                    categories[row] = i
+    return names, categories
+
+def term_presence_tables(collection, category_files, min_docs=1):
+    """Count the documents in each category that do and do not contain each term.
+
+    Streams through the doc-terms file once. Only documents listed in one of the categories are counted.
+
+    Parameters:
+    - collection (str): Path to a doc-terms file.
+    - category_files (dict): Category names and paths to lists of filenames in each category.
+    - min_docs (int): Only build tables for terms that occur in at least this many documents.
+
+    Returns:
+    - terms (list): The term for each table.
+    - tables (array): An array of shape (number of terms, 2, number of categories). For each term, the first
+      row counts documents containing the term and the second row counts documents that do not.
+    - names (list): The category names, in the order of the table columns.
+    """
+    names, categories = read_categories(category_files)
+    presence = [Counter() for name in names]
+    num_docs = np.zeros(len(names), dtype=np.int64)
+    with open(collection) as f:
+        for row in f:
+            row = row.strip()
+            row = row.split(' ')
+            category = categories.get(row[0])
+            if category is None:
+                continue
+            num_docs[category] += 1
+            presence[category].update(set(row[2:]))
+    doc_freqs = Counter()
+    for counts in presence:
+        doc_freqs.update(counts)
+    terms = sorted(term for term, count in doc_freqs.items() if count >= min_docs)
+    present = np.array([[counts[term] for counts in presence] for term in terms], dtype=np.int64).reshape(len(terms), len(names))
+    tables = np.stack([present, num_docs - present], axis=1)
+    return terms, tables, names
+
+def keyword_presence_tables(collection, category_files, keyword_sets):
+    """Count the documents in each category that do and do not contain any of the words in each set of keywords.
+
+    Parameters:
+    - collection (str): Path to a doc-terms file.
+    - category_files (dict): Category names and paths to lists of filenames in each category.
+    - keyword_sets (dict): Names and lists of keywords, e.g. `{'humanities': ['humanities', 'liberal_arts']}`.
+
+    Returns:
+    - tables (array): An array of shape (number of keyword sets, 2, number of categories), in the order of `keyword_sets`.
+    - names (list): The category names, in the order of the table columns.
+    """
+    names, categories = read_categories(category_files)
+    keyword_sets = [set(keywords) for keywords in keyword_sets.values()]
+    present = np.zeros((len(keyword_sets), len(names)), dtype=np.int64)
+    num_docs = np.zeros(len(names), dtype=np.int64)
+    with open(collection) as f:
+        for row in f:
+            row = row.strip()
+            row = row.split(' ')
+            category = categories.get(row[0])
+            if category is None:
+                continue
+            num_docs[category] += 1
+            words = set(row[2:])
+            for i, keywords in enumerate(keyword_sets):
+                if not keywords.isdisjoint(words):
+                    present[i, category] += 1
+    tables = np.stack([present, num_docs - present], axis=1)
+    return tables, names
+
+def year_from_filename(filename):
+    '''Returns the publication year in a WE1S filename, or `unknown` if there is none.'''
+    match = re.search(r'_(\d\d\d\d)-\d\d-\d\d', filename)
+    if match is None:
+        return 'unknown'
+    return match.group(1)
+
+def category_group_table(category_files, groups='year'):
+    """Build a contingency table of categories by collection, year, or some other grouping of the documents.
+
+    Parameters:
+    - category_files (dict): Category names and paths to lists of filenames in each category.
+    - groups: `year` to group documents by the publication year in their filenames, a dict of group names and
+      paths to lists of filenames (for instance, one list per collection), or a function that takes a filename and
+      returns its group.
+
+    Returns:
+    - dataframe: A contingency table with one row per category and one column per group.
+    """
+    names, categories = read_categories(category_files)
+    if groups == 'year':
+        get_group = year_from_filename
+    elif isinstance(groups, dict):
+        group_names, group_of = read_categories(groups)
+        get_group = lambda filename: group_names[group_of[filename]] if filename in group_of else None
+    else:
+        get_group = groups
+    counts = Counter()
+    for filename, category in categories.items():
+        group = get_group(filename)
+        if group is not None:
+            counts[(names[category], group)] += 1
+    table = pd.Series(counts).unstack(fill_value=0)
+    return table.reindex(index=[name for name in names if name in table.index])
+
+def chi2_batch(tables, correction=True):
+    """Perform a chi-square test for independence on many contingency tables at once.
+
+    Gives the same results as calling `scipy.stats.chi2_contingency` on each table, including Yates' correction
+    for tables with 1 degree of freedom. Tables with an expected frequency of zero (for instance, a term that
+    appears in every document) get a statistic and p-value of NaN.
+
+    Parameters:
+    - tables (array): An array of shape (number of tables, rows, columns).
+    - correction (bool): Apply Yates' correction for continuity when there is 1 degree of freedom.
+
+    Returns:
+    - tuple: arrays of the statistic and p-value for each table, and the degrees of freedom.
+    """
+    observed = np.asarray(tables, dtype=np.float64)
+    total = observed.sum(axis=(1, 2), keepdims=True)
+    expected = observed.sum(axis=2, keepdims=True) * observed.sum(axis=1, keepdims=True) / np.where(total == 0, 1, total)
+    dof = (observed.shape[1] - 1) * (observed.shape[2] - 1)
+    if correction and dof == 1:
+        diff = expected - observed
+        observed = observed + np.sign(diff) * np.minimum(0.5, np.abs(diff))
+    valid = (expected > 0).all(axis=(1, 2))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        stats = ((observed - expected) ** 2 / expected).sum(axis=(1, 2))
+    stats[~valid] = np.nan
+    if dof == 0:
+        stats[valid] = 0
+        pvalues = np.where(valid, 1.0, np.nan)
+    else:
+        pvalues = chi2.sf(stats, dof)
+    return stats, pvalues, dof
+
+def chi_sq_terms(collection, category_files, min_docs=5, correction=True, results_csv=None):
+    """Test every term in a doc-terms file for a relationship between containing the term and category.
+
+    Parameters:
+    - collection (str): Path to a doc-terms file.
+    - category_files (dict): Category names and paths to lists of filenames in each category.
+    - min_docs (int): Only test terms that occur in at least this many documents.
+    - correction (bool): Apply Yates' correction for continuity to 2 x 2 tables.
+    - results_csv (str): If given, save the results to this csv file.
+
+    Returns:
+    - dataframe: One row per term with the number of documents in each category containing the term, the
+      chi-square statistic and the p-value.
+    """
+    terms, tables, names = term_presence_tables(collection, category_files, min_docs)
+    stats, pvalues, dof = chi2_batch(tables, correction)
+    results = pd.DataFrame(tables[:, 0, :], columns=[name + ' docs' for name in names])
+    results.insert(0, 'term', terms)
+    results['chi-square statistic'] = stats
+    results['p-value'] = pvalues
+    results['dof'] = dof
+    if results_csv is not None:
+        results.to_csv(results_csv, index=False)
+    return results
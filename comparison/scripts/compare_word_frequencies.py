@@ -2,123 +2,99 @@
 
 Compare two datasets to one another using a Wilcoxon rank sum test.
 
+The comparisons in the registry can also be run from the command line, in the comparison module directory:
+python scripts/compare_word_frequencies.py hum-sci hum-not-hum --data-dir ../data
+
 For use with compare_word_frequencies.ipynb v 2.0.
 
 """
 
-from scipy.stats import mannwhitneyu
-from scipy.stats import ranksums
+from scipy import sparse
+import argparse
+import numpy as np
 import os
 import csv
 import json
-import collections
 from collections import Counter
-from collections import defaultdict
 import pandas as pd
-import statistics
 import random
+import sys
+
+# The stage timer and reporter are shared with the topic-modeling module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'topic-modeling', 'scripts'))
+from report import add_report_arguments, get_reporter, in_ipython, setup_reporting
+from timer import current_span, span, traced
+
+# the comparisons available by default are described in this file. add your own comparisons to it
+# (or to a copy of it) to run them without editing this code.
+REGISTRY_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'comparisons.json')
+
+# where each comparison's files are found (or will be created) unless its entry in the registry
+# sets a different path under `paths`. paths are relative to the comparison module directory.
+DEFAULT_PATHS = {
+    # larger collection you want to select from
+    'collection': 'input/{comparison}/{comparison}-doc-terms.txt',
+    # these are the filenames of the sampled documents from each category that we tested
+    'sample_filenames': 'input/{comparison}/{category}-{sample_size}sample-filenames.txt',
+    # files the code will create
+    'docterms': 'input/{comparison}/{category}-{sample_size}sample-doc-terms-{version}.txt',
+    'relative_csv': 'input/{comparison}/{category}-{sample_size}sample-min{threshold}-df-relative.csv',
+    'raw_csv': 'input/{comparison}/{category}-{sample_size}sample-min{threshold}-df-raw.csv',
+    'vocablist': 'input/{comparison}/{comparison}-{sample_size}sample-min{threshold}-vocablist.txt',
+    'results_csv': 'results/{comparison}-wilcoxon-results.csv'
+}
 
-def set_comparison(comparison, reproduce, data_dir):
-    '''Sets needed variables with appropriate filenames for the comparison the user wants to run.'''
-    if comparison == 'hum-sci':
-        # larger collection you want to select from
-        collection = 'input/hum-sci/hum-sci-doc-terms.txt'
-        if reproduce == True:
-            # these are the filenames of the 500 documents from each category that we tested
-            filenames_c1 = 'input/hum-sci/hum-500sample-filenames.txt'
-            filenames_c2 = 'input/hum-sci/sci-500sample-filenames.txt'
-        if reproduce == False:
-            # all of the files classified in a certain category
-            filenames_c1 = data_dir + '/tables/about-hum-files.txt'
-            filenames_c2 = data_dir + '/tables/about-sci-files.txt'
-        # files the code will create -- can use provided filenames below or your own
-        if reproduce == True:
-            docterms_c1 = 'input/hum-sci/hum-500sample-doc-terms-reproduce.txt'
-            docterms_c2 = 'input/hum-sci/sci-500sample-doc-terms-reproduce.txt'
-        if reproduce == False:
-            docterms_c1 = 'input/hum-sci/hum-500sample-doc-terms-new.txt'
-            docterms_c2 = 'input/hum-sci/sci-500sample-doc-terms-new.txt'
-    elif comparison == 'not-hum-not-sci':
-        # larger collection you want to select from
-        collection = 'input/not-hum-not-sci/not-hum-not-sci-doc-terms.txt'
-        if reproduce == True:
-            # these are the filenames of the 500 documents from each category that we tested
-            filenames_c1 = 'input/not-hum-not-sci/not-hum-1500sample-filenames.txt'
-            filenames_c2 = 'input/not-hum-not-sci/not-sci-1500sample-filenames.txt'
-        if reproduce == False:
-            # all of the files classified in a certain category
-            filenames_c1 = data_dir + '/tables/not-about-hum-hum-keywords-filenames.txt'
-            filenames_c2 = data_dir + '/tables/not-about-sci-sci-keywords-filenames.txt'
-        # files the code below will create -- can use provided filenames below or your own
-        if reproduce == True:
-            docterms_c1 = 'input/not-hum-not-sci/not-hum-1500sample-doc-terms-reproduce.txt'
-            docterms_c2 = 'input/not-hum-not-sci/not-sci-1500sample-doc-terms-reproduce.txt'
-        if reproduce == False:
-            docterms_c1 = 'input/not-hum-not-sci/not-hum-1500sample-doc-terms-new.txt'
-            docterms_c2 = 'input/not-hum-not-sci/not-sci-1500sample-doc-terms-new.txt'
-    elif comparison == 'hum-not-hum':
-        # larger collection you want to select from
-        collection = 'input/hum-not-hum/hum-not-hum-doc-terms.txt'
-        if reproduce == True:
-            # these are the filenames of the 500 documents from each category that we tested
-            filenames_c1 = 'input/hum-not-hum/hum-1500sample-filenames.txt'
-            filenames_c2 = 'input/hum-not-hum/not-hum-1500sample-filenames.txt'
-        if reproduce == False:
-           # all of the files classified in a certain category
-            filenames_c1 = data_dir + '/tables/about-hum-files.txt'
-            filenames_c2 = data_dir + '/tables/not-about-hum-hum-keywords-filenames.txt'
-        # files the code below will create -- can use provided filenames below or your own
-        if reproduce == True:
-            docterms_c1 = 'input/hum-not-hum/hum-1500sample-doc-terms-reproduce.txt'
-            docterms_c2 = 'input/hum-not-hum/not-hum-1500sample-doc-terms-reproduce.txt'
-        if reproduce == False:
-            docterms_c1 = 'input/hum-not-hum/hum-1500sample-doc-terms-new.txt'
-            docterms_c2 = 'input/hum-not-hum/not-hum-1500sample-doc-terms-new.txt'
-    return collection, filenames_c1, filenames_c2, docterms_c1, docterms_c2
-
-def set_df_filenames(comparison, threshold):
+def load_registry(registry_file=REGISTRY_FILE):
+    '''Loads the registry of comparisons from a json file. Each comparison is keyed by name and lists the names of its 2 categories (`categories`), the number of documents sampled from each (`sample_size`), and the lists of all of the files classified in each category (`filenames`, which may refer to `{data_dir}`). It may also override any of the default file paths in DEFAULT_PATHS under `paths`.'''
+    with open(registry_file) as f:
+        registry = json.load(f)
+    return registry
+
+def get_comparison(comparison, registry=None):
+    '''Returns the registry entry for a comparison.'''
+    if registry is None:
+        registry = load_registry()
+    if comparison not in registry:
+        raise KeyError('Unknown comparison ' + comparison + '. Options are ' + ', '.join(registry) + '.')
+    return registry[comparison]
+
+def get_comparison_path(comparison, key, registry=None, category=None, **kwargs):
+    '''Returns the path of one of a comparison's files from the registry, filling in the comparison name, category, sample size and any other values passed as keyword arguments (e.g. `threshold`, `version` or `data_dir`).'''
+    spec = get_comparison(comparison, registry)
+    template = spec.get('paths', {}).get(key, DEFAULT_PATHS[key])
+    return template.format(comparison=comparison, category=category, sample_size=spec['sample_size'], **kwargs)
+
+def set_comparison(comparison, reproduce, data_dir, registry=None):
+    '''Sets needed variables with appropriate filenames for the comparison the user wants to run. Comparisons are described in the registry (comparisons.json by default).'''
+    if registry is None:
+        registry = load_registry()
+    spec = get_comparison(comparison, registry)
+    categories = spec['categories']
+    version = 'reproduce' if reproduce == True else 'new'
+    collection = get_comparison_path(comparison, 'collection', registry)
+    if reproduce == True:
+        # these are the filenames of the documents from each category that we tested
+        filenames = [get_comparison_path(comparison, 'sample_filenames', registry, category) for category in categories]
+    else:
+        # all of the files classified in a certain category
+        filenames = [path.format(data_dir=data_dir) for path in spec['filenames']]
+    # files the code will create
+    docterms = [get_comparison_path(comparison, 'docterms', registry, category, version=version) for category in categories]
+    return collection, filenames[0], filenames[1], docterms[0], docterms[1]
+
+def set_df_filenames(comparison, threshold, registry=None):
     '''Sets names of dataframes that will be saved to disk based on comparison type and minimum threshold.'''
-    if comparison == 'hum-sci':
-        c1_relative_csv = 'input/hum-sci/hum-500sample-min' + str(threshold) + '-df-relative.csv'
-        c2_relative_csv = 'input/hum-sci/sci-500sample-min' + str(threshold) + '-df-relative.csv'
-        c1_raw_csv = 'input/hum-sci/hum-500sample-min' + str(threshold) + '-df-raw.csv'
-        c2_raw_csv = 'input/hum-sci/sci-500sample-min' + str(threshold) + '-df-raw.csv'
-        vocablist = 'input/hum-sci/hum-sci-500sample-min' + str(threshold) + '-vocablist.txt'
-    elif comparison == 'not-hum-not-sci':
-        c1_relative_csv = 'input/not-hum-not-sci/not-hum-1500sample-min' + str(threshold) + '-df-relative.csv'
-        c2_relative_csv = 'input/not-hum-not-sci/not-sci-1500sample-min' + str(threshold) + '-df-relative.csv'
-        c1_raw_csv = 'input/not-hum-not-sci/not-hum-1500sample-min' + str(threshold) + '-df-raw.csv'
-        c2_raw_csv = 'input/not-hum-not-sci/not-sci-1500sample-min' + str(threshold) + '-df-raw.csv'
-        vocablist = 'input/not-hum-not-sci/not-hum-not-sci-1500sample-min' + str(threshold) + '-vocablist.txt'
-    elif comparison == 'hum-not-hum':
-        c1_relative_csv = 'input/hum-not-hum/hum-1500sample-min' + str(threshold) + '-df-relative.csv'
-        c2_relative_csv = 'input/hum-not-hum/not-hum-1500sample-min' + str(threshold) + '-df-relative.csv'
-        c1_raw_csv = 'input/hum-not-hum/hum-1500sample-min' + str(threshold) + '-df-raw.csv'
-        c2_raw_csv = 'input/hum-not-hum/not-hum-1500sample-min' + str(threshold) + '-df-raw.csv'
-        vocablist = 'input/hum-not-hum/hum-not-hum-1500sample-min' + str(threshold) + '-vocablist.txt'
-    return c1_relative_csv, c2_relative_csv, c1_raw_csv, c2_raw_csv, vocablist
-
-def set_df_filenames_existing(comparison):
-    '''Uses `comparison` variable value to assign appropriate filenames for test.'''
-    if comparison == 'hum-sci':
-        c1_relative_csv = 'input/hum-sci/hum-500sample-min5-df-relative.csv'
-        c2_relative_csv = 'input/hum-sci/sci-500sample-min5-df-relative.csv'
-        c1_raw_csv = 'input/hum-sci/hum-500sample-min5-df-raw.csv'
-        c2_raw_csv = 'input/hum-sci/sci-500sample-min5-df-raw.csv'
-        vocablist = 'input/hum-sci/hum-sci-500sample-min5-vocablist.txt'
-    elif comparison == 'not-hum-not-sci':
-        c1_relative_csv = 'input/not-hum-not-sci/not-hum-1500sample-min5-df-relative.csv'
-        c2_relative_csv = 'input/not-hum-not-sci/not-sci-1500sample-min5-df-relative.csv'
-        c1_raw_csv = 'input/not-hum-not-sci/not-hum-1500sample-min5-df-raw.csv'
-        c2_raw_csv = 'input/not-hum-not-sci/not-sci-1500sample-min5-df-raw.csv'
-        vocablist = 'input/not-hum-not-sci/not-hum-not-sci-1500sample-min5-vocablist.txt'
-    elif comparison == 'hum-not-hum':
-        c1_relative_csv = 'input/hum-not-hum/hum-1500sample-min5-df-relative.csv'
-        c2_relative_csv = 'input/hum-not-hum/not-hum-1500sample-min5-df-relative.csv'
-        c1_raw_csv = 'input/hum-not-hum/hum-1500sample-min5-df-raw.csv'
-        c2_raw_csv = 'input/hum-not-hum/not-hum-1500sample-min5-df-raw.csv'
-        vocablist = 'input/hum-not-hum/hum-not-hum-1500sample-min5-vocablist.txt'
-    return c1_relative_csv, c2_relative_csv, c1_raw_csv, c2_raw_csv, vocablist
+    if registry is None:
+        registry = load_registry()
+    categories = get_comparison(comparison, registry)['categories']
+    relative_csvs = [get_comparison_path(comparison, 'relative_csv', registry, category, threshold=threshold) for category in categories]
+    raw_csvs = [get_comparison_path(comparison, 'raw_csv', registry, category, threshold=threshold) for category in categories]
+    vocablist = get_comparison_path(comparison, 'vocablist', registry, threshold=threshold)
+    return relative_csvs[0], relative_csvs[1], raw_csvs[0], raw_csvs[1], vocablist
+
+def set_df_filenames_existing(comparison, registry=None):
+    '''Uses `comparison` variable value to assign appropriate filenames for test. The dataframes we provide use a minimum threshold of 5.'''
+    return set_df_filenames(comparison, 5, registry)
 
 def get_bags(filenames_c1, filenames_c2, collection, docterms_c1, docterms_c2):
     '''Uses lists of filenames for each category, checks these filenames against those in the provided doc-terms file, and grabs the bags where the filenames match. Produces 2 new doc-terms files including document filenames and bags of words.'''
@@ -183,14 +159,56 @@ def get_random_sample(selection, filenames_c1, filenames_c2, collection, docterm
                 if y == filename:
                     f4.write(row)
     
+@traced()
+def load_doc_terms(collection):
+    '''Reads a doc-terms file once into a sparse document x word matrix of raw counts. Returns a list of filenames (one per row), a list of words (one per column), and the scipy sparse csr matrix of counts. Because each term is stored once with its count, this is far smaller than the doc-terms file or the dataframes produced by findFreq, and it can be sampled from over and over without going back to disk.'''
+    filenames = []
+    vocab = {}
+    indices = []
+    data = []
+    indptr = [0]
+    with open(collection) as f:
+        for row in f:
+            row = row.strip()
+            row = row.split(' ')
+            filenames.append(row[0])
+            counts = Counter(row[2:])
+            for word, count in counts.items():
+                indices.append(vocab.setdefault(word, len(vocab)))
+                data.append(count)
+            indptr.append(len(indices))
+    counts = sparse.csr_matrix((np.array(data, dtype=np.int32), np.array(indices, dtype=np.int32), np.array(indptr)),
+                               shape=(len(filenames), len(vocab)))
+    current_span().add(len(filenames))
+    return filenames, list(vocab), counts
+
+def frames_from_counts(filenames, vocab, counts, sample):
+    '''Builds the same 2 dataframes as findFreq (relative frequencies and raw counts of every word in every doc) for a sample of documents from a count matrix returned by load_doc_terms, without writing or reading a doc-terms file. `sample` is a list of filenames. Documents are taken in the order they appear in the collection, as they would be in a doc-terms file written by get_bags or get_random_sample.'''
+    sample = set(sample)
+    rows = [i for i, filename in enumerate(filenames) if filename in sample]
+    sub = counts[rows]
+    # like findFreq, divide by the running total of words across docs
+    num_words = np.cumsum(np.asarray(sub.sum(axis=1)).ravel()).astype(np.float64)
+    num_words[num_words == 0] = 1
+    relative = sub.multiply(1 / num_words[:, np.newaxis]).tocsr()
+    # only keep words that occur in the sample
+    words = np.unique(sub.indices)
+    index = [vocab[i] for i in words]
+    columns = [filenames[i] for i in rows]
+    df_relative = pd.DataFrame(relative[:, words].T.toarray(), index=index, columns=columns)
+    df_freqs = pd.DataFrame(sub[:, words].T.toarray().astype(np.float64), index=index, columns=columns)
+    return df_relative, df_freqs
+
+@traced()
 def findFreq(bags):
-    '''Code adapted from https://github.com/rbudac/Text-Analysis-Notebooks/blob/master/Mann-Whitney.ipynb for we1s data. Requires txt file in format of doc-terms files as input. Returns 2 dataframes: one of raw counts of every word in every doc, and one of relative frequencies of every word in every doc.'''
+    '''Code adapted from https://github.com/rbudac/Text-Analysis-Notebooks/blob/master/Mann-Whitney.ipynb for we1s data. Requires txt file in format of doc-terms files as input. Returns 2 dataframes: one of raw counts of every word in every doc, and one of relative frequencies of every word in every doc. Both dataframes are filled with zeros as they are built, so they never need to be copied to replace missing values.'''
     # define variables
-    texts = []
-    docs_relative = {}
-    docs_freqs = {}
-    num_words = 0
-    counts = defaultdict(int)    
+    filenames = {}
+    vocab = {}
+    word_rows = []
+    doc_cols = []
+    raw_counts = []
+    relative_counts = []
     num_words = 0
     with open(bags) as f:
         # grab filename and bag of words for every document in txt file.
@@ -200,109 +218,159 @@ def findFreq(bags):
             filename = row[0]
             x = len(row)
             words = row[2:x]
-            # add each word in each doc to a dict of dicts and count raw frequencies
-            for word in words:
-                counts[word] += 1
+            # count raw frequencies of each word in the doc
+            counts = Counter(words)
             num_words += len(words)
-            # create dicts for relative frequencies and for raw frequencies of each word in each doc
-            relativefreqs = {}
-            freqs = {}
-            # add words and frequencies to dictionaries
+            col = filenames.setdefault(filename, len(filenames))
+            # record the position and raw and relative frequencies of each word in each doc
             for word, rawCount in counts.items():
-                relativefreqs[word] = rawCount / float(num_words)
-                freqs[word] = rawCount
-                # reset counts to use for the next doc
-                counts[word] = 0
-            # add relative and raw freqs for each doc to overall dictionary for all docs, filenames are keys
-            docs_relative[filename] = relativefreqs
-            docs_freqs[filename] = freqs
-    # convert dicts to pandas dataframes and return dataframes.
+                word_rows.append(vocab.setdefault(word, len(vocab)))
+                doc_cols.append(col)
+                raw_counts.append(rawCount)
+                relative_counts.append(rawCount / float(num_words))
+    # convert counts to pandas dataframes and return dataframes.
     # the dataframes we are creating here are sparse matrices of EVERY word in EVERY doc in the input file.
     # as a result, they can get huge very quickly.
     # loading anything over ~4000 documents and handling via pandas can cause memory problems bc of the large 
     # vocabulary size. this code is therefore not extensible to large datasets.
     # this is why this notebook encourages users to work with small samples of their data. 
-    # for large datasets, we recommend rewriting our code to take advantage of the parquet file format 
-    # (for more on pandas integration with parquet, see https://pandas.pydata.org/pandas-docs/version/0.21/io.html#io-parquet)
-    # or using numpy arrays. Sorry we didn't do this ourselves.
-    df_relative = pd.DataFrame(docs_relative)
-    df_freqs = pd.DataFrame(docs_freqs)
+    # for large datasets, see load_doc_terms above and resample.py, which keep the counts in a sparse matrix.
+    current_span().add(len(filenames))
+    df_relative = np.zeros((len(vocab), len(filenames)))
+    df_relative[word_rows, doc_cols] = relative_counts
+    df_freqs = np.zeros((len(vocab), len(filenames)))
+    df_freqs[word_rows, doc_cols] = raw_counts
+    df_relative = pd.DataFrame(df_relative, index=list(vocab), columns=list(filenames))
+    df_freqs = pd.DataFrame(df_freqs, index=list(vocab), columns=list(filenames))
     return df_relative, df_freqs
 
+def get_vocab_stats(df_freqs):
+    '''Computes statistics for every word in a dataframe of raw counts returned by findFreq in a single pass over its values, without copying the dataframe. Returns a dataframe with one row per word including the number of times each word occurs across all docs (`total_count`). A `total_count` column already added by edit_freq_dataframes is left out of the sums.'''
+    counts = df_freqs.to_numpy(copy=False)
+    if 'total_count' in df_freqs.columns:
+        counts = counts[:, df_freqs.columns != 'total_count']
+    stats = pd.DataFrame({'total_count': counts.sum(axis=1)}, index=df_freqs.index)
+    return stats
+
 def edit_freq_dataframes(df1_relative, df1_freqs, df2_relative, df2_freqs):
-    '''Manipulates dataframes returned by findFreq function above in basic ways. Also returns average number of times any word occurs in each dataset. Could be added to findFreqs function but separated out bc of memory use issues.'''
-    # fill na values with 0's
-    # freqs = x
-    df1_freqs = df1_freqs.fillna(0)
-    df1_relative = df1_relative.fillna(0)
-    df2_freqs = df2_freqs.fillna(0)
-    df2_relative = df2_relative.fillna(0)
+    '''Manipulates dataframes returned by findFreq function above in basic ways. Adds a `total_count` column to each raw counts dataframe (in place, without copying the dataframe, and replacing the column if the function has already been run on the dataframe). Also returns average number of times any word occurs in each dataset. Could be added to findFreqs function but separated out bc of memory use issues.'''
+    # fill na values with 0's. findFreq never produces na values, so this only copies dataframes made some other way.
+    if df1_freqs.isna().values.any() or df1_relative.isna().values.any():
+        df1_freqs = df1_freqs.fillna(0)
+        df1_relative = df1_relative.fillna(0)
+    if df2_freqs.isna().values.any() or df2_relative.isna().values.any():
+        df2_freqs = df2_freqs.fillna(0)
+        df2_relative = df2_relative.fillna(0)
     # add total_count columns that count of # of times each word occurs across all docs in each dataset
-    df1_freqs['total_count'] = df1_freqs.sum(axis=1)
-    df2_freqs['total_count'] = df2_freqs.sum(axis=1)
-    # sort dataframes in descending order by total_count column
-    df1_freqs = df1_freqs.sort_values(by=['total_count'], ascending = False)
-    df2_freqs = df2_freqs.sort_values(by=['total_count'], ascending = False)
+    stats_c1 = get_vocab_stats(df1_freqs)
+    stats_c2 = get_vocab_stats(df2_freqs)
+    df1_freqs['total_count'] = stats_c1['total_count']
+    df2_freqs['total_count'] = stats_c2['total_count']
     # obtaining average total word counts for each dataset
-    counts_c1 = list(df1_freqs['total_count'])
-    average_c1 = statistics.mean(counts_c1)
-    counts_c2 = list(df2_freqs['total_count'])
-    average_c2 = statistics.mean(counts_c2)
-    print('Average total word count for dataset 1: ' + str(average_c1) + '\n' + 'Average total word count for dataset 2: ' + 
-          str(average_c2))
+    average_c1 = stats_c1['total_count'].mean()
+    average_c2 = stats_c2['total_count'].mean()
+    get_reporter().text('Average total word count for dataset 1: ' + str(average_c1) + '\n' + 'Average total word count for dataset 2: ' + 
+                        str(average_c2))
     return df1_relative, df1_freqs, df2_relative, df2_freqs
 
-def match_dataframes_and_save(threshold, df1_freqs, df1_relative, df2_freqs, df2_relative, c1_csv, c2_csv, c1_restrict_csv, c2_restrict_csv):
-    '''Uses raw and relative frequency dataframes obtained via edit_freq_dataframes function to 2 create new dataframes of relative frequency data including only those words that occur at least x number of times (where x = threshold). Saves these dataframes to csv files so code doesn't have to be re-run, and also returns them as df1 and df2. Does the same for dataframes of raw counts data. Also returns lists of words in each dataset for use in the get_vocablist function below. Again, this function will produce 2 dataframes of relative (not raw) frequency data that are limited to words that occur at least x number of times. We need the relative frequency dataframes for performing the actual Wilcoxon test, so this is why we do this matching.'''
+def cache_filename(csv_file):
+    '''Returns the name of the binary cache file that stands in for a dataframe csv. The cache sits next to the csv and keeps its name, e.g. `hum-500sample-min5-df-relative.csv` is cached as `hum-500sample-min5-df-relative.npz`.'''
+    return os.path.splitext(csv_file)[0] + '.npz'
+
+def save_df_cache(df, csv_file):
+    '''Saves a (mostly empty) word x document dataframe to a binary sparse .npz file named after `csv_file`. Stores the nonzero values in compressed sparse row form alongside the row (word) and column (filename) labels, so the file can be read back without parsing any text.'''
+    matrix = sparse.csr_matrix(df.fillna(0).values)
+    np.savez(cache_filename(csv_file),
+             data=matrix.data,
+             indices=matrix.indices,
+             indptr=matrix.indptr,
+             shape=np.array(matrix.shape),
+             index=np.array(df.index, dtype=str),
+             columns=np.array(df.columns, dtype=str))
+
+def load_df_cache(csv_file):
+    '''Loads a word x document dataframe saved by save_df_cache. Returns a tuple of the sparse matrix, a dict mapping each word to its row number, and the list of column labels. Rows are only turned into dense arrays when they are asked for, so nothing the size of the full dataframe is built. If no binary cache exists for `csv_file` (for instance, if you downloaded our csv files), falls back to reading the csv itself.'''
+    npz_file = cache_filename(csv_file)
+    if os.path.exists(npz_file):
+        with np.load(npz_file) as cache:
+            matrix = sparse.csr_matrix((cache['data'], cache['indices'], cache['indptr']), shape=tuple(cache['shape']))
+            index = list(cache['index'])
+            columns = list(cache['columns'])
+    else:
+        df = pd.read_csv(csv_file, index_col=0)
+        df = df.fillna(0)
+        matrix = sparse.csr_matrix(df.values)
+        index = list(df.index)
+        columns = list(df.columns)
+    rows = {word: i for i, word in enumerate(index)}
+    return matrix, rows, columns
+
+def match_dataframes_and_save(threshold, df1_freqs, df1_relative, df2_freqs, df2_relative, c1_csv, c2_csv, c1_restrict_csv, c2_restrict_csv, save_csv=False):
+    '''Uses raw and relative frequency dataframes obtained via edit_freq_dataframes function to 2 create new dataframes of relative frequency data including only those words that occur at least x number of times (where x = threshold). Saves these dataframes to binary .npz files (named after the csv filenames you provide) so code doesn't have to be re-run, and also returns them as df1 and df2. Set `save_csv` to True to also save them as csv files you can open in a spreadsheet. Does the same for dataframes of raw counts data. Also returns lists of words in each dataset for use in the get_vocablist function below. Again, this function will produce 2 dataframes of relative (not raw) frequency data that are limited to words that occur at least x number of times. We need the relative frequency dataframes for performing the actual Wilcoxon test, so this is why we do this matching.'''
     # if no threshold is set by user, just rename some variables so it all turns out right in the end
     if threshold == False:
+        keep_c1 = np.ones(len(df1_freqs), dtype=bool)
+        keep_c2 = np.ones(len(df2_freqs), dtype=bool)
         df1_restrict = df1_freqs
         df2_restrict = df2_freqs
     # otherwise, only grab documents from df1_freqs and df2_freqs dataframes that meet or exceed threshold
     else:
-        df1_restrict = df1_freqs[df1_freqs.total_count >= threshold]
-        df2_restrict = df2_freqs[df2_freqs.total_count >= threshold]
+        keep_c1 = (df1_freqs['total_count'] >= threshold).to_numpy()
+        keep_c2 = (df2_freqs['total_count'] >= threshold).to_numpy()
+        df1_restrict = df1_freqs[keep_c1]
+        df2_restrict = df2_freqs[keep_c2]
     # create lists of words in each new dataframe to use in matching
     words_c1 = list(df1_restrict.index)
     words_c2 = list(df2_restrict.index)
-    # then create new dataframe consisting of relative frequencies only for words that are included in each list
-    df1 = df1_relative[df1_relative.index.isin(words_c1)]
-    df2 = df2_relative[df2_relative.index.isin(words_c2)]
-    print('Words in dataset 1: ' + str(len(df1)))
-    print('Words in dataset 2: ' + str(len(df2)))
-    # create csv files
-    df1.to_csv(c1_csv)
-    df2.to_csv(c2_csv)
-    df1_restrict.to_csv(c1_restrict_csv)
-    df2_restrict.to_csv(c2_restrict_csv)
+    # then create new dataframe consisting of relative frequencies only for words that are included in each list.
+    # dataframes from findFreq share the same row order, so the same mask can be used for both.
+    if df1_relative.index.equals(df1_freqs.index):
+        df1 = df1_relative[keep_c1]
+    else:
+        df1 = df1_relative[df1_relative.index.isin(df1_restrict.index)]
+    if df2_relative.index.equals(df2_freqs.index):
+        df2 = df2_relative[keep_c2]
+    else:
+        df2 = df2_relative[df2_relative.index.isin(df2_restrict.index)]
+    get_reporter().text('Words in dataset 1: ' + str(len(df1)))
+    get_reporter().text('Words in dataset 2: ' + str(len(df2)))
+    # create binary cache files
+    save_df_cache(df1, c1_csv)
+    save_df_cache(df2, c2_csv)
+    save_df_cache(df1_restrict, c1_restrict_csv)
+    save_df_cache(df2_restrict, c2_restrict_csv)
+    # create csv files for humans if asked
+    if save_csv == True:
+        df1.to_csv(c1_csv)
+        df2.to_csv(c2_csv)
+        df1_restrict.sort_values(by=['total_count'], ascending=False).to_csv(c1_restrict_csv)
+        df2_restrict.sort_values(by=['total_count'], ascending=False).to_csv(c2_restrict_csv)
     return df1, df2, words_c1, words_c2
 
 def get_vocablist(df1, df2, words_c1, words_c2, vocablist):
     '''Creates a list of all of the unique words across both datasets. Saves to disk as a plain-text file where each word is its 
     own row.'''
     # create vocab list
-    words_c1 = list(df1.index)
-    words_c2 = list(df2.index)
-    words_total = words_c1 + words_c2
-    words = set(words_total)
+    words = df1.index.union(df2.index)
     with open(vocablist, 'w') as fout:
         for word in words:
             fout.write(word + '\n')
 
+@traced()
 def wrs_test(c1_csv, c1_restrict_csv, c2_csv, c2_restrict_csv, vocablist, results_csv):
-    '''Requires csv files of 2 datasets for comparison (created in section 2 of compare_word_frequencies notebook), dataframes of raw counts of these datasets (also created in section 2 of the notebook), a list of the unique words across both datasets, and the name of a csv file to save the output to. Performs a Wilcoxon rank sums test on 2 datasets of relative word frequencies. Outputs a csv that lists the raw count of each word in each dataset, the difference between those counts, the percentage change in counts from dataset 1 to dataset 2, and the Wilcoxon statistic and p-value for each comparison. Code adapted from https://github.com/rbudac/Text-Analysis-Notebooks/blob/master/Mann-Whitney.ipynb and modified for we1s data. Also inspired by Andrew Piper's code from chapter 4 of Enumerations. See https://github.com/piperandrew/enumerations/blob/master/04_Fictionality/chap4_Fictionality.R.'''
+    '''Requires the filenames of 2 datasets for comparison (created in section 2 of compare_word_frequencies notebook; the binary .npz cache is used if it exists, otherwise the csv), dataframes of raw counts of these datasets (also created in section 2 of the notebook), a list of the unique words across both datasets, and the name of a csv file to save the output to. Performs a Wilcoxon rank sums test on 2 datasets of relative word frequencies. Outputs a csv that lists the raw count of each word in each dataset, the difference between those counts, the percentage change in counts from dataset 1 to dataset 2, and the Wilcoxon statistic and p-value for each comparison. Code adapted from https://github.com/rbudac/Text-Analysis-Notebooks/blob/master/Mann-Whitney.ipynb and modified for we1s data. Also inspired by Andrew Piper's code from chapter 4 of Enumerations. See https://github.com/piperandrew/enumerations/blob/master/04_Fictionality/chap4_Fictionality.R.'''
+    # scipy.stats is slow to import, so it is only imported when the test is run
+    from scipy.stats import ranksums
     # define needed variables
     missingInCorpus1 = []
     missingInCorpus2 = []
-    # read in csvs
-    df1 = pd.read_csv(c1_csv, index_col=0) 
-    df1 = df1.fillna(0) # replace NaNs with zeroes if not already done.
-    df1_restrict = pd.read_csv(c1_restrict_csv, index_col=0)
-    df1_restrict = df1_restrict.fillna(0)
-    df2 = pd.read_csv(c2_csv, index_col=0) 
-    df2 = df2.fillna(0) # replace NaNs with zeroes if not already done.
-    df2_restrict = pd.read_csv(c2_restrict_csv, index_col=0)
-    df2_restrict = df2_restrict.fillna(0)
+    # load the cached dataframes. rows are only made dense when the word is tested.
+    df1, df1_rows, df1_columns = load_df_cache(c1_csv)
+    df1_restrict, df1_restrict_rows, df1_restrict_columns = load_df_cache(c1_restrict_csv)
+    df2, df2_rows, df2_columns = load_df_cache(c2_csv)
+    df2_restrict, df2_restrict_rows, df2_restrict_columns = load_df_cache(c2_restrict_csv)
+    c1_total = df1_restrict_columns.index('total_count')
+    c2_total = df2_restrict_columns.index('total_count')
     #Make "dummy" rows of all zeroes for any words that only appear in one corpus and not the other
     for i in range(0, df1.shape[1]):
         missingInCorpus1.append(0) 
@@ -319,16 +387,16 @@ def wrs_test(c1_csv, c1_restrict_csv, c2_csv, c2_restrict_csv, vocablist, result
                 # check if the word is in df1. if it is, grab the relative freq.
                 # grab total count for word in corresponding df1_restrict dataframe.
                 # if not, set counts to 0.
-                if (word in df1.index):
-                    countsInCorpus1 = df1.loc[word].values
-                    c1_count = df1_restrict.loc[word, 'total_count']
+                if (word in df1_rows):
+                    countsInCorpus1 = df1[df1_rows[word]].toarray()[0]
+                    c1_count = df1_restrict[df1_restrict_rows[word], c1_total]
                 else:
                     countsInCorpus1 = missingInCorpus1
                     c1_count = 0
                 # repeat, checking df2 and df2_restrict
-                if (word in df2.index):
-                    countsInCorpus2 = df2.loc[word].values
-                    c2_count = df2_restrict.loc[word, 'total_count']
+                if (word in df2_rows):
+                    countsInCorpus2 = df2[df2_rows[word]].toarray()[0]
+                    c2_count = df2_restrict[df2_restrict_rows[word], c2_total]
                 else:
                     countsInCorpus2 = missingInCorpus2
                     c2_count = 0
@@ -347,4 +415,82 @@ def wrs_test(c1_csv, c1_restrict_csv, c2_csv, c2_restrict_csv, vocablist, result
                     wrsStat = -1
                     wrsP = -1
                 writer.writerow([word, c1_count, c2_count, diff, change, wrsStat, wrsP])
+                current_span().add()
+
+def read_filenames(filenames_file):
+    '''Reads a list of filenames (one per line) into a python list.'''
+    with open(filenames_file) as f:
+        return [row.strip() for row in f if row.strip() != '']
+
+def run_comparisons(comparisons, data_dir, reproduce=True, threshold=5, selection=None, registry=None):
+    """Run the whole comparison (sampling, dataframes, vocab list and Wilcoxon rank sum test) for several comparisons in one batch.
+
+    Each collection doc-terms file is read once into a count matrix, and that matrix is shared by every comparison
+    that uses the collection, so no intermediate doc-terms files are written. Files are named as in the registry.
+
+    Parameters:
+    - comparisons (list): Names of comparisons in the registry. Use `list(load_registry())` to run all of them.
+    - data_dir (str): Path to the repo data directory.
+    - reproduce (bool): Use the samples we tested. Otherwise draw a new random sample from each category.
+    - threshold (int): Only include words that occur at least this many times in a category.
+    - selection (int): The number of documents to sample from each category when `reproduce` is False.
+      Defaults to the sample size in the registry.
+    - registry (dict): The comparison registry. Defaults to the contents of comparisons.json.
+
+    Returns:
+    - results (dict): The path of the results csv for each comparison.
+    """
+    if registry is None:
+        registry = load_registry()
+    loaded = {}
+    results = {}
+    for comparison in comparisons:
+        get_reporter().text('Running ' + comparison + '...')
+        with span('comparison', comparison=comparison):
+            spec = get_comparison(comparison, registry)
+            collection, filenames_c1, filenames_c2, docterms_c1, docterms_c2 = set_comparison(comparison, reproduce, data_dir, registry)
+            # load each collection only once
+            if collection not in loaded:
+                loaded[collection] = load_doc_terms(collection)
+            filenames, vocab, counts = loaded[collection]
+            sample_c1 = read_filenames(filenames_c1)
+            sample_c2 = read_filenames(filenames_c2)
+            if reproduce == False:
+                size = selection if selection is not None else spec['sample_size']
+                sample_c1 = random.sample(sample_c1, size)
+                sample_c2 = random.sample(sample_c2, size)
+            df1_relative, df1_freqs = frames_from_counts(filenames, vocab, counts, sample_c1)
+            df2_relative, df2_freqs = frames_from_counts(filenames, vocab, counts, sample_c2)
+            df1_relative, df1_freqs, df2_relative, df2_freqs = edit_freq_dataframes(df1_relative, df1_freqs, df2_relative, df2_freqs)
+            c1_relative_csv, c2_relative_csv, c1_raw_csv, c2_raw_csv, vocablist = set_df_filenames(comparison, threshold, registry)
+            df1, df2, words_c1, words_c2 = match_dataframes_and_save(threshold, df1_freqs, df1_relative, df2_freqs, df2_relative,
+                                                                     c1_relative_csv, c2_relative_csv, c1_raw_csv, c2_raw_csv)
+            get_vocablist(df1, df2, words_c1, words_c2, vocablist)
+            results_csv = get_comparison_path(comparison, 'results_csv', registry)
+            wrs_test(c1_relative_csv, c1_raw_csv, c2_relative_csv, c2_raw_csv, vocablist, results_csv)
+            results[comparison] = results_csv
+    return results
+
+def main(argv=None):
+    """Run comparisons from the registry from the command line."""
+    parser = argparse.ArgumentParser(description='Compare word frequencies in two categories of documents.')
+    parser.add_argument('comparisons', nargs='*', help='the comparisons to run (default: all of them)')
+    parser.add_argument('--data-dir', required=True, help='the repo data directory')
+    parser.add_argument('--registry', default=REGISTRY_FILE, help='the registry of comparisons (default: comparisons.json)')
+    parser.add_argument('--new-sample', action='store_true', help='draw new random samples instead of using the ones we tested')
+    parser.add_argument('--threshold', type=int, default=5,
+                        help='only include words that occur at least this many times in a category (default: 5)')
+    parser.add_argument('--selection', type=int, help='the number of documents to sample from each category')
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+    setup_reporting(args)
+    registry = load_registry(args.registry)
+    results = run_comparisons(args.comparisons or list(registry), args.data_dir, not args.new_sample, args.threshold,
+                              args.selection, registry)
+    for comparison, results_csv in results.items():
+        get_reporter().info('Results of ' + comparison + ' saved to ' + results_csv)
+    return 0
 
+# The notebooks load this script with `%run`, which also runs it as `__main__`
+if __name__ == '__main__' and not in_ipython():
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,169 @@
+"""resample.py.
+
+Repeat the Wilcoxon rank sum comparison over many random samples or label permutations.
+
+`compare_word_frequencies.py` compares a single random sample of documents from each category. This script
+draws many samples (or shuffles the category labels many times) from one sparse count matrix built by
+`load_doc_terms()`, runs the rank sum test for every word in each draw, and summarizes how stable the
+results are across draws. Draws are spread over a pool of processes. Each draw gets its own seed derived
+from the `seed` you provide, so results are reproducible no matter how many processes you use.
+
+Sample usage:
+filenames, vocab, counts = load_doc_terms(collection)
+results = resample_test(filenames, vocab, counts, filenames_c1, filenames_c2, selection=500, num_draws=100)
+
+For use with compare_word_frequencies.ipynb v 2.0.
+
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+import os
+import sys
+import numpy as np
+import pandas as pd
+from scipy.stats import norm, rankdata
+
+# This folder, so the script can be loaded with `%run` from the module directory and the worker
+# processes of `resample_test()` can import it by name
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from compare_word_frequencies import read_filenames
+
+# Shared, read-only data for the worker processes. Set once per process by _init_worker
+# so the count matrix is not sent to the workers again for every draw.
+_shared = {}
+
+def get_rows(filenames, category_filenames):
+    '''Returns the row numbers in the count matrix of the documents in `category_filenames`.'''
+    category = set(category_filenames)
+    return np.array([i for i, filename in enumerate(filenames) if filename in category], dtype=np.int64)
+
+def relative_frequencies(counts):
+    '''Divides each row of a sparse document x word count matrix by the number of words in that document.'''
+    lengths = np.asarray(counts.sum(axis=1)).ravel().astype(np.float64)
+    lengths[lengths == 0] = 1
+    return counts.multiply(1 / lengths[:, np.newaxis]).tocsc()
+
+def ranksums_matrix(x, y, chunk_size=2000):
+    '''Performs a Wilcoxon rank sum test for every column of 2 matrices at once. `x` and `y` are sparse document x word matrices with the same columns. Returns arrays of the statistic and p-value for each column. Gives the same results as calling scipy.stats.ranksums once per column.'''
+    n1 = x.shape[0]
+    n2 = y.shape[0]
+    n = n1 + n2
+    expected = n1 * (n + 1) / 2.0
+    sd = np.sqrt(n1 * n2 * (n + 1) / 12.0)
+    stats = np.empty(x.shape[1])
+    # rank the columns a chunk at a time so the dense matrix stays small
+    for start in range(0, x.shape[1], chunk_size):
+        end = min(start + chunk_size, x.shape[1])
+        combined = np.vstack([x[:, start:end].toarray(), y[:, start:end].toarray()])
+        ranks = rankdata(combined, axis=0)
+        stats[start:end] = (ranks[:n1].sum(axis=0) - expected) / sd
+    pvalues = 2 * norm.sf(np.abs(stats))
+    return stats, pvalues
+
+def fdr_adjust(pvalues):
+    '''Adjusts p-values for multiple comparisons using the Benjamini-Hochberg false discovery rate procedure.'''
+    pvalues = np.asarray(pvalues, dtype=np.float64)
+    n = len(pvalues)
+    order = np.argsort(pvalues)
+    adjusted = pvalues[order] * n / np.arange(1, n + 1)
+    adjusted = np.minimum.accumulate(adjusted[::-1])[::-1]
+    result = np.empty(n)
+    result[order] = np.minimum(adjusted, 1)
+    return result
+
+def _init_worker(relative, rows_c1, rows_c2, selection, mode):
+    '''Stores the shared data in each worker process.'''
+    _shared['relative'] = relative
+    _shared['rows_c1'] = rows_c1
+    _shared['rows_c2'] = rows_c2
+    _shared['selection'] = selection
+    _shared['mode'] = mode
+
+def _draw(seed):
+    '''Runs the rank sum test on one random sample or one permutation of the category labels.'''
+    rng = np.random.default_rng(seed)
+    relative = _shared['relative']
+    rows_c1 = _shared['rows_c1']
+    rows_c2 = _shared['rows_c2']
+    if _shared['mode'] == 'sample':
+        sample_c1 = rng.choice(rows_c1, _shared['selection'], replace=False)
+        sample_c2 = rng.choice(rows_c2, _shared['selection'], replace=False)
+    else:
+        # shuffle which documents belong to which category, keeping the category sizes
+        rows = rng.permutation(np.concatenate([rows_c1, rows_c2]))
+        sample_c1 = rows[:len(rows_c1)]
+        sample_c2 = rows[len(rows_c1):]
+    stats, pvalues = ranksums_matrix(relative[sample_c1].tocsc(), relative[sample_c2].tocsc())
+    return stats, pvalues
+
+def resample_test(filenames, vocab, counts, filenames_c1, filenames_c2, selection=None, mode='sample',
+                  num_draws=100, threshold=5, seed=10, workers=None, confidence=0.95, results_csv=None):
+    """Repeat the Wilcoxon rank sum test over many draws and summarize the results for each word.
+
+    Parameters:
+    - filenames, vocab, counts: The output of `load_doc_terms()` for the collection containing both categories.
+    - filenames_c1 (str): Path to the list of filenames in category 1.
+    - filenames_c2 (str): Path to the list of filenames in category 2.
+    - selection (int): The number of documents to sample from each category in each draw. Required in `sample` mode.
+      In `permutation` mode, if None, all documents in both categories are used.
+    - mode (str): `sample` draws a new random sample from each category in each draw. `permutation` keeps one sample
+      and shuffles the category labels in each draw to build a null distribution for each word.
+    - num_draws (int): The number of samples or permutations.
+    - threshold (int): Only test words that occur at least this many times in at least one category.
+    - seed (int): The seed used to generate a separate, reproducible seed for each draw.
+    - workers (int): The number of processes to use. If None, uses one per CPU.
+    - confidence (float): The width of the confidence interval for the statistic in `sample` mode.
+    - results_csv (str): If given, save the results to this csv file.
+
+    Returns:
+    - dataframe: One row per word with total counts and, in `sample` mode, the average statistic, its confidence
+      interval, the median p-value and the percentage of draws with p < 0.05, or in `permutation` mode, the
+      observed statistic, the permutation p-value and the FDR-adjusted p-value.
+    """
+    if mode not in ('sample', 'permutation'):
+        raise ValueError('The mode setting must be `sample` or `permutation`.')
+    if mode == 'sample' and selection is None:
+        raise ValueError('Set `selection` to the number of documents to sample from each category in `sample` mode.')
+    rows_c1 = get_rows(filenames, read_filenames(filenames_c1))
+    rows_c2 = get_rows(filenames, read_filenames(filenames_c2))
+    rng = np.random.default_rng(seed)
+    # in permutation mode, take one sample up front and shuffle labels within it
+    if mode == 'permutation' and selection is not None:
+        rows_c1 = rng.choice(rows_c1, selection, replace=False)
+        rows_c2 = rng.choice(rows_c2, selection, replace=False)
+    # restrict the vocabulary to words that meet the threshold in at least one category
+    c1_total = np.asarray(counts[rows_c1].sum(axis=0)).ravel()
+    c2_total = np.asarray(counts[rows_c2].sum(axis=0)).ravel()
+    keep = np.flatnonzero((c1_total >= threshold) | (c2_total >= threshold))
+    relative = relative_frequencies(counts)[:, keep].tocsr()
+    seeds = np.random.SeedSequence(seed).spawn(num_draws)
+    # When this script is loaded with `%run`, its functions belong to `__main__`, which worker processes
+    # started with spawn (the default on macOS and Windows) cannot import, so the workers are given the
+    # functions from the script imported by name
+    import resample as module
+    with ProcessPoolExecutor(max_workers=workers, initializer=module._init_worker,
+                             initargs=(relative, rows_c1, rows_c2, selection, mode)) as executor:
+        draws = list(executor.map(module._draw, seeds))
+    stats = np.vstack([d[0] for d in draws])
+    pvalues = np.vstack([d[1] for d in draws])
+    results = pd.DataFrame({
+        'word': [vocab[i] for i in keep],
+        'c1 total count': c1_total[keep],
+        'c2 total count': c2_total[keep],
+    })
+    if mode == 'sample':
+        tail = (1 - confidence) / 2 * 100
+        results['wilcoxon statistic'] = stats.mean(axis=0)
+        results['ci low'] = np.percentile(stats, tail, axis=0)
+        results['ci high'] = np.percentile(stats, 100 - tail, axis=0)
+        results['wilcoxon p-value'] = np.median(pvalues, axis=0)
+        results['% draws p < 0.05'] = (pvalues < 0.05).mean(axis=0) * 100
+    else:
+        observed = ranksums_matrix(relative[rows_c1].tocsc(), relative[rows_c2].tocsc())[0]
+        results['wilcoxon statistic'] = observed
+        results['wilcoxon p-value'] = (1 + (np.abs(stats) >= np.abs(observed)).sum(axis=0)) / (num_draws + 1)
+        # the median p-value of the samples is not itself a p-value, so it is only adjusted in permutation mode
+        results['fdr p-value'] = fdr_adjust(results['wilcoxon p-value'].values)
+    if results_csv is not None:
+        results.to_csv(results_csv, index=False)
+    return results
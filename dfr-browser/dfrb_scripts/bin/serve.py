@@ -0,0 +1,281 @@
+"""serve.py.
+
+Serve dfr-browsers over HTTP.
+
+A replacement for `python -m http.server` that serves requests in separate threads, so several people can
+use several browsers at once. It serves precompressed `.br` and `.gz` copies of files when the web browser
+accepts them, sends ETag and Last-Modified headers (and answers conditional requests with 304 Not Modified),
+supports range requests for large data files, and logs the time taken and bytes sent for each request.
+
+Serve one browser from its folder (this is what `bin/server` does):
+python bin/serve.py
+
+Serve every browser in the `dfr-browser` module from one server, at http://localhost:9000/c33/topics25/ etc.,
+after creating compressed copies of the data files:
+python dfrb_scripts/bin/serve.py --root . --precompress
+
+For use with create_dfrbrowser.ipynb v 2.0.
+
+"""
+
+import argparse
+import email.utils
+import functools
+import gzip
+import mimetypes
+import os
+import re
+import sys
+import time
+from http import HTTPStatus
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# File types worth compressing; zip files, images and fonts are already compressed
+COMPRESS_EXTENSIONS = ('.json', '.csv', '.bin', '.js', '.css', '.html', '.svg', '.ttf', '.eot')
+
+def precompress(root, min_size=1024):
+    """Create compressed copies of the files that dfr-browser downloads.
+
+    Saves a `.gz` copy (and a `.br` copy, if the `brotli` package is installed) next to each file under
+    `root` with one of the `COMPRESS_EXTENSIONS` that is at least `min_size` bytes. Copies that are newer
+    than their files are left alone. Returns the number of copies written.
+    """
+    count = 0
+    for dirpath, dirnames, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            if not filename.endswith(COMPRESS_EXTENSIONS) or os.path.getsize(path) < min_size:
+                continue
+            mtime = os.path.getmtime(path)
+            encoders = [('.gz', lambda data: gzip.compress(data, 9))]
+            if brotli is not None:
+                encoders.append(('.br', lambda data: brotli.compress(data)))
+            data = None
+            for suffix, encode in encoders:
+                if os.path.exists(path + suffix) and os.path.getmtime(path + suffix) >= mtime:
+                    continue
+                if data is None:
+                    with open(path, 'rb') as f:
+                        data = f.read()
+                # write to a temporary file first, so a half-written copy is never served
+                with open(path + suffix + '.tmp', 'wb') as f:
+                    f.write(encode(data))
+                os.replace(path + suffix + '.tmp', path + suffix)
+                count += 1
+    return count
+
+class BrowserRequestHandler(SimpleHTTPRequestHandler):
+    """Serve files with compression, caching headers and range requests."""
+
+    # Keep connections open between requests, since a browser downloads many files
+    protocol_version = 'HTTP/1.1'
+    # Seconds that web browsers may use a file without checking whether it has changed
+    cache_max_age = 0
+
+    def do_GET(self):
+        """Serve a GET request."""
+        f = self.send_head()
+        if f:
+            try:
+                self.copy_range(f)
+            finally:
+                f.close()
+
+    def do_HEAD(self):
+        """Serve a HEAD request."""
+        f = self.send_head()
+        if f:
+            f.close()
+            # logged here, since no bytes are copied
+            self.log_complete(self.range[2])
+
+    def handle_one_request(self):
+        """Handle a request, recording when it started and the bytes sent for the log."""
+        self.started = time.perf_counter()
+        self.bytes_sent = 0
+        self.range = None
+        super().handle_one_request()
+
+    def log_request(self, code='-', size='-'):
+        """Log requests once they are complete (see `copy_range()`), with their latency and size."""
+        pass
+
+    def log_complete(self, code):
+        """Log the status, bytes sent and time taken for a request."""
+        elapsed = (time.perf_counter() - self.started) * 1000
+        self.log_message('"%s" %s %d bytes %.1f ms', self.requestline, str(int(code)), self.bytes_sent, elapsed)
+
+    def send_error(self, code, message=None, explain=None):
+        """Send an error response and log it."""
+        super().send_error(code, message, explain)
+        self.log_complete(code)
+
+    def send_head(self):
+        """Send the status and headers for a request and return the file to send, if any."""
+        path = self.translate_path(self.path)
+        if os.path.isdir(path):
+            index = os.path.join(path, 'index.html')
+            if not self.path.split('?', 1)[0].endswith('/') or not os.path.isfile(index):
+                # redirects and directory listings
+                f = super().send_head()
+                if f is not None:
+                    # the listing is sent and logged by `copy_range()`, like a file
+                    self.range = (0, len(f.getvalue()), HTTPStatus.OK)
+                elif not self.path.split('?', 1)[0].endswith('/'):
+                    self.log_complete(HTTPStatus.MOVED_PERMANENTLY)
+                return f
+            path = index
+        if not os.path.isfile(path):
+            self.send_error(HTTPStatus.NOT_FOUND, 'File not found')
+            return None
+        stat = os.stat(path)
+        etag = '"%x-%x"' % (stat.st_size, int(stat.st_mtime * 1000000))
+        last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        # pick a precompressed copy of the file, unless a range of the original is requested
+        encoding = None
+        if 'Range' not in self.headers:
+            accepted = self.headers.get('Accept-Encoding', '')
+            for name, suffix in [('br', '.br'), ('gzip', '.gz')]:
+                if re.search(r'\b' + name + r'\b', accepted) and os.path.isfile(path + suffix) \
+                        and os.path.getmtime(path + suffix) >= stat.st_mtime:
+                    encoding = name
+                    etag = etag[:-1] + '-' + name + '"'
+                    break
+        if self.not_modified(etag, stat.st_mtime):
+            self.send_response(HTTPStatus.NOT_MODIFIED)
+            self.send_cache_headers(etag, last_modified)
+            self.end_headers()
+            self.log_complete(HTTPStatus.NOT_MODIFIED)
+            return None
+        f = open(path + ('.br' if encoding == 'br' else '.gz') if encoding else path, 'rb')
+        size = os.fstat(f.fileno()).st_size
+        start, end = 0, size - 1
+        status = HTTPStatus.OK
+        if 'Range' in self.headers and self.headers.get('If-Range', etag) in (etag, last_modified):
+            byte_range = self.parse_range(self.headers['Range'], size)
+            if byte_range is False:
+                f.close()
+                self.send_response(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                self.send_header('Content-Range', 'bytes */%d' % size)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                self.log_complete(HTTPStatus.REQUESTED_RANGE_NOT_SATISFIABLE)
+                return None
+            if byte_range is not None:
+                start, end = byte_range
+                status = HTTPStatus.PARTIAL_CONTENT
+        self.send_response(status)
+        self.send_header('Content-Type', self.guess_type(path))
+        self.send_header('Content-Length', str(end - start + 1))
+        self.send_header('Accept-Ranges', 'bytes')
+        if status == HTTPStatus.PARTIAL_CONTENT:
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, size))
+        if encoding:
+            self.send_header('Content-Encoding', encoding)
+        self.send_header('Vary', 'Accept-Encoding')
+        self.send_cache_headers(etag, last_modified)
+        self.end_headers()
+        self.range = (start, end - start + 1, status)
+        return f
+
+    def send_cache_headers(self, etag, last_modified):
+        """Send the headers that let web browsers cache a file."""
+        self.send_header('ETag', etag)
+        self.send_header('Last-Modified', last_modified)
+        if self.cache_max_age:
+            self.send_header('Cache-Control', 'public, max-age=%d' % self.cache_max_age)
+        else:
+            self.send_header('Cache-Control', 'no-cache')
+
+    def not_modified(self, etag, mtime):
+        """Check whether the web browser's cached copy of a file is still current."""
+        if 'If-None-Match' in self.headers:
+            tags = [tag.strip() for tag in self.headers['If-None-Match'].split(',')]
+            return etag in tags or '*' in tags
+        if 'If-Modified-Since' in self.headers:
+            try:
+                since = email.utils.parsedate_to_datetime(self.headers['If-Modified-Since'])
+            except (TypeError, ValueError):
+                return False
+            return int(mtime) <= since.timestamp()
+        return False
+
+    def parse_range(self, header, size):
+        """Parse a `Range` header for a single range of bytes.
+
+        Returns the first and last byte of the range, None if the header should be ignored (it is
+        malformed or asks for several ranges), or False if the range is outside the file.
+        """
+        match = re.fullmatch(r'\s*bytes=(\d*)-(\d*)\s*', header)
+        if match is None or match.group(1) == match.group(2) == '':
+            return None
+        if match.group(1) == '':
+            # the last n bytes
+            length = int(match.group(2))
+            if length == 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(match.group(1))
+        end = int(match.group(2)) if match.group(2) else size - 1
+        if start >= size or end < start:
+            return False
+        return start, min(end, size - 1)
+
+    def copy_range(self, f):
+        """Send the requested bytes of a file and log the request."""
+        start, length, status = self.range
+        f.seek(start)
+        try:
+            while length > 0:
+                block = f.read(min(length, 65536))
+                if not block:
+                    break
+                self.wfile.write(block)
+                self.bytes_sent += len(block)
+                length -= len(block)
+        finally:
+            self.log_complete(status)
+
+def serve(root='.', port=9000, bind='', cache_max_age=0):
+    """Serve the files in `root` until interrupted.
+
+    Parameters:
+    - root (str): The folder to serve: a browser folder, a collection folder, or the whole module.
+    - port (int): The port to listen on.
+    - bind (str): The address to listen on. By default, all addresses.
+    - cache_max_age (int): Seconds that web browsers may use files without checking whether they have changed.
+    """
+    mimetypes.add_type('application/json', '.json')
+    handler = type('Handler', (BrowserRequestHandler,), {'cache_max_age': cache_max_age})
+    server = ThreadingHTTPServer((bind, port), functools.partial(handler, directory=root))
+    server.daemon_threads = True
+    print('Serving ' + os.path.abspath(root) + ' at http://localhost:' + str(port) + '/')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print('Stopped serving.')
+    finally:
+        server.server_close()
+
+def main(argv=None):
+    """Run the server from the command line."""
+    parser = argparse.ArgumentParser(description='Serve dfr-browsers.')
+    parser.add_argument('--root', default='.', help='the folder to serve (default: the current folder)')
+    parser.add_argument('--port', type=int, default=9000, help='the port to listen on (default: 9000)')
+    parser.add_argument('--bind', default='', help='the address to listen on (default: all addresses)')
+    parser.add_argument('--max-age', type=int, default=0,
+                        help='seconds that web browsers may cache files without checking for changes (default: 0)')
+    parser.add_argument('--precompress', action='store_true',
+                        help='create compressed copies of the data files before serving')
+    args = parser.parse_args(argv)
+    if args.precompress:
+        print('Wrote ' + str(precompress(args.root)) + ' compressed files.')
+    serve(args.root, args.port, args.bind, args.max_age)
+
+if __name__ == '__main__':
+    main(sys.argv[1:])
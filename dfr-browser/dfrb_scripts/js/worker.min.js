@@ -1 +1 @@
-"use strict";importScripts("utils.min.js");var my={conditional:{},conditional_total:{},doc_categories:{}},doc_topics_matrix,total_tokens,topic_docs,doc_topics,topic_conditional,conditional_total,topic_docs_conditional,PROPER_TOLERANCE=.01;doc_topics_matrix=function(t){var i={},o=t;if(o.p&&o.p.length){o.n=o.p.length-1}o.get=function(t,i){var o,a,e,n;if(!this.x){return undefined}if(t===undefined){return this}if(i===undefined){n=[];for(e=0;e<this.n;e+=1){n.push(this.get(t,e))}return n}o=this.p[i];a=utils.bisect_left(this.i.slice(o,this.p[i+1]),t);n=this.i[a+o]===t?this.x[a+o]:0;return n};o.row_sum=function(t){var o,a,e;if(!this.x){return undefined}if(!i.row_sum){i.row_sum=[]}if(t===undefined){for(a=0;a<this.n;a+=1){for(e=this.p[a];e<this.p[a+1];e+=1){if(i.row_sum[this.i[e]]===undefined){i.row_sum[this.i[e]]=0}i.row_sum[this.i[e]]+=this.x[e]}}return i.row_sum}if(!i.row_sum[t]){o=0;for(a=0;a<this.n;a+=1){o+=this.get(t,a)}i.row_sum[t]=o}return i.row_sum[t]};o.col_sum=function(t){var o;if(!i.col_sum){i.col_sum=[]}if(t===undefined){for(o=0;o<this.n;o+=1){this.col_sum(o)}return i.col_sum}if(!i.col_sum[t]){i.col_sum[t]=0;for(o=this.p[t];o<this.p[t+1];o+=1){i.col_sum[t]+=this.x[o]}}return i.col_sum[t]};return o};total_tokens=function(){var t,i=0;for(t=0;t<my.dt.x.length;t+=1){i+=my.dt.x[t]}return i};topic_docs=function(t,i){return topic_docs_conditional(t,undefined,undefined,i)};doc_topics=function(t,i){var o=[],a,e;for(a=0;a<my.dt.n;a+=1){e=my.dt.get(t,a);if(e>0){o.push({topic:a,weight:e})}}o.sort(function(t,i){return utils.desc(t.weight,i.weight)||utils.desc(t.t,i.t)});return utils.shorten(o,i,function(t,i){return t[i].weight})};topic_conditional=function(t,i){var o,a,e;if(!my.conditional[t]){my.conditional[t]={}}if(i===undefined){o=[];for(a=0;a<my.dt.n;a+=1){o.push(topic_conditional(t,a))}return o}if(my.conditional[t][i]){return my.conditional[t][i]}o={};for(a=my.dt.p[i];a<my.dt.p[i+1];a+=1){e=my.doc_categories[t][my.dt.i[a]];if(o[e]){o[e]+=my.dt.x[a]}else{o[e]=my.dt.x[a]}}for(e in o){if(o.hasOwnProperty(e)){o[e]/=conditional_total(t,e)}}my.conditional[t][i]=o;return o};conditional_total=function(t,i){var o,a,e;if(!my.conditional_total[t]){o={};for(e=0;e<my.dt.i.length;e+=1){a=my.doc_categories[t][my.dt.i[e]];if(o[a]){o[a]+=my.dt.x[e]}else{o[a]=my.dt.x[e]}}my.conditional_total[t]=o}return i!==undefined?my.conditional_total[t][i]:my.conditional_total[t]};topic_docs_conditional=function(t,i,o,a){var e=my.dt.p[t],n=my.dt.p[t+1],s,d=[],c,r,u,l=[];for(s=e;s<n;s+=1){if(i===undefined||my.doc_categories[i][my.dt.i[s]]===o){d.push({doc:my.dt.i[s],frac:my.dt.x[s]/my.dt.row_sum(my.dt.i[s]),weight:my.dt.x[s]})}}if(a>=d.length){d.sort(function(t,i){return utils.desc(t.frac,i.frac)||utils.desc(t.doc,i.doc)});return d}l=d.slice(0,a).sort(function(t,i){return utils.asc(t.frac,i.frac)||utils.asc(t.doc,i.doc)});c=utils.bisector_left(function(t){return t.frac});for(u=a;u<d.length;u+=1){r=c(l,d[u].frac);if(r>0){l.splice(r,0,d[u]);l.shift()}else if(l[0].frac===d[u].frac){l.unshift(d[u])}}return utils.shorten(l.reverse(),a,function(t,i){return t[i].frac})};onmessage=function(t){var i;if(t.data.what==="set_dt"){my.dt=doc_topics_matrix(t.data.dt);if(my.dt){i=my.dt.row_sum().reduce(function(t,i){return t&&Math.abs(i-1)<PROPER_TOLERANCE},true)}postMessage({what:"set_dt",result:{success:my.dt!==undefined,proper:i}})}else if(t.data.what==="set_doc_categories"){my.doc_categories[t.data.v]=t.data.keys;postMessage({what:"set_doc_categories",result:my.doc_categories[t.data.v]!==undefined})}else if(t.data.what==="total_tokens"){postMessage({what:"total_tokens",result:total_tokens()})}else if(t.data.what==="topic_docs"){postMessage({what:"topic_docs/"+t.data.t+"/"+t.data.n,result:topic_docs(t.data.t,t.data.n)})}else if(t.data.what==="doc_topics"){postMessage({what:"doc_topics/"+t.data.d+"/"+t.data.n,result:doc_topics(t.data.d,t.data.n)})}else if(t.data.what==="topic_total"){postMessage({what:"topic_total/"+t.data.t,result:my.dt.col_sum(t.data.t==="all"?undefined:t.data.t)})}else if(t.data.what==="topic_conditional"){postMessage({what:"topic_conditional/"+t.data.v+"/"+t.data.t,result:topic_conditional(t.data.v,t.data.t==="all"?undefined:t.data.t)})}else if(t.data.what==="conditional_total"){postMessage({what:"conditional_total/"+t.data.v+"/"+t.data.key,result:conditional_total(t.data.v,t.data.key==="all"?undefined:t.data.key)})}else if(t.data.what==="topic_docs_conditional"){postMessage({what:"topic_docs_conditional/"+t.data.t+"/"+t.data.v+"/"+t.data.key+"/"+t.data.n,result:topic_docs_conditional(t.data.t,t.data.v,t.data.key,t.data.n)})}else{postMessage({what:"error"})}};
\ No newline at end of file
+"use strict";importScripts("utils.min.js");var shards,sharded_matrix,handle_message,load_shards,shard_topics,my={conditional:{},conditional_total:{},doc_categories:{}},doc_topics_matrix,total_tokens,topic_docs,doc_topics,topic_conditional,conditional_total,topic_docs_conditional,PROPER_TOLERANCE=.01;doc_topics_matrix=function(t){var i={},o=t;if(o.p&&o.p.length){o.n=o.p.length-1}o.col=function(t){return{i:this.i,x:this.x,start:this.p[t],end:this.p[t+1]}};o.get=function(t,i){var o,a,e,n;if(!this.x){return undefined}if(t===undefined){return this}if(i===undefined){n=[];for(e=0;e<this.n;e+=1){n.push(this.get(t,e))}return n}o=this.col(i);a=utils.bisect_left(o.i.slice(o.start,o.end),t);n=o.i[a+o.start]===t?o.x[a+o.start]:0;return n};o.row_sum=function(t){var o,a,e;if(!this.x){return undefined}if(!i.row_sum){i.row_sum=[]}if(t===undefined){for(a=0;a<this.n;a+=1){for(e=this.p[a];e<this.p[a+1];e+=1){if(i.row_sum[this.i[e]]===undefined){i.row_sum[this.i[e]]=0}i.row_sum[this.i[e]]+=this.x[e]}}return i.row_sum}if(!i.row_sum[t]){o=0;for(a=0;a<this.n;a+=1){o+=this.get(t,a)}i.row_sum[t]=o}return i.row_sum[t]};o.col_sum=function(t){var o;if(!i.col_sum){i.col_sum=[]}if(t===undefined){for(o=0;o<this.n;o+=1){this.col_sum(o)}return i.col_sum}if(!i.col_sum[t]){i.col_sum[t]=0;for(o=this.p[t];o<this.p[t+1];o+=1){i.col_sum[t]+=this.x[o]}}return i.col_sum[t]};return o};total_tokens=function(){var t,i=0;for(t=0;t<my.dt.x.length;t+=1){i+=my.dt.x[t]}return i};topic_docs=function(t,i){return topic_docs_conditional(t,undefined,undefined,i)};doc_topics=function(t,i){var o=[],a,e;for(a=0;a<my.dt.n;a+=1){e=my.dt.get(t,a);if(e>0){o.push({topic:a,weight:e})}}o.sort(function(t,i){return utils.desc(t.weight,i.weight)||utils.desc(t.t,i.t)});return utils.shorten(o,i,function(t,i){return t[i].weight})};topic_conditional=function(t,i){var o,a,e,c;if(!my.conditional[t]){my.conditional[t]={}}if(i===undefined){o=[];for(a=0;a<my.dt.n;a+=1){o.push(topic_conditional(t,a))}return o}if(my.conditional[t][i]){return my.conditional[t][i]}o={};c=my.dt.col(i);for(a=c.start;a<c.end;a+=1){e=my.doc_categories[t][c.i[a]];if(o[e]){o[e]+=c.x[a]}else{o[e]=c.x[a]}}for(e in o){if(o.hasOwnProperty(e)){o[e]/=conditional_total(t,e)}}my.conditional[t][i]=o;return o};conditional_total=function(t,i){var o,a,e;if(!my.conditional_total[t]){o={};for(e=0;e<my.dt.i.length;e+=1){a=my.doc_categories[t][my.dt.i[e]];if(o[a]){o[a]+=my.dt.x[e]}else{o[a]=my.dt.x[e]}}my.conditional_total[t]=o}return i!==undefined?my.conditional_total[t][i]:my.conditional_total[t]};topic_docs_conditional=function(t,i,o,a){var h=my.dt.col(t),e=h.start,n=h.end,s,d=[],c,r,u,l=[];for(s=e;s<n;s+=1){if(i===undefined||my.doc_categories[i][h.i[s]]===o){d.push({doc:h.i[s],frac:h.x[s]/my.dt.row_sum(h.i[s]),weight:h.x[s]})}}if(a>=d.length){d.sort(function(t,i){return utils.desc(t.frac,i.frac)||utils.desc(t.doc,i.doc)});return d}l=d.slice(0,a).sort(function(t,i){return utils.asc(t.frac,i.frac)||utils.asc(t.doc,i.doc)});c=utils.bisector_left(function(t){return t.frac});for(u=a;u<d.length;u+=1){r=c(l,d[u].frac);if(r>0){l.splice(r,0,d[u]);l.shift()}else if(l[0].frac===d[u].frac){l.unshift(d[u])}}return utils.shorten(l.reverse(),a,function(t,i){return t[i].frac})};handle_message=function(t){var i;if(t.data.what==="set_dt_sharded"){my.dt=sharded_matrix(t.data.manifest,t.data.base);postMessage({what:"set_dt",result:{success:true,proper:false}})}else if(t.data.what==="set_dt"){my.dt=doc_topics_matrix(t.data.dt);if(my.dt){i=my.dt.row_sum().reduce(function(t,i){return t&&Math.abs(i-1)<PROPER_TOLERANCE},true)}postMessage({what:"set_dt",result:{success:my.dt!==undefined,proper:i}})}else if(t.data.what==="set_doc_categories"){my.doc_categories[t.data.v]=t.data.keys;postMessage({what:"set_doc_categories",result:my.doc_categories[t.data.v]!==undefined})}else if(t.data.what==="total_tokens"){postMessage({what:"total_tokens",result:total_tokens()})}else if(t.data.what==="topic_docs"){postMessage({what:"topic_docs/"+t.data.t+"/"+t.data.n,result:topic_docs(t.data.t,t.data.n)})}else if(t.data.what==="doc_topics"){postMessage({what:"doc_topics/"+t.data.d+"/"+t.data.n,result:doc_topics(t.data.d,t.data.n)})}else if(t.data.what==="topic_total"){postMessage({what:"topic_total/"+t.data.t,result:my.dt.col_sum(t.data.t==="all"?undefined:t.data.t)})}else if(t.data.what==="topic_conditional"){postMessage({what:"topic_conditional/"+t.data.v+"/"+t.data.t,result:topic_conditional(t.data.v,t.data.t==="all"?undefined:t.data.t)})}else if(t.data.what==="conditional_total"){postMessage({what:"conditional_total/"+t.data.v+"/"+t.data.key,result:conditional_total(t.data.v,t.data.key==="all"?undefined:t.data.key)})}else if(t.data.what==="topic_docs_conditional"){postMessage({what:"topic_docs_conditional/"+t.data.t+"/"+t.data.v+"/"+t.data.key+"/"+t.data.n,result:topic_docs_conditional(t.data.t,t.data.v,t.data.key,t.data.n)})}else{postMessage({what:"error"})}};sharded_matrix=function(t,i){var o,a,e;shards={base:i,manifest:t,lengths:undefined,by_topic:[],loaded:[]};for(a=0;a<t.shards.length;a+=1){for(e=t.shards[a].start;e<t.shards[a].end;e+=1){shards.by_topic[e]=t.shards[a]}}o=doc_topics_matrix({p:t.p,i:[],x:[]});o.col=function(t){var i=shards.by_topic[t],o=i&&shards.loaded[i.start];if(!o){return{i:[],x:[],start:0,end:0}}return{i:o.i,x:o.x,start:this.p[t]-this.p[i.start],end:this.p[t+1]-this.p[i.start]}};o.col_sum=function(i){return i===undefined?t.col_sums:t.col_sums[i]};o.row_sum=function(t){if(!shards.lengths){shards.lengths=new Int32Array(load_shards.fetch(shards.manifest.doc_lengths))}return t===undefined?Array.prototype.slice.call(shards.lengths):shards.lengths[t]};total_tokens=function(){return t.col_sums.reduce(function(t,i){return t+i},0)};conditional_total=function(t,i){var o,a,e;if(!my.conditional_total[t]){o={};my.dt.row_sum(0);for(a=0;a<shards.lengths.length;a+=1){if(shards.lengths[a]>0){e=my.doc_categories[t][a];if(o[e]){o[e]+=shards.lengths[a]}else{o[e]=shards.lengths[a]}}}my.conditional_total[t]=o}return i!==undefined?my.conditional_total[t][i]:my.conditional_total[t]};if(t.doc_rows){doc_topics=function(t,i){var o=load_shards.row(t),a=[],e;for(e=0;e<o.length;e+=2){if(o[e+1]>0){a.push({topic:o[e],weight:o[e+1]})}}a.sort(function(t,i){return utils.desc(t.weight,i.weight)||utils.desc(t.t,i.t)});return utils.shorten(a,i,function(t,i){return t[i].weight})}}return o};load_shards=function(t){var i,o,a,n;for(i=0;i<t.length;i+=1){o=shards.by_topic[t[i]];if(o===undefined||shards.loaded[o.start]){continue}a=load_shards.fetch(o.file);if(!a){continue}a=new Int32Array(a);n=my.dt.p[o.end]-my.dt.p[o.start];shards.loaded[o.start]={i:a.subarray(0,n),x:a.subarray(n,2*n)}}};load_shards.fetch=function(t){var i=new XMLHttpRequest;i.open("GET",shards.base+t,false);i.responseType="arraybuffer";i.send(null);return i.status===200?i.response:undefined};load_shards.row=function(t){var i,o,a;if(!shards.doc_ptr){shards.doc_ptr=new Int32Array(load_shards.fetch(shards.manifest.doc_rows.ptr))}i=8*shards.doc_ptr[t];o=8*shards.doc_ptr[t+1];if(o<=i){return[]}if(shards.doc_rows){return new Int32Array(shards.doc_rows,i,(o-i)/4)}a=new XMLHttpRequest;a.open("GET",shards.base+shards.manifest.doc_rows.file,false);a.responseType="arraybuffer";a.setRequestHeader("Range","bytes="+i+"-"+(o-1));a.send(null);if(a.status===206){return new Int32Array(a.response)}if(a.status===200){shards.doc_rows=a.response;return new Int32Array(shards.doc_rows,i,(o-i)/4)}return[]};shard_topics=function(t){var i,o=[];if(t.what==="topic_docs"||t.what==="topic_docs_conditional"||t.what==="topic_conditional"&&t.t!=="all"){return[+t.t]}if(t.what==="doc_topics"&&!shards.manifest.doc_rows||t.what==="topic_conditional"){for(i=0;i<shards.manifest.n_topics;i+=1){o.push(i)}}return o};onmessage=function(t){if(shards&&my.dt){load_shards(shard_topics(t.data))}handle_message(t)};
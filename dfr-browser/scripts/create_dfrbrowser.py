@@ -2,23 +2,37 @@
 
 Creates files necessary to produce a dfr-browser visualization for exploring topic models. Dfr-browser code, stored in this module in `dfrb_scripts`, was written by Andrew Goldstone and adapted for our use and data. See https://github.com/agoldst/dfr-browser for Goldstone's original code and documentation. Also see https://agoldst.github.io/dfr-browser/ for a version history of Goldstone's code. We use an older version of Goldstone's code (v0.5.1), and we use his prepare_data.py Python script to prepare the data files, NOT the R package. This script includes functions for preparing WE1S data for use with Goldstone's code and for creating dfr-browser visualizations.
 
+The browsers for a collection's models can also be created from the command line:
+python create_dfrbrowser.py --collection c33 --model-dir ../data/models --metadata-dir ../data/metadata-c33 --workers 4
+
 For use with create_dfrbrowser.ipynb v 2.0.
 
 """
 
 # Python imports
+import argparse
 import csv
+import hashlib
 import os
 import string
-import unidecode
+import sys
 import json
 import re
 from pathlib import Path
-import subprocess
-from subprocess import STDOUT
 import shutil
-from IPython.display import display, HTML
-from zipfile import ZipFile
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from zipfile import ZipFile, ZIP_DEFLATED
+
+# This folder, so the worker processes of `create_dfrbrowser()` can import this script by name
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+# The model catalog, reporter and timer are shared with the topic-modeling module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'topic-modeling', 'scripts'))
+from dfrb_data import convert_state, info_stub, set_dt_file
+from model_catalog import (artifact_path, cached_file_info, catalog_path, file_info, load_catalog, scan_models,
+                           sorted_models, update_catalog)
+from report import add_report_arguments, get_reporter, in_ipython, setup_reporting
+from timer import current_span, span, traced
 
 def check_metadata(metadata_dir):
     '''Checks to make sure the metadata files you need already exist.'''
@@ -26,23 +40,25 @@ def check_metadata(metadata_dir):
         files = [file for file in os.listdir(metadata_dir)]
         if 'meta.csv' in files and 'meta.temp.csv' in files and 'metadata-dfrb.csv':
             output = 'Metadata files for selected collection exist. Ready to create browser.' 
-            display(HTML('<p><strong>' + output + '</strong></p>'))
+            get_reporter().info(output)
         else:
             output = 'You are missing at least one metadata file for this collection. Check metadata directory and module README.md.' 
-            display(HTML('<p style="color: red;">' + output + '</p>'))
+            get_reporter().error(output)
     else:
         output = 'Metadata directory does not exist for this collection. Use prepare-data module to create it. See module README.md.' 
-        display(HTML('<p style="color: red;">' + output + '</p>'))
+        get_reporter().error(output)
 
 def get_model_state(collection, selection, model_dir):
     """Get model state.
 
     This function assumes your project folder is set up according to WE1S
     format (and was therefore created using our `new_project_from_archive`
-    notebook). It looks for the models you have selected to create
-    dfr-browsers for in your project's models directory and then grabs those
+    notebook). It looks up the models you have selected to create
+    dfr-browsers for in the collection's model catalog (see
+    `topic-modeling/scripts/model_catalog.py`) and then grabs those
     models' state and scaled files, or, if it fails to find them, it alerts
-    you to their absence. To produce dfr-browsers for all of your project's
+    you to their absence. Models trained before the catalog was introduced
+    are added to it if the collection has no catalog or the catalog does not list a selected model. To produce dfr-browsers for all of your project's
     models, the selection variable should be set to 'None'. To run the
     create_dfrbrowser() you need lists of the names of the model subdirectories
     you want to create (in subdir_list), the state files from each of those
@@ -54,143 +70,395 @@ def get_model_state(collection, selection, model_dir):
     subdir_list = []
     state_file_list = []
     scaled_file_list = []
+    catalog = load_catalog(model_dir, collection)
+    # Only search the model folders for models trained before the catalog was introduced
+    if not os.path.isfile(catalog_path(model_dir, collection)):
+        catalog = scan_models(model_dir, collection)
+    selection = get_selection(selection)
     # Set `selection` to `All` or `None` if you want to make dfr-browsers for ALL existing models
-    if get_selection(selection) is None:
-        # For each model subdirectory, add the model state file and model scaled file to a list
-        for subdir in os.listdir(model_dir):
-            if subdir == collection:
-                subdir_path1 = model_dir + '/' + subdir
-                for x in os.listdir(subdir_path1):
-                    subdir_path = model_dir + '/' + subdir + '/' + x
-                    subdir_list.append(x)
-                    num = re.search(r'\d+', x).group()
-                    for file in os.listdir(subdir_path):
-                        if file.endswith('.gz') and num in file:
-                            state_file = subdir_path + '/' + file
-                            state_file_list.append(state_file)
-                        if file.endswith('.csv'):
-                            scaled_file = subdir_path + '/' + file
-                            scaled_file_list.append(scaled_file)
-        # User feedback in the notebook
-        msg = '<p><strong>Will create visualizations for all models in <code>models</code> directory: ' + str(subdir_list) +'</strrong></p>'
-        display(HTML(msg))
-        lsub = len(subdir_list)
-        lstate = len(state_file_list)
-        lscaled = len(scaled_file_list)
-        # Display how many state and scaled files were discovered for how many models
-        msg = '<p><strong>Found ' + str(lstate) + ' state files and ' + str(lscaled) + ' scaled files for ' + str(lsub) + ' models</strong></p>'
-        display(HTML(msg))
-        # If they all match, you are golden
-        if lsub == lstate == lscaled:
-            display(HTML('<p><strong>Ready to create visualizations</strong></p>'))
-        # If they don't all match, you need to check your `models` directory
-        # to make sure each one contains a state and a scaled file.
-        else:
-            msg = '<p style="color: red;">Incorrect number of state or scaled files! Check your <code>model</code> directory</p>'
-            display(HTML(msg))
-    # If selection is not `None`, process selected models
+    if selection is None:
+        models = sorted_models(catalog)
     else:
-        subdir_list = selection
-        # For each selected model, add the model state and scaled files to a list
-        for subdir in subdir_list:
-            subdir_path = model_dir + '/' + collection + '/' + subdir
-            num = re.search(r'\d+', subdir).group()
-            for file in os.listdir(model_path):
-                if file.endswith('.gz') and num in file:
-                    state_file = subdir_path + '/' + file
-                    state_file_list.append(state_file)
-                if file.endswith('.csv'):
-                    scaled_file = subdir_path + '/' + file
-                    scaled_file_list.append(scaled_file)
-        # User feedback in the notebook
-        msg = '<p><strong>Will create visualizations for the following models: ' + str(subdir_list) +'</strong></p>'
-        display(HTML(msg))
-        lsub = len(subdir_list)
-        lstate = len(state_file_list)
-        lscaled = len(scaled_file_list)
-        # Display how many state and scaled files were discovered for how many models
-        msg = '<p><strong>Found ' + str(lstate) + ' state files and ' + str(lscaled) + ' scaled files for ' + str(lsub) + 'models</strong></p>'
-        display(HTML(msg))
-        # If they all match, you are golden
-        if lsub == lstate == lscaled:
-            display(HTML('<p><strong>Ready to create visualizations</strong></p>'))
-        # If they don't all match, you need to check your `models` directory to
-        # make sure each one contains a state and a scaled file.
-        else:
-            msg = '<p style="color: red;">Incorrect number of state or scaled files! Check your <code>model</code> directory</p>'
-            display(HTML(msg))
+        models = [re.search(r'\d+', subdir).group() for subdir in selection]
+        if any(model not in catalog['models'] for model in models):
+            catalog = scan_models(model_dir, collection)
+    # Refresh the catalog's information about the models' files, in case any were created outside the notebooks
+    catalog = update_catalog(model_dir, collection, [model for model in models if model in catalog['models']])
+    # For each model, add the model state file and model scaled file to a list
+    for topic_num in models:
+        subdir_list.append('topics' + topic_num)
+        state_file = artifact_path(model_dir, collection, topic_num, 'model_state', catalog)
+        if state_file is not None:
+            state_file_list.append(state_file)
+        scaled_file = artifact_path(model_dir, collection, topic_num, 'scaled', catalog)
+        if scaled_file is not None:
+            scaled_file_list.append(scaled_file)
+    # User feedback in the notebook
+    if selection is None:
+        msg = 'Will create visualizations for all models in models directory: ' + str(subdir_list)
+    else:
+        msg = 'Will create visualizations for the following models: ' + str(subdir_list)
+    get_reporter().info(msg)
+    lsub = len(subdir_list)
+    lstate = len(state_file_list)
+    lscaled = len(scaled_file_list)
+    # Display how many state and scaled files were discovered for how many models
+    msg = 'Found ' + str(lstate) + ' state files and ' + str(lscaled) + ' scaled files for ' + str(lsub) + ' models'
+    get_reporter().info(msg)
+    # If they all match, you are golden
+    if lsub == lstate == lscaled:
+        get_reporter().info('Ready to create visualizations')
+    # If they don't all match, you need to check your `models` directory to
+    # make sure each one contains a state and a scaled file.
+    else:
+        msg = 'Incorrect number of state or scaled files! Check your model directory'
+        get_reporter().error(msg)
     return subdir_list, state_file_list, scaled_file_list
 
+def template_hash(dfrb_scripts):
+    '''Returns a hash of the names and contents of all the files in the dfr-browser template.'''
+    digest = hashlib.sha1()
+    for root, dirs, files in os.walk(dfrb_scripts):
+        dirs.sort()
+        for file in sorted(files):
+            path = os.path.join(root, file)
+            digest.update(os.path.relpath(path, dfrb_scripts).encode('utf-8'))
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+def prepare_assets(collection_path, dfrb_scripts):
+    """Create the shared copy of the dfr-browser template used by all the browsers in a collection.
+
+    The template is copied to an `assets` folder in the collection folder, with the customized js
+    file renamed. The copy is only made again if the template has changed since it was last made.
+    Returns the path to the `assets` folder.
+    """
+    assets = collection_path + '/assets'
+    hash_file = assets + '/.template-hash'
+    digest = template_hash(dfrb_scripts)
+    if os.path.exists(hash_file):
+        with open(hash_file) as f:
+            if f.read() == digest:
+                return assets
+    os.makedirs(collection_path, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix='.assets-', dir=collection_path)
+    try:
+        shutil.copytree(dfrb_scripts, build_dir + '/assets')
+        shutil.move(build_dir + '/assets/js/dfb.min.js.custom', build_dir + '/assets/js/dfb.min.js')
+        with open(build_dir + '/assets/.template-hash', 'w') as f:
+            f.write(digest)
+        if os.path.exists(assets):
+            os.rename(assets, build_dir + '/old')
+        os.rename(build_dir + '/assets', assets)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    return assets
+
+def link_or_copy(src, dst):
+    '''Hard links `src` to `dst`, or copies it if hard links are not supported.'''
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+def install_template(sb_path, template, dfrb_scripts, assets=None):
+    """Set up the dfr-browser template files in a browser folder.
+
+    Parameters:
+    - sb_path (str): The browser folder to create.
+    - template (str): `copy` to copy the whole template into the folder, `link` to hard link the files of
+      the shared template in `assets`, or `symlink` to link the template folders in `assets` (so the browser
+      folder only holds `index.html`, its `data` folder and links to the shared folders).
+    - dfrb_scripts (str): Path to the dfr-browser template.
+    - assets (str): Path to the shared template created by `prepare_assets()`.
+    """
+    if template == 'copy':
+        # copy dfrbrowser template from scripts to project browser folder
+        shutil.copytree(dfrb_scripts, sb_path)
+        # move and rename customized js file
+        min_js = sb_path + '/js/dfb.min.js.custom'
+        min_js_new = sb_path + '/js/dfb.min.js'
+        shutil.move(min_js, min_js_new)
+    elif template == 'link':
+        shutil.copytree(assets, sb_path, copy_function=link_or_copy,
+                        ignore=shutil.ignore_patterns('.template-hash'))
+    elif template == 'symlink':
+        os.makedirs(sb_path)
+        for name in os.listdir(assets):
+            if name.startswith('.'):
+                continue
+            if os.path.isdir(assets + '/' + name):
+                # relative links, so they still work after the browser folder is moved into place
+                os.symlink(os.path.join(os.pardir, 'assets', name), sb_path + '/' + name)
+            else:
+                link_or_copy(assets + '/' + name, sb_path + '/' + name)
+    else:
+        raise ValueError('The template setting must be `copy`, `link` or `symlink`.')
+
+def prepare_metadata(collection_path, browser_meta_file):
+    """Create the zipped dfr-browser metadata shared by all the browsers in a collection.
+
+    The metadata is the same for every model of a collection, so it is only zipped once. `meta.csv` and
+    `meta.csv.zip` are saved in a folder named after the hash of `browser_meta_file` in the collection's
+    `metadata` folder, and are only created again when the metadata changes. The hash is kept in the
+    `metadata` folder with the size and modification time of `browser_meta_file`, so the file is only read
+    again when it changes. Returns the path to the folder.
+    """
+    meta_root = collection_path + '/metadata'
+    source_file = meta_root + '/.source.json'
+    try:
+        with open(source_file) as f:
+            source = json.load(f)
+    except (OSError, ValueError):
+        source = {}
+    path = os.path.abspath(browser_meta_file)
+    info = file_info(browser_meta_file, source if source.get('path') == path else None)
+    digest = info['sha1']
+    meta_dir = meta_root + '/' + digest[:16]
+    os.makedirs(meta_root, exist_ok=True)
+    if source.get('path') != path or source.get('size') != info['size'] or source.get('mtime') != info['mtime'] \
+            or source.get('sha1') != digest:
+        info['path'] = path
+        with open(source_file + '.tmp', 'w') as f:
+            json.dump(info, f)
+        os.replace(source_file + '.tmp', source_file)
+    if os.path.exists(meta_dir):
+        return meta_dir
+    build_dir = tempfile.mkdtemp(prefix='.' + digest[:16] + '-', dir=meta_root)
+    try:
+        shutil.copy(browser_meta_file, build_dir + '/meta.csv')
+        with ZipFile(build_dir + '/meta.csv.zip', 'w', ZIP_DEFLATED) as z:
+            z.write(build_dir + '/meta.csv', 'meta.csv')
+        os.rename(build_dir, meta_dir)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    # remove the files for earlier versions of the metadata (browsers have their own links to them)
+    for name in os.listdir(meta_root):
+        if name != digest[:16] and not name.startswith('.'):
+            shutil.rmtree(meta_root + '/' + name, ignore_errors=True)
+    return meta_dir
+
+def shared_metadata_dir(collection_path):
+    """Return the folder of shared metadata last created by `prepare_metadata()` for a collection, or None.
+
+    For building browsers in separate processes after the metadata has been prepared once.
+    """
+    try:
+        with open(collection_path + '/metadata/.source.json') as f:
+            meta_dir = collection_path + '/metadata/' + json.load(f)['sha1'][:16]
+    except (OSError, ValueError, KeyError):
+        return None
+    return meta_dir if os.path.isdir(meta_dir) else None
+
+def file_signature(path, previous=None):
+    """Describe an input file of a browser for the build manifest.
+
+    The file is identified by the sha1 hash of its contents. If `previous` (the file's entry in the
+    last build manifest) or the model catalog has a hash for the file with the same size and
+    modification time, it is reused rather than reading the file again.
+    """
+    stat = os.stat(path)
+    if previous is None or previous.get('size') != stat.st_size or previous.get('mtime') != stat.st_mtime:
+        previous = cached_file_info(path)
+    signature = file_info(path, previous)
+    signature['path'] = path
+    return signature
+
+def load_manifest(manifest_file):
+    '''Returns the build manifest of an existing browser, or an empty manifest if there is none.'''
+    try:
+        with open(manifest_file) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'inputs': {}, 'outputs': {}}
+
+@traced()
+def build_browser(collection, subdir, state, scaled, browser_meta_file, current_dir,
+                  template='copy', assets=None, meta_dir=None, force=False, sharded=False):
+    """Create the dfr-browser visualization for a single model.
+
+    The browser is built in a temporary directory next to its final
+    location and only renamed into place once it is complete, so an
+    existing browser is not removed until its replacement is ready and
+    a failed build never leaves a half-finished browser behind. See
+    `install_template()` for the `template` settings. The metadata
+    files are linked from `meta_dir` (see `prepare_metadata()`), which
+    is created if it is not given.
+
+    Each browser has a `build-manifest.json` file recording the hashes
+    of the files it was built from and the files created from each of
+    them. If none of the inputs have changed since the last build, the
+    browser is left as it is. Otherwise, only the files created from
+    changed inputs are created again; the rest are linked from the
+    previous build. Set `force` to True to rebuild everything. Set
+    `sharded` to True to write the doc-topics in shards of topics that
+    the browser loads as needed (see `dfrb_data.write_dt_shards()`),
+    rather than in one `dt.json.zip` file. Returns the messages produced
+    while building the browser.
+    """
+    output = []
+    num = re.search(r'\d+', subdir).group()
+    collection_path = current_dir + '/' + collection
+    browse_path = collection_path + '/topics' + num
+    dfrb_scripts = current_dir + '/dfrb_scripts'
+    if meta_dir is None:
+        meta_dir = prepare_metadata(collection_path, browser_meta_file)
+    manifest_file = browse_path + '/build-manifest.json'
+    previous = {'inputs': {}, 'outputs': {}}
+    if not force:
+        previous = load_manifest(manifest_file)
+    inputs = {
+        'state': file_signature(state, previous['inputs'].get('state')),
+        'scaled': file_signature(scaled, previous['inputs'].get('scaled')),
+        # the metadata folder is named after the hash of the metadata
+        'metadata': {'path': browser_meta_file, 'sha1': os.path.basename(meta_dir)},
+        'template': {'path': dfrb_scripts, 'mode': template, 'sha1': template_hash(dfrb_scripts)}
+    }
+    if sharded:
+        inputs['state']['mode'] = 'sharded'
+    def built(key):
+        # the files created from an input in the previous build still exist
+        files = previous['outputs'].get(key)
+        return files is not None and all(os.path.exists(browse_path + '/' + file) for file in files)
+    def unchanged(key):
+        # an input is unchanged if it has the same hash (and template mode) as in the previous build
+        old = previous['inputs'].get(key)
+        if old is None or old.get('sha1') != inputs[key]['sha1'] or old.get('mode') != inputs[key].get('mode'):
+            return False
+        return built(key)
+    if all(unchanged(key) for key in inputs):
+        return 'Browser in ' + browse_path + ' is up to date.'
+    outputs = {}
+    os.makedirs(collection_path, exist_ok=True)
+    build_dir = tempfile.mkdtemp(prefix='.topics' + num + '-', dir=collection_path)
+    try:
+        # make browser subdirectory
+        sb_path = build_dir + '/topics' + num
+        install_template(sb_path, template, dfrb_scripts, assets)
+        outputs['template'] = []
+        # make data dir
+        bdata_dir = sb_path + '/data'
+        os.makedirs(bdata_dir)
+        # link files created from unchanged inputs from the previous build
+        for key in ['state', 'scaled', 'info']:
+            if (key == 'info' and built(key)) or (key != 'info' and unchanged(key)):
+                for file in previous['outputs'][key]:
+                    if os.path.isdir(browse_path + '/' + file):
+                        shutil.copytree(browse_path + '/' + file, sb_path + '/' + file, copy_function=link_or_copy)
+                    else:
+                        link_or_copy(browse_path + '/' + file, sb_path + '/' + file)
+                outputs[key] = previous['outputs'][key]
+                output.append('Reused ' + ', '.join(outputs[key]) + ' from the previous build')
+        if 'state' not in outputs:
+            # create dfr-browser files from the model counts (created from the state file if needed)
+            tw = bdata_dir + '/tw.json'
+            with span('convert_state', model=subdir):
+                if sharded:
+                    output.append(convert_state(state, tw, bdata_dir + '/dt', sharded=True))
+                    outputs['state'] = ['data/tw.json', 'data/dt']
+                else:
+                    output.append(convert_state(state, tw, bdata_dir + '/dt.json.zip'))
+                    outputs['state'] = ['data/tw.json', 'data/dt.json.zip']
+        if 'info' not in outputs:
+            output.append(info_stub(bdata_dir + '/info.json'))
+            outputs['info'] = ['data/info.json']
+        # tell the browser where to find the doc-topics
+        set_dt_file(bdata_dir + '/info.json', 'data/dt/manifest.json' if sharded else None)
+        if 'scaled' not in outputs:
+            # copy scaled file into data dir
+            shutil.copy(scaled, bdata_dir)
+            outputs['scaled'] = ['data/' + os.path.basename(scaled)]
+        # link the collection's shared metadata files into the data dir
+        outputs['metadata'] = []
+        for file in ['meta.csv', 'meta.csv.zip']:
+            link_or_copy(meta_dir + '/' + file, bdata_dir + '/' + file)
+            outputs['metadata'].append('data/' + file)
+        with open(sb_path + '/build-manifest.json', 'w') as f:
+            json.dump({'inputs': inputs, 'outputs': outputs}, f, indent=4)
+        # swap the finished browser into place
+        if os.path.exists(browse_path):
+            os.rename(browse_path, build_dir + '/old')
+        os.rename(sb_path, browse_path)
+    finally:
+        shutil.rmtree(build_dir, ignore_errors=True)
+    # report the final location of the files, not the build directory
+    return '\n'.join(output).replace(sb_path, browse_path)
+
+@traced()
 def create_dfrbrowser(collection, subdir_list, state_file_list, scaled_file_list,
-                      browser_meta_file, current_dir):
+                      browser_meta_file, current_dir, workers=1, template='copy', force=False,
+                      sharded=False):
     """Create a dfr-browser visualization.
 
     This notebook creates dfr-browser visualizations for all models selected
     via the `get_models()` function above. It is configured to work with
     multiple models at once organized in the WE1S default format. After
     moving a lot of data around to various appropriate subfolders, it uses
-    Andrew Goldstone's prepare_data.py script to create the necessary files
-    for a dfr-browser visualization (NOTE: WE1S does not use Goldstone's
-    dfrbrowser R package, because we wanted to keep everything in Python).
+    a Python 3 port of Andrew Goldstone's prepare_data.py script (see
+    dfrb_data.py) to create the necessary files for a dfr-browser
+    visualization (NOTE: WE1S does not use Goldstone's dfrbrowser R package,
+    because we wanted to keep everything in Python).
     We've also included some small tweaks of the language in some dfr-browser
     files so that they accord with WE1S json data (and not JSTOR data).
+    Set `workers` to a number greater than 1 to build that many browsers at
+    once, each in its own process. The messages from each browser are
+    printed together once that browser is finished.
+    Set `template` to `link` or `symlink` to share one copy of the
+    dfr-browser template files among all the browsers in the collection
+    instead of copying the template into every browser (see
+    `install_template()`). The metadata is zipped once for the whole
+    collection (see `prepare_metadata()`).
+    Browsers whose state, scaled, metadata and template files have not
+    changed since they were last built are skipped, and only the files
+    created from changed inputs are created again (see `build_browser()`).
+    Set `force` to True to rebuild every browser from scratch.
+    Set `sharded` to True for large collections, so the browsers only
+    download the doc-topics data for the topics they are showing.
+    Returns the models whose browsers could not be created.
     """
     # Take the lists of model subdirectories, state files, and scaled files
     # created via the get_models() function and iterate through each to
     # create the appropriate subdirectories for the dfrbrowser visualizations
     # within the dfr_browser module.
-    for subdir, state, scaled in zip(subdir_list, state_file_list, scaled_file_list):
-        num = re.search(r'\d+', subdir).group()
-        browse_path = current_dir + '/' + collection + '/topics' + num
-        existing = os.path.exists(browse_path)
-        if existing == True:
-            shutil.rmtree(browse_path)
-            os.makedirs(browse_path)
-        else:
-            os.makedirs(browse_path)
-        # make browser subdirectory
-        # sb_path = browse_path + '/topics'
-        sb_path = browse_path
-        existing = os.path.exists(sb_path)
-        if existing == True:
-            shutil.rmtree(sb_path)
-        # copy dfrbrowser template from scripts to project browser folder
-        dfrb_scripts = current_dir + '/dfrb_scripts'
-        shutil.copytree(dfrb_scripts, sb_path)
-        # move and rename customized js file
-        min_js = sb_path + '/js/dfb.min.js.custom'
-        min_js_new = sb_path + '/js/dfb.min.js'
-        shutil.move(min_js, min_js_new)
-        # make data dir
-        bdata_dir = sb_path + '/data'
-        os.makedirs(bdata_dir)
-        # create dfr-browser files using python script
-        prepare_data_script = sb_path + '/bin/prepare-data'
-        tw = sb_path + '/data/tw.json'
-        dt = sb_path +'/data/dt.json.zip'
-        info = sb_path + '/data/info.json'
-        # using check_output to preserve prepare_data.py output
-        output = subprocess.check_output([prepare_data_script, 'convert-state', state, '--tw', tw, '--dt', dt],
-                                         stderr=STDOUT,
-                                         universal_newlines=True)
-        print(output)
-        output = subprocess.check_output([prepare_data_script, 'info-stub', '-o', info],
-                                         stderr=STDOUT,
-                                         universal_newlines=True)
-        print(output)
-        # copy scaled file into data dir
-        shutil.copy(scaled, bdata_dir)
-        # move metadata-dfrb to {sb_path}/data, zip up and rename, delete meta.csv copy
-        meta_zip = bdata_dir + '/meta.csv.zip'
-        existing = os.path.exists(meta_zip)
-        if existing == True:
-            os.remove(meta_zip)
-        shutil.copy(browser_meta_file, bdata_dir)
-        try:
-            shutil.make_archive(os.path.join(bdata_dir, 'meta.csv'), 'zip', bdata_dir, 'meta.csv')
-        except OSError as err:
-            print('Error writing meta.csv.zip')
-            print(err)
+    models = list(zip(subdir_list, state_file_list, scaled_file_list))
+    current_span().add(len(models))
+    if template not in ('copy', 'link', 'symlink'):
+        raise ValueError('The template setting must be `copy`, `link` or `symlink`.')
+    assets = None
+    if template != 'copy':
+        assets = prepare_assets(current_dir + '/' + collection, current_dir + '/dfrb_scripts')
+    meta_dir = prepare_metadata(current_dir + '/' + collection, browser_meta_file)
+    failed = []
+    if workers > 1 and len(models) > 1:
+        # When this script is loaded with `%run` or run from the command line, its functions belong to
+        # `__main__`, which worker processes started with spawn (the default on macOS and Windows) cannot
+        # import, so the workers are given the function from the script imported by name
+        import create_dfrbrowser as module
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(module.build_browser, collection, subdir, state, scaled,
+                                       browser_meta_file, current_dir, template, assets, meta_dir, force,
+                                       sharded): subdir
+                       for subdir, state, scaled in models}
+            for future in as_completed(futures):
+                subdir = futures[future]
+                try:
+                    output = future.result()
+                    get_reporter().info('Finished browser for ' + subdir)
+                    get_reporter().text(output)
+                except Exception as err:
+                    get_reporter().error('Error creating browser for ' + subdir + ': ' + str(err))
+                    failed.append(subdir)
+    else:
+        for subdir, state, scaled in models:
+            try:
+                output = build_browser(collection, subdir, state, scaled, browser_meta_file, current_dir,
+                                       template, assets, meta_dir, force, sharded)
+                get_reporter().text(output)
+            except Exception as err:
+                get_reporter().error('Error creating browser for ' + subdir + ': ' + str(err))
+                failed.append(subdir)
+    return failed
 
             
 def get_selection(selection):
@@ -204,3 +472,36 @@ def get_selection(selection):
             selection = [selection]
     return selection
         
+
+def main(argv=None):
+    """Create the dfr-browsers for a collection's models from the command line."""
+    parser = argparse.ArgumentParser(description='Create dfr-browser visualizations of topic models.')
+    parser.add_argument('--collection', required=True, help='the name of the collection')
+    parser.add_argument('--model-dir', required=True, help='the folder containing the collections\' models')
+    parser.add_argument('--metadata-dir', required=True,
+                        help='the folder containing the collection\'s dfr-browser metadata files')
+    parser.add_argument('--selection', nargs='+', default=['All'],
+                        help='the models to create browsers for, such as topics50 (default: All)')
+    parser.add_argument('--browser-dir', default=os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir),
+                        help='the folder containing dfrb_scripts, to create the browsers in (default: the dfr-browser module)')
+    parser.add_argument('--workers', type=int, default=1, help='the number of browsers to create at once (default: 1)')
+    parser.add_argument('--template', choices=['copy', 'link', 'symlink'], default='copy',
+                        help='how to set up the dfr-browser template files (default: copy)')
+    parser.add_argument('--force', action='store_true', help='rebuild every browser from scratch')
+    parser.add_argument('--sharded', action='store_true', help='write the doc-topics in shards of topics')
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+    setup_reporting(args)
+    check_metadata(args.metadata_dir)
+    if get_reporter().num_errors:
+        return 1
+    selection = args.selection[0] if len(args.selection) == 1 else args.selection
+    subdir_list, state_file_list, scaled_file_list = get_model_state(args.collection, selection, args.model_dir)
+    failed = create_dfrbrowser(args.collection, subdir_list, state_file_list, scaled_file_list,
+                               args.metadata_dir + '/meta.csv', os.path.abspath(args.browser_dir), args.workers,
+                               args.template, args.force, args.sharded)
+    return 1 if failed or len(subdir_list) != len(state_file_list) else 0
+
+# The notebooks load this script with `%run`, which also runs it as `__main__`
+if __name__ == '__main__' and not in_ipython():
+    sys.exit(main(sys.argv[1:]))
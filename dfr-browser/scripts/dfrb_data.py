@@ -0,0 +1,220 @@
+"""dfrb_data.py.
+
+Writes the dfr-browser data files `tw.json`, `dt.json.zip` and `info.json` from topic model counts.
+
+This is a Python 3 replacement for the `convert-state` and `info-stub` commands of Andrew Goldstone's
+`prepare-data` script (in `dfrb_scripts/bin`), which we used in earlier versions of this module. It writes
+files with the same contents, but works from matrices of counts rather than reading the state file token
+by token. The counts are saved next to each model's state file as memory-mappable arrays (in
+`topic-stateN-arrays`, see `model_arrays.py`) when the model is trained or scaled in the topic-modeling module.
+If they do not exist, they are created from the state file here.
+
+Sample usage:
+convert_state(state_file, 'data/tw.json', 'data/dt.json.zip')
+info_stub('data/info.json')
+
+For use with create_dfrbrowser.ipynb v 2.0.
+
+"""
+
+import json
+import os
+import sys
+import zipfile as zf
+import numpy as np
+
+# The model arrays are shared with the topic-modeling module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'topic-modeling', 'scripts'))
+from model_arrays import model_counts
+
+def top_words(row, num_types, n=50):
+    """Get the indexes of the `n` word types with the highest counts in one row of a sparse topic-word matrix.
+
+    Word types with equal counts are listed in type index order, as in `prepare-data`. Only the nonzero
+    entries of the row are partitioned, so the cost does not depend on the size of the vocabulary.
+    """
+    data = row.data
+    indices = row.indices
+    if len(data) > n:
+        # everything above the nth largest count is in the top n; fill the rest with ties in type order
+        kth = data[np.argpartition(-data, n - 1)[n - 1]]
+        above = data > kth
+        ties = np.flatnonzero(data == kth)
+        ties = ties[np.argsort(indices[ties], kind='stable')][:n - above.sum()]
+        keep = np.concatenate([np.flatnonzero(above), ties])
+        data = data[keep]
+        indices = indices[keep]
+    order = np.lexsort((indices, -data))
+    words = indices[order]
+    weights = data[order]
+    if len(words) < n:
+        # pad with zero-count word types in type index order
+        unused = np.setdiff1d(np.arange(min(num_types, n + len(words))), words, assume_unique=True)
+        pad = unused[:n - len(words)]
+        words = np.concatenate([words, pad])
+        weights = np.concatenate([weights, np.zeros(len(pad), dtype=weights.dtype)])
+    return words, weights
+
+def topic_words(topic_term, vocab, n=50):
+    """Get the top `n` words and their weights for each topic."""
+    topic_term = topic_term.tocsr()
+    tw = []
+    for t in range(topic_term.shape[0]):
+        row = topic_term[t]
+        words, weights = top_words(row, topic_term.shape[1], n)
+        tw.append({
+            "words": [vocab[w] for w in words],
+            "weights": weights.tolist()
+        })
+    return tw
+
+def dt_matrix(doc_topic):
+    """Get the documents x topics matrix shown in dfr-browser, in compressed sparse column form.
+
+    Documents with no tokens in the state file are skipped, as in `prepare-data` (which always keeps the
+    first document, even if it is empty).
+    """
+    doc_topic = doc_topic.tocsr()
+    lengths = np.diff(doc_topic.indptr)
+    lengths[:1] = 1
+    docs = np.flatnonzero(lengths)
+    dt = doc_topic[docs].tocsc()
+    dt.sort_indices()
+    return dt
+
+def sparse_dt(doc_topic):
+    """Convert document-topic counts to dfr-browser's sparse doc-topics format."""
+    dt = dt_matrix(doc_topic)
+    return {"i": dt.indices.tolist(), "p": dt.indptr.tolist(), "x": dt.data.tolist()}
+
+def write_tw(alpha, tw, out):
+    """Write topic-words information to `out`."""
+    with open(out, "w") as f:
+        json.dump({"alpha": alpha, "tw": tw}, f)
+    return "Wrote topic-words information to " + out
+
+def write_dt(dtj, out):
+    """Write zipped sparse doc-topics to `out`."""
+    with zf.ZipFile(out, "w") as z:
+        z.writestr("dt.json", json.dumps(dtj))
+    return "Wrote sparse doc-topics to " + out
+
+def write_dt_shards(doc_topic, out_dir, topics_per_shard=1):
+    """Write sparse doc-topics to `out_dir` in shards of topics, for large collections.
+
+    Instead of one `dt.json.zip` file that has to be downloaded in full, each shard holds the documents
+    and counts for `topics_per_shard` topics as little-endian 32-bit integers (the document numbers of
+    all the topics in the shard, followed by their counts), so the browser only fetches the topics it
+    is showing. `manifest.json` lists the shards and holds the column pointers of the sparse matrix and
+    the total count of each topic. The length of each document is saved in `doc_lengths.bin`. The same
+    counts are also saved by document in `doc_topics.bin` (pairs of topic numbers and counts), with the
+    offset of each document's pairs in `doc_ptr.bin`, so the browser can fetch the topics of a single
+    document with a range request instead of downloading every shard.
+
+    Parameters:
+    - doc_topic (sparse matrix): Documents x topics counts.
+    - out_dir (str): The folder to write the shards to.
+    - topics_per_shard (int): The number of topics in each shard.
+
+    Returns:
+    - str: A description of the files written.
+    """
+    dt = dt_matrix(doc_topic)
+    os.makedirs(out_dir, exist_ok=True)
+    num_topics = dt.shape[1]
+    shards = []
+    for start in range(0, num_topics, topics_per_shard):
+        end = min(start + topics_per_shard, num_topics)
+        lo, hi = dt.indptr[start], dt.indptr[end]
+        file = "topic" + str(start) + ".bin"
+        np.concatenate([dt.indices[lo:hi], dt.data[lo:hi]]).astype("<i4").tofile(os.path.join(out_dir, file))
+        shards.append({"file": file, "start": start, "end": end})
+    np.asarray(dt.sum(axis=1)).ravel().astype("<i4").tofile(os.path.join(out_dir, "doc_lengths.bin"))
+    rows = dt.tocsr()
+    rows.sort_indices()
+    np.column_stack([rows.indices, rows.data]).astype("<i4").tofile(os.path.join(out_dir, "doc_topics.bin"))
+    rows.indptr.astype("<i4").tofile(os.path.join(out_dir, "doc_ptr.bin"))
+    with open(os.path.join(out_dir, "manifest.json"), "w") as f:
+        json.dump({
+            "format": "int32le",
+            "n_docs": dt.shape[0],
+            "n_topics": num_topics,
+            "p": dt.indptr.tolist(),
+            "col_sums": np.asarray(dt.sum(axis=0)).ravel().tolist(),
+            "doc_lengths": "doc_lengths.bin",
+            "doc_rows": {"file": "doc_topics.bin", "ptr": "doc_ptr.bin"},
+            "shards": shards
+        }, f)
+    return "Wrote " + str(len(shards)) + " doc-topics shards to " + out_dir
+
+def info_stub(out):
+    """Write a stub `info.json` to `out`."""
+    with open(out, "w") as f:
+        json.dump({
+            "title": "",
+            "meta_info": r'<h2></h2>',
+            "VIS": { "overview_words": 15 }
+            },
+            fp=f, indent=4)
+    return "Created stub file in " + out
+
+def set_dt_file(info_file, dt_file=None):
+    """Point dfr-browser to the doc-topics file `dt_file` in `info.json`.
+
+    Sharded doc-topics are loaded from their manifest (`data/dt/manifest.json`) rather than from
+    `data/dt.json.zip`. If `dt_file` is None, the setting is removed so the browser loads
+    `data/dt.json.zip`. The file is only written if the setting changes. Because `info.json` may be
+    linked from a previous build, it is replaced rather than changed in place.
+    """
+    with open(info_file) as f:
+        info = json.load(f)
+    if info.get("VIS", {}).get("files", {}).get("dt") == dt_file:
+        return
+    vis = info.setdefault("VIS", {})
+    if dt_file is None:
+        del vis["files"]["dt"]
+        if not vis["files"]:
+            del vis["files"]
+    else:
+        vis.setdefault("files", {})["dt"] = dt_file
+    os.remove(info_file)
+    with open(info_file, "w") as f:
+        json.dump(info, fp=f, indent=4)
+
+def convert_counts(counts, tw_out, dt_out, n=50, sharded=False):
+    """Write `tw.json` and `dt.json.zip` from topic model counts.
+
+    Parameters:
+    - counts (dict): The output of `aggregate_state()` or `load_model_arrays()`.
+    - tw_out (str): Path to the topic-words file to write.
+    - dt_out (str): Path to the doc-topics file to write, or the folder to write shards to if `sharded` is True.
+    - n (int): The number of top words to save for each topic.
+    - sharded (bool): Write doc-topics in shards of topics (see `write_dt_shards()`).
+
+    Returns:
+    - str: A description of the files written.
+    """
+    output = [write_tw(counts['alpha'], topic_words(counts['topic_term'], counts['vocab'], n), tw_out)]
+    if sharded:
+        output.append(write_dt_shards(counts['doc_topic'], dt_out))
+    else:
+        output.append(write_dt(sparse_dt(counts['doc_topic']), dt_out))
+    return '\n'.join(output)
+
+def convert_state(state_file, tw_out, dt_out, n=50, sharded=False):
+    """Write `tw.json` and `dt.json.zip` for a model.
+
+    Uses the arrays saved alongside the model state file if they are up to date. Otherwise reads the state
+    file and saves the arrays for next time.
+
+    Parameters:
+    - state_file (str): Path to the gzipped state file produced by MALLET.
+    - tw_out (str): Path to the topic-words file to write.
+    - dt_out (str): Path to the doc-topics file to write, or the folder to write shards to if `sharded` is True.
+    - n (int): The number of top words to save for each topic.
+    - sharded (bool): Write doc-topics in shards of topics (see `write_dt_shards()`).
+
+    Returns:
+    - str: A description of the files written.
+    """
+    return convert_counts(model_counts(state_file), tw_out, dt_out, n, sharded)
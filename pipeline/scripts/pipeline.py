@@ -0,0 +1,334 @@
+"""pipeline.py.
+
+Run the stages of a workflow as a dependency graph, skipping the stages whose results are up to date.
+
+A `Stage` names the function that carries it out, the stages it depends on, and the files or folders it reads
+(`inputs`) and creates (`outputs`). When a stage finishes, the `Pipeline` saves the sha1 hashes of its inputs
+and outputs to a state file. The next time the pipeline is run, a stage is skipped if its settings, its inputs
+and the outputs of the stages it depends on have the same hashes as when it last finished, and its outputs
+have not changed since. Otherwise the stage is run again, and so are the stages that depend on it.
+
+Stages that do not depend on each other, such as the stages for different models, can be run at the same
+time in separate processes. The messages each stage reports (see `report.py`) are collected in its process
+and reported together when the stage finishes, so the output of different stages is not interleaved. If a
+stage fails, the stages that depend on it are skipped, but the rest of the pipeline is still run. The state
+file is saved after every stage, so running the pipeline again resumes from the stages that failed or were
+not reached.
+
+Sample usage:
+pipeline = Pipeline('pipeline-state.json')
+pipeline.add(Stage('prepare', prepare_data, kwargs={...}, inputs=[json_dir], outputs=[doc_terms]))
+pipeline.add(Stage('import', import_data, kwargs={...}, deps=['prepare'], inputs=[doc_terms], outputs=[mallet_file]))
+results = pipeline.run(workers=4)
+
+For use with we1s_pipeline.py.
+
+"""
+
+import hashlib
+import json
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from time import time
+
+# The reporter, timer and file hashing are shared with the topic-modeling module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'topic-modeling', 'scripts'))
+from model_catalog import file_info
+from report import SilentReporter, get_reporter, set_reporter
+from timer import format_seconds, span
+
+class Stage:
+    """A stage of a pipeline."""
+
+    def __init__(self, name, func, kwargs=None, deps=(), inputs=(), outputs=(), params=None):
+        """Describe the stage.
+
+        Parameters:
+        - name (str): The name of the stage. Must be unique in the pipeline.
+        - func (function): The function that carries out the stage. It is called with `kwargs`, and must be
+          defined at the top level of a module so that it can be run in another process.
+        - kwargs (dict): The arguments to call `func` with.
+        - deps (list): The names of the stages that must finish before this one starts.
+        - inputs (list): The files and folders the stage reads. Missing inputs are hashed as missing.
+        - outputs (list): The files and folders the stage creates.
+        - params (dict): Settings that change the stage's results. By default, `kwargs`.
+        """
+        self.name = name
+        self.func = func
+        self.kwargs = dict(kwargs or {})
+        self.deps = list(deps)
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.params = self.kwargs if params is None else params
+
+def run_stage(func, kwargs, capture=False):
+    """Run a stage's function.
+
+    Parameters:
+    - func (function): The function.
+    - kwargs (dict): Its arguments.
+    - capture (bool): Collect the messages the function reports instead of reporting them (for stages run in
+      another process).
+
+    Returns:
+    - dict: The `status` (`ok` or `error`), the `error` message if the stage failed, the time taken
+      (`seconds`) and, if captured, the messages reported (`records`).
+    """
+    previous = set_reporter(SilentReporter()) if capture else None
+    start = time()
+    result = {'status': 'ok'}
+    try:
+        func(**kwargs)
+    except Exception as err:
+        result = {'status': 'error', 'error': type(err).__name__ + ': ' + str(err)}
+    result['seconds'] = time() - start
+    if capture:
+        result['records'] = set_reporter(previous).records
+    return result
+
+class Pipeline:
+    """Run stages in the order of their dependencies, skipping those that are up to date."""
+
+    def __init__(self, state_file):
+        """Create the pipeline.
+
+        Parameters:
+        - state_file (str): Path to the json file in which the hashes and status of each stage are saved.
+        """
+        self.state_file = state_file
+        self.stages = {}
+        self.state = self.load_state()
+
+    def add(self, stage):
+        """Add a stage to the pipeline."""
+        if stage.name in self.stages:
+            raise ValueError('There is already a stage named ' + stage.name + '.')
+        self.stages[stage.name] = stage
+        return stage
+
+    def load_state(self):
+        """Load the state file, or return an empty state if there is none."""
+        try:
+            with open(self.state_file) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {'stages': {}, 'files': {}}
+
+    def save_state(self):
+        """Save the state file, replacing the old one only once the new one is written."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_file)), exist_ok=True)
+        with open(self.state_file + '.tmp', 'w') as f:
+            json.dump(self.state, f, indent=4, sort_keys=True)
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    def file_hash(self, path):
+        """Return the sha1 hash of a file, reusing the hash saved in the state if the file has not changed."""
+        path = os.path.abspath(path)
+        info = file_info(path, self.state['files'].get(path))
+        self.state['files'][path] = info
+        return info['sha1']
+
+    def path_hash(self, path):
+        """Return a hash of the contents of a file or folder, or None if it does not exist.
+
+        A folder's hash covers the relative path and contents of every file in it, and the target of every
+        symbolic link. The hash is saved in the state with the sizes and modification times of the files, and
+        reused while they are the same, so a large folder is only read again when something in it changes.
+        """
+        if os.path.islink(path):
+            return 'link:' + os.readlink(path)
+        if os.path.isfile(path):
+            return self.file_hash(path)
+        if not os.path.isdir(path):
+            return None
+        entries = []
+        for root, dirs, files in os.walk(path):
+            dirs.sort()
+            for name in sorted(dirs + files):
+                item = os.path.join(root, name)
+                if os.path.islink(item):
+                    entries.append((os.path.relpath(item, path), 'link:' + os.readlink(item), None))
+                elif os.path.isfile(item):
+                    stat = os.stat(item)
+                    entries.append((os.path.relpath(item, path), stat.st_size, stat.st_mtime))
+        fingerprint = hashlib.sha1(json.dumps(entries).encode('utf-8')).hexdigest()
+        key = os.path.abspath(path)
+        previous = self.state['files'].get(key)
+        if previous is not None and previous.get('fingerprint') == fingerprint:
+            return previous['sha1']
+        digest = hashlib.sha1()
+        for relpath, size, mtime in entries:
+            if mtime is None:
+                entry = size
+            else:
+                entry = file_info(os.path.join(path, relpath))['sha1']
+            digest.update((relpath + '\0' + entry + '\n').encode('utf-8'))
+        self.state['files'][key] = {'fingerprint': fingerprint, 'sha1': digest.hexdigest()}
+        return digest.hexdigest()
+
+    def signature(self, stage):
+        """Return a hash of a stage's settings, its inputs and the outputs of the stages it depends on."""
+        description = {
+            'params': stage.params,
+            'inputs': {path: self.path_hash(path) for path in stage.inputs},
+            'deps': {dep: self.state['stages'].get(dep, {}).get('outputs') for dep in stage.deps}
+        }
+        return hashlib.sha1(json.dumps(description, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def up_to_date(self, stage, signature):
+        """Return True if a stage last finished with the same signature and its outputs have not changed."""
+        record = self.state['stages'].get(stage.name)
+        if record is None or record.get('status') != 'ok' or record.get('signature') != signature:
+            return False
+        return all(self.path_hash(path) == record['outputs'].get(path) for path in stage.outputs)
+
+    def order(self, targets=None):
+        """Return the names of the stages to run, with every stage after the stages it depends on.
+
+        Parameters:
+        - targets (list): Only include these stages and the stages they depend on. By default, all stages.
+        """
+        for stage in self.stages.values():
+            for dep in stage.deps:
+                if dep not in self.stages:
+                    raise ValueError('Stage ' + stage.name + ' depends on unknown stage ' + dep + '.')
+        ordered = []
+        visiting = set()
+        def visit(name):
+            if name in ordered:
+                return
+            if name in visiting:
+                raise ValueError('The pipeline has a cycle at stage ' + name + '.')
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            ordered.append(name)
+        for name in (targets if targets is not None else self.stages):
+            if name not in self.stages:
+                raise ValueError('There is no stage named ' + name + '.')
+            visit(name)
+        return ordered
+
+    def dependents(self, names):
+        """Return the given stages and every stage that depends on them, directly or not."""
+        found = set(names)
+        changed = True
+        while changed:
+            changed = False
+            for stage in self.stages.values():
+                if stage.name not in found and any(dep in found for dep in stage.deps):
+                    found.add(stage.name)
+                    changed = True
+        return found
+
+    def finish(self, stage, signature, result):
+        """Record the result of a stage that has run and report it."""
+        reporter = get_reporter()
+        for record in result.pop('records', []):
+            fields = {key: value for key, value in record.items() if key not in ('time', 'level', 'text')}
+            reporter.emit(record['level'], record['text'], **fields)
+        if result['status'] == 'ok':
+            missing = [path for path in stage.outputs if not os.path.exists(path)]
+            if missing:
+                result = {'status': 'error', 'seconds': result['seconds'],
+                          'error': 'The stage did not create ' + ', '.join(missing)}
+        record = {'status': result['status'], 'signature': signature, 'finished': time(),
+                  'seconds': result['seconds']}
+        if result['status'] == 'ok':
+            record['outputs'] = {path: self.path_hash(path) for path in stage.outputs}
+            reporter.info('Finished ' + stage.name + ' in ' + format_seconds(result['seconds']) + '.')
+        else:
+            record['error'] = result['error']
+            reporter.error('Stage ' + stage.name + ' failed: ' + result['error'])
+        self.state['stages'][stage.name] = record
+        self.save_state()
+        return record['status']
+
+    def run(self, targets=None, force=(), workers=1):
+        """Run the stages that are not up to date.
+
+        Parameters:
+        - targets (list): Only run these stages and the stages they depend on. By default, all stages.
+        - force (list): Run these stages and the stages that depend on them even if they are up to date.
+        - workers (int): The number of stages to run at the same time, each in its own process. With 1, the
+          stages are run one at a time in this process.
+
+        Returns:
+        - dict: The status of each stage: `ok` (run), `up to date` (skipped), `error` (failed) or `skipped`
+          (because a stage it depends on failed).
+        """
+        names = self.order(targets)
+        forced = self.dependents(force)
+        status = {}
+        waiting = list(names)
+        running = {}
+        executor = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+        try:
+            with span('pipeline', items=len(names)) as timer:
+                while waiting or running:
+                    started = False
+                    # start every stage whose dependencies have finished
+                    for name in list(waiting):
+                        stage = self.stages[name]
+                        if any(status.get(dep) in ('error', 'skipped') for dep in stage.deps):
+                            status[name] = 'skipped'
+                            waiting.remove(name)
+                            started = True
+                            get_reporter().warning('Skipping ' + name + ' because a stage it depends on failed.')
+                            continue
+                        if not all(status.get(dep) in ('ok', 'up to date') for dep in stage.deps):
+                            continue
+                        if executor is not None and len(running) >= workers:
+                            break
+                        waiting.remove(name)
+                        started = True
+                        signature = self.signature(stage)
+                        if name not in forced and self.up_to_date(stage, signature):
+                            status[name] = 'up to date'
+                            get_reporter().text(name + ' is up to date.')
+                            continue
+                        get_reporter().text('Running ' + name + '...')
+                        if executor is None:
+                            with span('stage', stage=name):
+                                result = run_stage(stage.func, stage.kwargs)
+                            status[name] = self.finish(stage, signature, result)
+                        else:
+                            future = executor.submit(run_stage, stage.func, stage.kwargs, True)
+                            running[future] = (name, signature)
+                    if running:
+                        done, pending = wait(list(running), return_when=FIRST_COMPLETED)
+                        for future in done:
+                            name, signature = running.pop(future)
+                            try:
+                                result = future.result()
+                            except Exception as err:
+                                result = {'status': 'error', 'seconds': 0.0,
+                                          'error': type(err).__name__ + ': ' + str(err)}
+                            status[name] = self.finish(self.stages[name], signature, result)
+                    elif not started:
+                        # nothing is running and nothing else can start
+                        break
+                timer.add(sum(1 for value in status.values() if value == 'ok'))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return status
+
+    def status(self):
+        """Return the last recorded status of each stage, without running anything.
+
+        Returns:
+        - dict: For each stage, its `status` when it last ran (`ok` or `error`, or `not run`), when it
+          finished and, if it failed, the error.
+        """
+        summary = {}
+        for name in self.order():
+            record = self.state['stages'].get(name)
+            if record is None:
+                summary[name] = {'status': 'not run'}
+            else:
+                summary[name] = {key: record[key] for key in ('status', 'finished', 'seconds', 'error')
+                                 if key in record}
+        return summary
@@ -0,0 +1,250 @@
+"""we1s_pipeline.py.
+
+Run the whole workflow of this repo, from `json.zip` to dfr-browsers, as a pipeline (see `pipeline.py`).
+
+The stages are the steps the notebooks take one at a time:
+
+- `extract`: unpack `json.zip` (`extract_data()`, only if a zip file is given)
+- `prepare`: create the collection's doc-terms file (`prepare_data()`)
+- `metadata`: create the dfr-browser metadata files (`dfrb_metadata()`)
+- `import_N`: import the doc-terms file to MALLET for the model with N topics (`Mallet.import_data()`)
+- `train_N`: train the model and save its results as arrays (`Mallet.train()`)
+- `scale_N`: create the model's `topic_scaled.csv` file (`scale()`)
+- `browser_assets`: zip the collection's dfr-browser metadata (`prepare_metadata()`)
+- `browser_N`: create the model's dfr-browser (`build_browser()`)
+
+Each stage only depends on the stages it needs, so the metadata is created while the doc-terms file is
+imported and the models are trained, scaled and turned into browsers side by side. Stages whose inputs and
+settings have not changed since they last finished are skipped, and a failed run resumes from the stages that
+failed.
+
+Sample usage:
+pipeline = build_pipeline(make_config('../data', 'c33', [25, 50]))
+pipeline.run(workers=4)
+
+Or from the command line, in the repo folder:
+python pipeline/scripts/we1s_pipeline.py --data-dir data --collection c33 --topics 25 50 --workers 4
+
+"""
+
+import argparse
+import importlib.util
+import os
+import shutil
+import sys
+
+REPO_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir))
+
+# The scripts folders of the modules whose stages are run
+for module in ['topic-modeling', 'dfr-browser']:
+    sys.path.append(os.path.join(REPO_DIR, module, 'scripts'))
+
+from pipeline import Pipeline, Stage
+from model_catalog import default_model_vars, state_arrays_dir
+from report import add_report_arguments, get_reporter, setup_reporting
+
+def load_prepare_data():
+    """Import `prepare-data/scripts/prepare-data.py`, whose name is not a valid module name."""
+    spec = importlib.util.spec_from_file_location('prepare_data',
+                                                  os.path.join(REPO_DIR, 'prepare-data', 'scripts', 'prepare-data.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def extract(json_zip, data_dir):
+    """Unpack `json.zip`, replacing the json folder if it exists."""
+    if os.path.exists(data_dir + '/json'):
+        shutil.rmtree(data_dir + '/json')
+    load_prepare_data().extract_data(json_zip, data_dir)
+
+def prepare(json_dir, import_file, strip_digits, stoplist_file, log_file, filelist_file):
+    """Create the doc-terms file."""
+    os.makedirs(os.path.dirname(os.path.abspath(import_file)), exist_ok=True)
+    load_prepare_data().prepare_data(json_dir, import_file, strip_digits, stoplist_file, log_file, filelist_file)
+
+def metadata(json_dir, metadata_dir, filelist_file):
+    """Create the dfr-browser metadata files."""
+    load_prepare_data().dfrb_metadata(metadata_dir, metadata_dir + '/metadata-dfrb.csv', metadata_dir + '/meta.temp.csv',
+                                      metadata_dir + '/meta.csv', os.path.abspath(json_dir), filelist_file)
+
+def make_mallet(model_dir, collection, import_file, topics, iterations, optimize_interval, random_seed):
+    """Create a `Mallet` object for a single model."""
+    from mallet import Mallet
+    return Mallet([topics], model_dir, import_file, collection, num_iterations=iterations,
+                  optimize_interval=optimize_interval, random_seed=random_seed)
+
+def import_model(topics, **settings):
+    """Import the doc-terms file to MALLET for one model."""
+    if not make_mallet(topics=topics, **settings).import_data(str(topics)):
+        raise RuntimeError('MALLET could not import ' + settings['import_file'] + '.')
+
+def train_model(topics, **settings):
+    """Train one model."""
+    make_mallet(topics=topics, **settings).train(str(topics))
+
+def scale_model(model_dir, collection, topics):
+    """Scale the topics of one model."""
+    from scale_topics import get_model_vars, scale
+    scale(get_model_vars([topics], model_dir, collection), model_dir, collection)
+
+def browser_assets(collection, browser_dir, browser_meta_file, template):
+    """Zip the collection's dfr-browser metadata, and copy the shared template if the browsers link to it."""
+    from create_dfrbrowser import prepare_assets, prepare_metadata
+    prepare_metadata(browser_dir + '/' + collection, browser_meta_file)
+    if template != 'copy':
+        prepare_assets(browser_dir + '/' + collection, browser_dir + '/dfrb_scripts')
+
+def build_model_browser(collection, topics, state_file, scaled_file, browser_meta_file, browser_dir, template, sharded):
+    """Create the dfr-browser for one model, with the metadata zipped by `browser_assets()`."""
+    from create_dfrbrowser import build_browser, shared_metadata_dir
+    assets = None if template == 'copy' else browser_dir + '/' + collection + '/assets'
+    meta_dir = shared_metadata_dir(browser_dir + '/' + collection)
+    if meta_dir is None:
+        raise RuntimeError('The metadata for ' + collection + ' has not been zipped. Run the browser_assets stage first.')
+    get_reporter().text(build_browser(collection, 'topics' + str(topics), state_file, scaled_file, browser_meta_file,
+                                      browser_dir, template, assets, meta_dir, sharded=sharded))
+
+def make_config(data_dir, collection, topics, **settings):
+    """Return the settings of the pipeline, with the paths the notebooks use for anything not given.
+
+    Parameters:
+    - data_dir (str): The repo data directory.
+    - collection (str): The name of the collection (`c33`, for instance).
+    - topics (list): The numbers of topics of the models to train.
+    - settings: Any of the other keys of the returned dict.
+
+    Returns:
+    - dict: The settings.
+    """
+    config = {
+        'data_dir': data_dir,
+        'collection': collection,
+        'topics': [int(topic_num) for topic_num in topics],
+        'json_zip': None,
+        'json_dir': data_dir + '/json',
+        'import_file': data_dir + '/doc-terms/' + collection + '-doc-terms-new.txt',
+        'stoplist_file': None,
+        'strip_digits': False,
+        'filelist_file': None,
+        'log_file': data_dir + '/prepare-data-log-' + collection + '.txt',
+        'metadata_dir': data_dir + '/metadata-' + collection,
+        'model_dir': data_dir + '/models',
+        'iterations': 1000,
+        'optimize_interval': 10,
+        'random_seed': 10,
+        'browser_dir': REPO_DIR + '/dfr-browser',
+        'template': 'copy',
+        'sharded': False,
+        'state_file': data_dir + '/pipeline-' + collection + '.json'
+    }
+    for key, value in settings.items():
+        if key not in config:
+            raise ValueError('Unknown setting ' + key + '.')
+        if value is not None:
+            config[key] = value
+    return config
+
+def build_pipeline(config):
+    """Create the pipeline for a collection (see `make_config()` for the settings)."""
+    pipeline = Pipeline(config['state_file'])
+    collection = config['collection']
+    json_dir = config['json_dir']
+    import_file = config['import_file']
+    browser_meta_file = config['metadata_dir'] + '/meta.csv'
+    collection_browsers = config['browser_dir'] + '/' + collection
+    data_deps = []
+    if config['json_zip'] is not None:
+        pipeline.add(Stage('extract', extract, {'json_zip': config['json_zip'], 'data_dir': config['data_dir']},
+                           inputs=[config['json_zip']], outputs=[config['data_dir'] + '/json']))
+        data_deps = ['extract']
+    filelist = [config['filelist_file']] if config['filelist_file'] else []
+    pipeline.add(Stage('prepare', prepare,
+                       {'json_dir': json_dir, 'import_file': import_file, 'strip_digits': config['strip_digits'],
+                        'stoplist_file': config['stoplist_file'], 'log_file': config['log_file'],
+                        'filelist_file': config['filelist_file']},
+                       deps=data_deps,
+                       inputs=[json_dir] + filelist + ([config['stoplist_file']] if config['stoplist_file'] else []),
+                       outputs=[import_file]))
+    pipeline.add(Stage('metadata', metadata,
+                       {'json_dir': json_dir, 'metadata_dir': config['metadata_dir'],
+                        'filelist_file': config['filelist_file']},
+                       deps=data_deps, inputs=[json_dir] + filelist, outputs=[browser_meta_file]))
+    pipeline.add(Stage('browser_assets', browser_assets,
+                       {'collection': collection, 'browser_dir': config['browser_dir'],
+                        'browser_meta_file': browser_meta_file, 'template': config['template']},
+                       deps=['metadata'], inputs=[browser_meta_file, config['browser_dir'] + '/dfrb_scripts'],
+                       outputs=[collection_browsers + '/metadata']))
+    settings = {key: config[key] for key in ['model_dir', 'import_file', 'iterations', 'optimize_interval',
+                                             'random_seed']}
+    settings['collection'] = collection
+    for topics in config['topics']:
+        num = str(topics)
+        model_vars = default_model_vars(num)
+        subdir = config['model_dir'] + '/' + collection + '/topics' + num
+        state_file = subdir + '/' + model_vars['model_state']
+        scaled_file = subdir + '/topic_scaled.csv'
+        pipeline.add(Stage('import_' + num, import_model, dict(settings, topics=topics),
+                           params={'topics': topics},
+                           deps=['prepare'], inputs=[import_file], outputs=[subdir + '/' + model_vars['model_file']]))
+        pipeline.add(Stage('train_' + num, train_model, dict(settings, topics=topics),
+                           params={'topics': topics, 'iterations': config['iterations'],
+                                   'optimize_interval': config['optimize_interval'],
+                                   'random_seed': config['random_seed']},
+                           deps=['import_' + num],
+                           outputs=[subdir + '/' + model_vars[key] for key in
+                                    ['model_state', 'model_keys', 'model_composition', 'model_counts']] +
+                                   [state_arrays_dir(state_file)]))
+        pipeline.add(Stage('scale_' + num, scale_model,
+                           {'model_dir': config['model_dir'], 'collection': collection, 'topics': topics},
+                           deps=['train_' + num], outputs=[scaled_file]))
+        pipeline.add(Stage('browser_' + num, build_model_browser,
+                           {'collection': collection, 'topics': topics, 'state_file': state_file,
+                            'scaled_file': scaled_file, 'browser_meta_file': browser_meta_file,
+                            'browser_dir': config['browser_dir'], 'template': config['template'],
+                            'sharded': config['sharded']},
+                           params={'template': config['template'], 'sharded': config['sharded']},
+                           deps=['scale_' + num, 'browser_assets'], inputs=[config['browser_dir'] + '/dfrb_scripts'],
+                           outputs=[collection_browsers + '/topics' + num]))
+    return pipeline
+
+def main(argv=None):
+    """Run the pipeline from the command line."""
+    parser = argparse.ArgumentParser(description='Run the WE1S workflow from json documents to dfr-browsers.')
+    parser.add_argument('--data-dir', required=True, help='the repo data directory')
+    parser.add_argument('--collection', required=True, help='the name of the collection')
+    parser.add_argument('--topics', type=int, nargs='+', required=True, help='the numbers of topics to model')
+    parser.add_argument('--json-zip', help='unpack this zip of json files first')
+    parser.add_argument('--stoplist', help='a file of words to leave out of the doc-terms file')
+    parser.add_argument('--filelist', help='a file listing the json files to include')
+    parser.add_argument('--iterations', type=int, help='the number of training iterations (default: 1000)')
+    parser.add_argument('--browser-dir', help='the dfr-browser folder (default: the repo\'s dfr-browser folder)')
+    parser.add_argument('--template', choices=['copy', 'link', 'symlink'],
+                        help='how to set up the dfr-browser template files (default: copy)')
+    parser.add_argument('--sharded', action='store_true', help='write the browsers\' doc-topics in shards')
+    parser.add_argument('--state-file', help='the pipeline state file (default: {data-dir}/pipeline-{collection}.json)')
+    parser.add_argument('--workers', type=int, default=1, help='the number of stages to run at once (default: 1)')
+    parser.add_argument('--targets', nargs='+', help='only run these stages and the stages they depend on')
+    parser.add_argument('--force', nargs='+', default=[],
+                        help='run these stages and the stages that depend on them even if they are up to date')
+    parser.add_argument('--status', action='store_true', help='show the status of each stage and exit')
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+    setup_reporting(args)
+    config = make_config(args.data_dir, args.collection, args.topics, json_zip=args.json_zip,
+                         stoplist_file=args.stoplist, filelist_file=args.filelist, iterations=args.iterations,
+                         browser_dir=args.browser_dir, template=args.template, sharded=args.sharded or None, state_file=args.state_file)
+    pipeline = build_pipeline(config)
+    if args.status:
+        for name, record in pipeline.status().items():
+            get_reporter().text(name + ': ' + record['status'] + (' (' + record['error'] + ')' if 'error' in record else ''))
+        return 0
+    status = pipeline.run(args.targets, args.force, args.workers)
+    failed = [name for name, value in status.items() if value in ('error', 'skipped')]
+    if failed:
+        get_reporter().error('Stages not completed: ' + ', '.join(failed) + '. Run the pipeline again to resume.')
+        return 1
+    get_reporter().heading('Done!')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
@@ -6,21 +6,32 @@ one per document in the collection. Each row is a space-separated, alphabetized
 Sample usage:
 prepare_data(json_dir, import_file_path, strip_digits, stoplist_file, log_file, filelist_file=None)
 
+Each stage can also be run from the command line:
+python prepare-data.py extract --json-zip data/json.zip --data-dir data
+python prepare-data.py prepare --json-dir data/json --import-file data/doc-terms/c33-doc-terms-new.txt --stoplist stoplist.txt
+python prepare-data.py metadata --json-dir data/json --metadata-dir data/metadata-c33
+
 For use with prepare-data.ipynb v 2.1.
 """
 
+import argparse
 import json
 import os
 import re
 import shutil
 import csv
 import string
-import unidecode
+import sys
 from zipfile import ZipFile
-from IPython.display import display, HTML
+
+# The stage timer and reporter are shared with the topic-modeling module
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, os.pardir, 'topic-modeling', 'scripts'))
+from report import add_report_arguments, get_reporter, in_ipython, setup_reporting
+from timer import current_span, span, traced
 
 def extract_data(json_zip, data_dir):
-    """Unpack json.zip and its subdirectories."""
+    """Unpack json.zip and its subdirectories into the `json` folder of `data_dir`."""
+    json_dir_new = data_dir + '/json'
     os.makedirs(json_dir_new)
     shutil.unpack_archive(json_zip, extract_dir=json_dir_new)
     for item in os.listdir(json_dir_new):
@@ -30,10 +41,14 @@ def extract_data(json_zip, data_dir):
             os.makedirs(subdir_path)
         shutil.unpack_archive(item_path, extract_dir=subdir_path)
         os.remove(item_path)
-    display(HTML('<h4>Done!</h4>'))
+    get_reporter().heading('Done!')
     
 def prepare_data(json_dir, import_file_path, strip_digits, stoplist_file, log_file, filelist_file):
-    """Prepare a file or directory for import."""
+    """Prepare a file or directory for import.
+
+    Errors with individual files are written to `log_file` and reported once per kind of error, with the
+    number of files it happened with.
+    """
     log = []
     stoplist, log = load_stoplist(stoplist_file, log)
     if os.path.exists(import_file_path):
@@ -56,7 +71,7 @@ def prepare_data(json_dir, import_file_path, strip_digits, stoplist_file, log_fi
         if len(missing) > 0:
             for x in missing:
                 log.append(x + ',Could not find file in json directory.\n')
-                display(HTML('<p style="color: red;">Error! Could not find file in json directory. See log file for more details.</p>'))
+                get_reporter().count_error('Could not find file in json directory.', x)
     else:
         files = []
         for item in os.listdir(json_dir):
@@ -64,15 +79,17 @@ def prepare_data(json_dir, import_file_path, strip_digits, stoplist_file, log_fi
             for file in os.listdir(item_path):
                 file_path = item_path + '/' + file
                 files.append(file_path)
-    for i, file in enumerate(files):
-        doc, log = read_manifest(file, log)
-        log = prepare_data_file(doc, file, i, strip_digits, stoplist, import_file_path, log)
+    with span('prepare_data', items=len(files)):
+        for i, file in enumerate(files):
+            doc, log = read_manifest(file, log)
+            log = prepare_data_file(doc, file, i, strip_digits, stoplist, import_file_path, log)
+    get_reporter().report_errors('See log file for more details.')
     if len(log) > 0:
-        print(str(len(log)) + ' total errors. See log file for more details.')
+        get_reporter().text(str(len(log)) + ' total errors. See log file for more details.')
         log = ''.join(log)
         with open(log_file, 'w') as f:
             f.write(log)
-    display(HTML('<h4>Done!</h4>'))
+    get_reporter().heading('Done!')
     
 def load_stoplist(stoplist_file, log):
     """Load the stoplist.
@@ -86,7 +103,8 @@ def load_stoplist(stoplist_file, log):
                 stoplist = f.read().split('\n')
         except IOError:
             log.append(stoplist_file + ',Could not read stoplist file.\n')
-            display(HTML('<p style="color: red;">Error! Could not read stoplist file. See log file for more details.</p>'))
+            get_reporter().count_error('Could not read stoplist file.', stoplist_file)
+            stoplist = []
     else:
         stoplist = []
     return stoplist, log
@@ -98,7 +116,7 @@ def read_manifest(filepath, log):
             doc = json.loads(f.read())
     except (FileNotFoundError, ValueError):
         log.append(filepath + ',Could not read file.\n')
-        display(HTML('<p style="color: red;">Error! Could not read file. See log file for more details.</p>'))
+        get_reporter().count_error('Could not read file.', filepath)
         doc = None
     return doc, log
 
@@ -123,6 +141,7 @@ def get_bow_row(filename, index, bag, strip_digits, stoplist, log):
     - bag (dict): A bag of words dict of the format `{word: count}`.
     """
     row = filename + ' ' + str(index) + ' '
+    bow_row = None
     if bag is not None:
         try:
             for k, v in bag.items():
@@ -150,9 +169,9 @@ def get_bow_row(filename, index, bag, strip_digits, stoplist, log):
                     else:
                         pass
                     bow_row = row.strip()
-        except (RuntimeError, TypeError):
+        except (AttributeError, RuntimeError, TypeError):
             log.append(filename + ',Could not generate row from bag of words.\n')
-            display(HTML('<p style="color: red;">Error! Could not generate row from bag of words. See log file for more details.</p>'))
+            get_reporter().count_error('Could not generate row from bag of words.', filename)
     else:
         bow_row = None
     return bow_row, log
@@ -165,7 +184,7 @@ def save(bow_row, import_file_path, log):
                 f.write(bow_row.strip() + '\n')
         except IOError:
             log.append(import_file_path + ',Could not append row to import file.\n')
-            display(HTML('<p style="color: red;">Error! Could not append row to import file. See log file for more details.</p>'))
+            get_reporter().count_error('Could not append row to import file.', import_file_path)
     else:
         pass
     return log
@@ -200,6 +219,7 @@ def year_from_fpath(file):
         year = '1900'
     return year
 
+@traced()
 def dfrb_metadata(metadata_dir, metadata_csv_file, browser_meta_file_temp,
                   browser_meta_file, json_dir, filelist_file):
     """Produce dfr-browser metadata csvs.
@@ -259,19 +279,20 @@ def dfrb_metadata(metadata_dir, metadata_csv_file, browser_meta_file_temp,
                     files_all.append(file_path)
             sorted_json = sorted(f for f in files_all if os.path.basename(f) in files and f.endswith('.json'))
         idx=0
+        current_span().add(len(sorted_json))
         for filename in sorted_json:
             # log: preview the first and last files only to prevent log overflow
             if(idx < 5 or idx > len(sorted_json) - 5):
-                print(idx, ':', filename, '\n')
+                get_reporter().text(str(idx) + ' : ' + filename + '\n')
             if(idx == 5 and len(sorted_json) > 10):
-                print('...\n')
+                get_reporter().text('...\n')
             with open(os.path.join(json_dir, filename)) as f:
                 oe = False
                 try:
                     j = json.loads(f.read())
                 except:
                     oe = True
-                    print(filename + ' could not be loaded.')
+                    get_reporter().count_error('Could not load file.', filename)
                 if not 'pagerange' in j:
                     j['pagerange'] = 'no-pg'
                 if not 'author' in j:
@@ -305,7 +326,7 @@ def dfrb_metadata(metadata_dir, metadata_csv_file, browser_meta_file_temp,
                 # write article metadata to csv
                 if oe == True:
                     testrow = [filename] + [j['title']] + [j['author']] + [j['pub']] + [j['volume']] + [j['issue']] +[j['pub_date']] + [j['length']]
-                    print(testrow)
+                    get_reporter().text(str(testrow))
                 csvwriter.writerow([filename] + [j['title']] + [j['author']] + [j['pub']] + [j['volume']] +
                                    [j['issue']] + [j['pub_date']] + [j['length']])
                 oe = False
@@ -323,5 +344,41 @@ def dfrb_metadata(metadata_dir, metadata_csv_file, browser_meta_file_temp,
         with open(browser_meta_file, 'w') as fout:
             for line in fin:
                 fout.write(line.replace(',"",', ',NA,'))
+    get_reporter().report_errors()
 
+def main(argv=None):
+    """Run a stage of data preparation from the command line."""
+    parser = argparse.ArgumentParser(description='Prepare WE1S json documents for topic modeling.')
+    subparsers = parser.add_subparsers(dest='stage', required=True)
+    extract = subparsers.add_parser('extract', help='unpack json.zip')
+    extract.add_argument('--json-zip', required=True, help='the zip of json files')
+    extract.add_argument('--data-dir', required=True, help='the folder to unpack the json files in')
+    prepare = subparsers.add_parser('prepare', help='create a doc-terms file from the json files')
+    prepare.add_argument('--json-dir', required=True, help='the folder of json files')
+    prepare.add_argument('--import-file', required=True, help='the doc-terms file to create')
+    prepare.add_argument('--strip-digits', action='store_true', help='leave out terms that are numbers')
+    prepare.add_argument('--stoplist', help='a file of words to leave out, one per line')
+    prepare.add_argument('--log-file', default='prepare-data-log.txt',
+                         help='the file to list errors in (default: prepare-data-log.txt)')
+    prepare.add_argument('--filelist', help='a file listing the json files to include, one per line')
+    metadata = subparsers.add_parser('metadata', help='create the dfr-browser metadata files from the json files')
+    metadata.add_argument('--json-dir', required=True, help='the folder of json files')
+    metadata.add_argument('--metadata-dir', required=True, help='the folder to create the metadata files in')
+    metadata.add_argument('--filelist', help='a file listing the json files to include, one per line')
+    for subparser in [extract, prepare, metadata]:
+        add_report_arguments(subparser)
+    args = parser.parse_args(argv)
+    setup_reporting(args)
+    if args.stage == 'extract':
+        extract_data(args.json_zip, args.data_dir)
+    elif args.stage == 'prepare':
+        prepare_data(args.json_dir, args.import_file, args.strip_digits, args.stoplist, args.log_file, args.filelist)
+    else:
+        metadata_dir = args.metadata_dir
+        dfrb_metadata(metadata_dir, metadata_dir + '/metadata-dfrb.csv', metadata_dir + '/meta.temp.csv',
+                      metadata_dir + '/meta.csv', os.path.abspath(args.json_dir), args.filelist)
+    return 1 if get_reporter().num_errors else 0
 
+# The notebooks load this script with `%run`, which also runs it as `__main__`
+if __name__ == '__main__' and not in_ipython():
+    sys.exit(main(sys.argv[1:]))
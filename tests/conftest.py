@@ -0,0 +1,28 @@
+"""conftest.py.
+
+Shared setup for the regression tests, which check the faster versions of the code in this repo against the
+implementations they replace.
+
+The scripts folders are not packages, so each module's folder is added to `sys.path`, as the scripts do for
+each other. The tests run on a small synthetic collection made by `benchmarks/scripts/synthetic.py`.
+
+Run the tests from the repo folder:
+python -m pytest tests
+
+"""
+
+import os
+import sys
+import pytest
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir)
+
+for module in ['benchmarks', 'classification', 'comparison', 'dfr-browser', 'topic-modeling']:
+    sys.path.append(os.path.join(REPO_DIR, module, 'scripts'))
+
+@pytest.fixture(scope='session')
+def corpus(tmp_path_factory):
+    """A synthetic collection of 120 documents about 6 topics."""
+    from synthetic import generate_corpus
+    return generate_corpus(str(tmp_path_factory.mktemp('corpus')), num_docs=120, num_words=400, doc_length=60,
+                           num_topics=6)
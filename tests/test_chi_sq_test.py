@@ -0,0 +1,49 @@
+"""Check that `chi2_batch()` gives the same results as `scipy.stats.chi2_contingency`."""
+
+import numpy as np
+import pytest
+from scipy.stats import chi2_contingency
+
+@pytest.fixture(scope='module')
+def category_files(corpus, tmp_path_factory):
+    """Lists of the filenames of the synthetic documents from each of 3 sources."""
+    folder = tmp_path_factory.mktemp('categories')
+    files = {}
+    for source in range(3):
+        files['source' + str(source)] = str(folder / (str(source) + '.txt'))
+        with open(files['source' + str(source)], 'w') as f:
+            for i, filename in enumerate(corpus['filenames']):
+                if i % 3 == source:
+                    f.write(filename + '\n')
+    return files
+
+@pytest.mark.parametrize('num_categories', [2, 3])
+@pytest.mark.parametrize('correction', [True, False])
+def test_chi2_batch(corpus, category_files, num_categories, correction):
+    from chi_sq_test import chi2_batch, term_presence_tables
+    categories = dict(list(category_files.items())[:num_categories])
+    terms, tables, names = term_presence_tables(corpus['doc_terms'], categories)
+    stats, pvalues, dof = chi2_batch(tables, correction)
+    assert len(terms) == len(tables) > 0
+    tested = 0
+    for table, stat, pvalue in zip(tables, stats, pvalues):
+        if (table.sum(axis=0) == 0).any() or (table.sum(axis=1) == 0).any():
+            # scipy refuses tables with an expected frequency of zero
+            assert np.isnan(stat) and np.isnan(pvalue)
+            continue
+        expected = chi2_contingency(table, correction=correction)
+        assert stat == pytest.approx(expected[0], rel=1e-9, abs=1e-12)
+        assert pvalue == pytest.approx(expected[1], rel=1e-9, abs=1e-12)
+        assert dof == expected[2]
+        tested += 1
+    assert tested > 0
+
+def test_chi2_batch_zero_expected():
+    """A term in every document gets NaN, where scipy raises an error."""
+    from chi_sq_test import chi2_batch
+    table = np.array([[5, 3], [0, 0]])
+    with pytest.raises(ValueError):
+        chi2_contingency(table)
+    stats, pvalues, dof = chi2_batch([table, [[5, 3], [2, 6]]])
+    assert np.isnan(stats[0]) and np.isnan(pvalues[0])
+    assert stats[1] == pytest.approx(chi2_contingency([[5, 3], [2, 6]])[0])
@@ -0,0 +1,33 @@
+"""Check that `cross_validate_models()` gives the same scores as `cross_val_score` on the notebook's pipelines."""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+@pytest.fixture(scope='module')
+def training(corpus):
+    """The bags of words and labels of the synthetic training data."""
+    data = pd.read_csv(corpus['training'])
+    assert data['label'].nunique() == 2
+    return data['text'], data['label']
+
+@pytest.mark.parametrize('model', ['logreg', 'svm', 'linear_svm', 'sgd'])
+def test_cross_validate_models(training, model):
+    from sklearn.model_selection import cross_val_score
+    from classify import METRICS, cross_validate_models, make_pipeline
+    X, Y = training
+    scores = cross_validate_models(X, Y, [model], cv=5)[model]
+    for metric in METRICS:
+        expected = cross_val_score(make_pipeline(model), X, Y, cv=5, scoring=metric)
+        np.testing.assert_allclose(scores['test_' + metric], expected, rtol=1e-9, atol=1e-12)
+
+def test_vectorize_texts(training):
+    """Vectorizers fitted from term counts transform bags of words as `fit_transform()` and `transform()` do."""
+    from classify import fit_vectorizer, make_vectorizer, term_counts, vectorize_texts
+    X, Y = training
+    for model in ['logreg', 'svm', 'sgd']:
+        vect, features = fit_vectorizer(*term_counts(X[:80]), model)
+        reference = make_vectorizer(model)
+        # compared as sparse matrices, since the hashing vectorizer has a million columns
+        assert abs(features - reference.fit_transform(X[:80])).max() < 1e-12
+        assert abs(vectorize_texts(X[80:], vect) - reference.transform(X[80:])).max() < 1e-12
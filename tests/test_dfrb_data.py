@@ -0,0 +1,83 @@
+"""Check that `dfrb_data.py` writes the same files as Goldstone's `prepare-data` script.
+
+The json is compared after it is parsed, since Python 2 writes the keys of objects in no particular order.
+`prepare-data` is a Python 2 script, so these tests are skipped unless Python 2 can be run. Set the `PYTHON2`
+environment variable to the Python 2 interpreter if it is not called `python2`.
+"""
+
+import json
+import os
+import subprocess
+import zipfile
+import numpy as np
+import pytest
+
+from conftest import REPO_DIR
+
+PREPARE_DATA = os.path.join(REPO_DIR, 'dfr-browser', 'dfrb_scripts', 'bin', 'prepare-data')
+PYTHON2 = os.environ.get('PYTHON2', 'python2')
+
+def prepare_data(*args, cwd=None):
+    """Run a `prepare-data` command, skipping the test if Python 2 is not available."""
+    try:
+        subprocess.run([PYTHON2, '-c', 'pass'], check=True, capture_output=True)
+    except (OSError, subprocess.CalledProcessError):
+        pytest.skip('Python 2 is needed to run prepare-data')
+    subprocess.run([PYTHON2, PREPARE_DATA] + list(args), check=True, capture_output=True, cwd=cwd)
+
+def read_json(path):
+    """Read a json file, or the doc-topics json in a `dt.json.zip` file."""
+    if str(path).endswith('.zip'):
+        with zipfile.ZipFile(path) as z:
+            return json.loads(z.read('dt.json'))
+    with open(path) as f:
+        return json.load(f)
+
+@pytest.fixture(scope='module', params=['corpus', 'sparse'])
+def state_file(request, corpus, tmp_path_factory):
+    """The state file of the shared corpus, and of a corpus with topics of fewer than 50 words with many ties."""
+    from synthetic import generate_corpus, generate_state
+    model_dir = tmp_path_factory.mktemp('model')
+    if request.param == 'sparse':
+        corpus = generate_corpus(str(model_dir), num_docs=30, num_words=40, doc_length=4, num_topics=8, seed=1)
+    return generate_state(str(model_dir / 'topic-state.gz'), corpus)
+
+def test_convert_state(state_file, tmp_path):
+    from dfrb_data import convert_state
+    os.makedirs(tmp_path / 'ref')
+    prepare_data('convert-state', state_file, '--tw', 'ref/tw.json', '--dt', 'ref/dt.json.zip', cwd=tmp_path)
+    convert_state(state_file, str(tmp_path / 'tw.json'), str(tmp_path / 'dt.json.zip'))
+    assert read_json(tmp_path / 'tw.json') == read_json(tmp_path / 'ref' / 'tw.json')
+    assert read_json(tmp_path / 'dt.json.zip') == read_json(tmp_path / 'ref' / 'dt.json.zip')
+
+def test_info_stub(tmp_path):
+    from dfrb_data import info_stub
+    prepare_data('info-stub', '-o', str(tmp_path / 'ref-info.json'))
+    info_stub(str(tmp_path / 'info.json'))
+    assert read_json(tmp_path / 'info.json') == read_json(tmp_path / 'ref-info.json')
+
+def test_dt_shards(state_file, tmp_path):
+    """The shards and the document index hold the same counts as `dt.json.zip`."""
+    from dfrb_data import sparse_dt, write_dt_shards
+    from mallet_state import aggregate_state
+    doc_topic = aggregate_state(state_file)['doc_topic']
+    dt = sparse_dt(doc_topic)
+    write_dt_shards(doc_topic, str(tmp_path))
+    with open(tmp_path / 'manifest.json') as f:
+        manifest = json.load(f)
+    assert manifest['p'] == dt['p']
+    indices = []
+    counts = []
+    for shard in manifest['shards']:
+        values = np.fromfile(tmp_path / shard['file'], dtype='<i4')
+        indices.extend(values[:len(values) // 2].tolist())
+        counts.extend(values[len(values) // 2:].tolist())
+    assert indices == dt['i'] and counts == dt['x']
+    rows = np.fromfile(tmp_path / manifest['doc_rows']['file'], dtype='<i4').reshape(-1, 2)
+    ptr = np.fromfile(tmp_path / manifest['doc_rows']['ptr'], dtype='<i4')
+    lengths = np.fromfile(tmp_path / manifest['doc_lengths'], dtype='<i4')
+    for doc in range(manifest['n_docs']):
+        expected = [(t, dt['x'][j]) for t in range(manifest['n_topics'])
+                    for j in range(dt['p'][t], dt['p'][t + 1]) if dt['i'][j] == doc]
+        assert rows[ptr[doc]:ptr[doc + 1]].tolist() == [list(pair) for pair in expected]
+        assert lengths[doc] == sum(count for topic, count in expected)
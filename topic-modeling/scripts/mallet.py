@@ -3,36 +3,95 @@
 Generates a Mallet object for MALLET topic modelling.
 MALLET settings can be adjusted with commands like`Mallet.num_iterations = 500`.
 `Mallet.import_models()` imports data to MALLET and `Mallet.train_models()`
-trains the models.
+trains the models. After each model is trained, its results are also saved as
+memory-mappable arrays (see `model_arrays.py`).
+
+To choose the number of topics, `Mallet.sweep_models()` trains all the models for a
+few iterations, drops the worst ones by their topic coherence (from MALLET's
+diagnostics file) or LL/token, continues training the rest, and so on, so only the
+best models are trained for the full number of iterations.
+
+The models can also be imported (`import`), trained (`train`), both (`all`) or swept
+(`sweep`) from the command line:
+python mallet.py all --model-dir models --collection c14 --import-file c14-doc-terms.txt --topics 50 100
+python mallet.py sweep --model-dir models --collection c14 --import-file c14-doc-terms.txt --topics 25 50 100 150
 
 For use with model_topics.ipynb v 2.1.
 
 """
 
+import argparse
 import json
+import math
 import os
 import re
 import shlex
 import shutil
 import signal
-import ipywidgets
-from IPython.display import display, HTML
-from ipywidgets import HBox, IntProgress, Label
+import sys
+import xml.etree.ElementTree as ET
 from subprocess import check_output, CalledProcessError, PIPE, Popen, STDOUT
 
-from timer import Timer
+from model_catalog import default_model_vars, update_catalog
+from report import Progress, add_report_arguments, get_reporter, in_ipython, setup_reporting
+from timer import span
+
+# The results of a sweep are saved in the collection's models directory
+SWEEP_FILE = 'sweep.json'
 
-IntProgress(
-    description='Processing:',
-)
+# The measures of model quality `sweep_models()` can choose models by. Higher values are better for both.
+SWEEP_METRICS = ['coherence', 'll']
+
+def read_diagnostics(diagnostics_file):
+    """Read the topic diagnostics written by MALLET's `--diagnostics-file` option.
+
+    Parameters:
+    - diagnostics_file (str): Path to the diagnostics file.
+
+    Returns:
+    - list: For each topic, a dict of its diagnostics (`tokens`, `coherence`, `exclusivity`, etc.), with
+      numbers converted to floats.
+    """
+    topics = []
+    for topic in ET.parse(diagnostics_file).getroot().iter('topic'):
+        diagnostics = {}
+        for key, value in topic.attrib.items():
+            try:
+                diagnostics[key] = float(value)
+            except ValueError:
+                diagnostics[key] = value
+        topics.append(diagnostics)
+    return topics
+
+def model_quality(diagnostics_file, ll):
+    """Summarise the quality of a model.
+
+    Parameters:
+    - diagnostics_file (str): Path to the model's diagnostics file. It does not need to exist.
+    - ll (list): The model's LL/token trajectory, as pairs of iteration numbers and LL/token values.
+
+    Returns:
+    - dict: The mean coherence and exclusivity of the model's topics (None if there is no diagnostics file)
+      and its last LL/token value (`ll`, None if MALLET did not report one).
+    """
+    quality = {'coherence': None, 'exclusivity': None, 'll': ll[-1][1] if ll else None}
+    try:
+        topics = read_diagnostics(diagnostics_file)
+    except (OSError, ET.ParseError):
+        return quality
+    for key in ['coherence', 'exclusivity']:
+        values = [topic[key] for topic in topics if isinstance(topic.get(key), float)]
+        if values:
+            quality[key] = sum(values) / len(values)
+    return quality
 
 class Mallet:
     """Create a MALLET class object."""
 
     def __init__(self, num_topics, model_dir, import_file_path, collection, import_source='file', num_iterations=1000,
-                 optimize_interval=10, use_random_seed=True, random_seed=10, keep_sequence=True,
+                 optimize_interval=10, optimize_burn_in=200, use_random_seed=True, random_seed=10, keep_sequence=True,
                  preserve_case=False, token_regex='"\S+"', remove_stopwords=False, extra_stopwords=None,
-                 stoplist_file=None, generate_diagnostics=True):
+                 stoplist_file=None, generate_diagnostics=True, generate_arrays=True):
         """Initialise the object."""
         self.num_topics = num_topics # List of integers
         self.model_dir = model_dir
@@ -41,6 +100,7 @@ class Mallet:
         self.import_source = import_source
         self.num_iterations = num_iterations
         self.optimize_interval = optimize_interval
+        self.optimize_burn_in = optimize_burn_in
         self.use_random_seed = use_random_seed
         self.random_seed = random_seed
         self.keep_sequence = keep_sequence
@@ -50,14 +110,17 @@ class Mallet:
         self.extra_stopwords = extra_stopwords
         self.stoplist_file = stoplist_file
         self.generate_diagnostics = generate_diagnostics
+        self.generate_arrays = generate_arrays
         self.model_vars = {}
+        self.ll = {}
+        self.iterations_trained = {}
         self.import_command = ''
         self.train_command = ''
         try:
             self.build_subdirs()
-            display(HTML('<h4>Setup complete.</h4>'))
+            get_reporter().heading('Setup complete.')
         except RuntimeError:
-            display(HTML('<h4 style="color:red;">There was an error setting up your model directories.</h4>'))
+            get_reporter().error('There was an error setting up your model directories.')
         
     def build_subdirs(self, delete_existing=False):
         """Create subdirectories for each model and a dict to store variables for use with each model.
@@ -75,15 +138,9 @@ class Mallet:
             else:
                 if not os.path.exists(subdir):
                     os.makedirs(subdir)
-            self.model_vars[model_num_topics] = {
-                'model_file': 'topics' + model_num_topics + '.mallet',
-                'model_state': 'topic-state' + model_num_topics + '.gz',
-                'model_keys': 'keys' + model_num_topics + '.txt',
-                'model_composition': 'composition' + model_num_topics + '.txt',
-                'model_counts': 'topic_counts' + model_num_topics + '.txt',
-                'diagnostics_file': 'diagnostics' + model_num_topics + '.xml',
-                'model_topic_docs':'topic-docs' + model_num_topics + '.txt'
-            }
+            self.model_vars[model_num_topics] = default_model_vars(model_num_topics)
+        # Record the models and their files in the collection's model catalog
+        update_catalog(self.model_dir, self.collection, self.num_topics, self.model_vars)
 
     def import_data(self, num_topics):
         """Import doc-terms data to MALLET for a single model.
@@ -91,149 +148,369 @@ class Mallet:
         Parameters:
         - num_topics (str): The number of topics in the model. 
         """
-        timer = Timer()
-        # Define model variables
-        model_vars = self.model_vars[num_topics]
-        subdir = self.model_dir + '/' + self.collection +  '/topics' + num_topics
-        output_path = subdir + '/' + model_vars['model_file']        
-        # Add arguments
-        args = []
-        if self.keep_sequence == True:
-            args.append('--keep-sequence')
-        if self.preserve_case == True:
-            args.append('--preserve-case')
-        if self.remove_stopwords == True:
-            args.append('--remove-stopwords')
-        if self.extra_stopwords == True:
-            args.append('--exta-stopwords')
-        if self.token_regex is not None:
-            args.append('--token-regex ' + self.token_regex)
-        if self.stoplist_file is not None:
-            args.append('--stoplist-file ' + self.stoplist-file)
-        args = ' '.join(args)
-        mallet_import_args = '--input ' + self.import_file_path + ' --output ' + output_path + ' ' + args
-        self.import_command = 'mallet import-' + self.import_source + ' ' + mallet_import_args
-        # Perform the import
-        try:
-            # shell=True required to handle backslashes in token-regex
-            output = check_output(self.import_command, stderr=STDOUT, shell=True, universal_newlines=True)
-            display(HTML('<h4>Import for topics' + num_topics + ' complete!</h4>'))
-            print('Time elapsed: %s' % timer.get_time_elapsed())
-            return True
-        except CalledProcessError as e:
-            output = e.output.decode()
-            display(HTML('<p style="color: red;">' + output + '</p>'))
-            print('Time elapsed: %s' % timer.get_time_elapsed())
-            return False
+        with span('import_data', topics=num_topics) as timer:
+            # Define model variables
+            model_vars = self.model_vars[num_topics]
+            subdir = self.model_dir + '/' + self.collection +  '/topics' + num_topics
+            output_path = subdir + '/' + model_vars['model_file']        
+            # Add arguments
+            args = []
+            if self.keep_sequence == True:
+                args.append('--keep-sequence')
+            if self.preserve_case == True:
+                args.append('--preserve-case')
+            if self.remove_stopwords == True:
+                args.append('--remove-stopwords')
+            if self.extra_stopwords == True:
+                args.append('--exta-stopwords')
+            if self.token_regex is not None:
+                args.append('--token-regex ' + self.token_regex)
+            if self.stoplist_file is not None:
+                args.append('--stoplist-file ' + self.stoplist-file)
+            args = ' '.join(args)
+            mallet_import_args = '--input ' + self.import_file_path + ' --output ' + output_path + ' ' + args
+            self.import_command = 'mallet import-' + self.import_source + ' ' + mallet_import_args
+            # Perform the import
+            try:
+                # shell=True required to handle backslashes in token-regex
+                output = check_output(self.import_command, stderr=STDOUT, shell=True, universal_newlines=True)
+                get_reporter().heading('Import for topics' + num_topics + ' complete!')
+                get_reporter().text('Time elapsed: %s' % timer.get_time_elapsed())
+                return True
+            except CalledProcessError as e:
+                output = e.output
+                get_reporter().error(output)
+                get_reporter().text('Time elapsed: %s' % timer.get_time_elapsed())
+                return False
 
     def import_models(self, models=None):
         """Import doc_terms data to MALLET from multiple models.
         
         Parameters:
         - models (list): A list of model numbers to be imported. By default this is the number given when the object was initialised. 
+
+        Returns:
+        - list: The models that could not be imported.
         """
         if models is None:
             models = self.num_topics
+        failed = []
         for topic_num in models:
             try:
                 result = self.import_data(str(topic_num))
             except RuntimeError:
-                display(HTML('<p style="color: red;">Import failed for topics' + str(topic_num) + '. Training will be skipped for this model.</p>'))
+                result = False
+            if not result:
+                get_reporter().error('Import failed for topics' + str(topic_num) + '. Training will be skipped for this model.')
+                failed.append(topic_num)
+        return failed
 
-    def train(self, num_topics, display_output=False, capture_output=False, progress_bar=True, log_file=None):
+    def train(self, num_topics, display_output=False, capture_output=False, progress_bar=True, log_file=None,
+              num_iterations=None, input_state=None):
         """Train a single topic model.
         
         Parameters:
         - num_topics (str): The number of topics in the model.
+        - num_iterations (int): The number of iterations to train for. By default, `num_iterations`.
+        - input_state (str): A state file to continue training from, instead of starting from random topic
+          assignments. The LL/token values are added to the ones recorded for the model so far.
+
+        Returns:
+        - list: The model's LL/token trajectory (also kept in `ll`), as pairs of iteration numbers and LL/token values.
         
         Progress monitor borrowed from TETHNE: https://diging.github.io/tethne/_modules/tethne/model/corpus/mallet.html
         """
+        if num_iterations is None:
+            num_iterations = self.num_iterations
         # Define model variables
-        timer = Timer()
+        with span('train', topics=num_topics, iterations=num_iterations) as timer:
+            model_vars = self.model_vars[num_topics]
+            subdir = self.model_dir + '/' + self.collection + '/topics' + num_topics
+            mallet_file = subdir + '/' + model_vars['model_file']        
+            if input_state is None or num_topics not in self.ll:
+                self.ll[num_topics] = []
+                self.iterations_trained[num_topics] = 0
+            ll = self.ll[num_topics]
+            # MALLET numbers the iterations of each run from 1
+            first_iter = self.iterations_trained[num_topics]
+            num_iters = 0
+            prog = re.compile(u'\<([^\)]+)\>')
+            ll_prog = re.compile(r'\<(\d+)\> LL/token: ([-+]?\d+\.?\d*)')
+            command = [
+                'mallet',
+                'train-topics',
+                '--input', mallet_file,
+                '--num-topics', str(num_topics),
+                '--num-iterations', str(num_iterations),
+                '--optimize-interval', str(self.optimize_interval),
+                # MALLET counts the burn-in from the start of each run, so a continued run only waits for the
+                # part of it the model has not been trained for yet
+                '--optimize-burn-in', str(max(0, self.optimize_burn_in - first_iter)),
+                '--output-state', subdir + '/' + model_vars['model_state'],
+                '--output-topic-keys', subdir + '/' + model_vars['model_keys'],
+                '--output-doc-topics', subdir + '/' + model_vars['model_composition'],
+                '--word-topic-counts-file', subdir + '/' + model_vars['model_counts'],
+                '--output-topic-docs', subdir + '/' + model_vars['model_topic_docs']
+            ]
+            if self.use_random_seed == True:
+                # a continued run does not repeat the random numbers of the runs before it
+                command = command + ['--random-seed', str(self.random_seed + first_iter)]
+            if self.generate_diagnostics == True:
+                command = command + ['--diagnostics-file', subdir + '/' + model_vars['diagnostics_file']]
+            if input_state is not None:
+                command = command + ['--input-state', input_state]
+            self.train_command = ' '.join(command)
+            command = shlex.split(self.train_command)
+            # Simply capture the output and print it at the end
+            if capture_output == True:
+                output = check_output(command, stderr=STDOUT)
+                get_reporter().text(output.decode())
+                if log_file is not None:
+                    with open(log_file, 'w') as f:
+                        f.write(output.decode())
+                for l in output.decode().splitlines():
+                    match = ll_prog.search(l)
+                    if match:
+                        ll.append([first_iter + int(match.group(1)), float(match.group(2))])
+            # Otherwise, monitor the MALLET output in real time
+            else:
+                if progress_bar is not False and display_output == False:
+                    pbar = get_reporter().progress('topics' + str(num_topics), num_iterations)
+                else:
+                    # report each step of 10% as a message instead of a progress bar
+                    pbar = Progress(get_reporter(), 'Modeling progress', num_iterations)
+                def monitor(l):
+                    if display_output == True:
+                        get_reporter().text(l.rstrip('\n'))
+                    if log_file is not None:
+                        with open(log_file, 'a') as f:
+                            f.write(l)
+                    # Keep track of LL/token.
+                    match = ll_prog.search(l)
+                    if match:
+                        ll.append([first_iter + int(match.group(1)), float(match.group(2))])
+                    # Keep track of modeling progress
+                    try:
+                        this_iter = float(prog.match(l).groups()[0])
+                        pbar.update(this_iter)
+                    except AttributeError:  # Not every line will match.
+                        pass
+                p = Popen(command, stdout=PIPE, stderr=STDOUT)
+                while p.poll() is None:
+                    monitor(p.stdout.readline().decode())
+                # read the lines MALLET wrote after the last one read before it exited
+                for l in p.stdout:
+                    monitor(l.decode())
+                p.stdout.close()
+                if p.returncode != 0:
+                    raise CalledProcessError(p.returncode, command)
+                num_iters += num_iterations
+            # Count the iterations so the trace records the training speed
+            timer.add(num_iterations)
+            self.iterations_trained[num_topics] = first_iter + num_iterations
+            if self.generate_arrays == True:
+                self.save_arrays(num_topics)
+            update_catalog(self.model_dir, self.collection, [num_topics], self.model_vars)
+            get_reporter().heading('Training of topics' + num_topics + ' complete.')
+            get_reporter().text('Time elapsed: %s' % timer.get_time_elapsed())
+            return ll
+
+    def save_arrays(self, num_topics):
+        """Save the results of a trained model as memory-mappable arrays next to its state file.
+
+        Parameters:
+        - num_topics (str): The number of topics in the model.
+
+        Returns:
+        - bool: True if the arrays were saved.
+        """
+        # imported here because numpy, scipy and pandas are slow to import and only needed after training
+        from model_arrays import save_model_arrays
         model_vars = self.model_vars[num_topics]
         subdir = self.model_dir + '/' + self.collection + '/topics' + num_topics
-        mallet_file = subdir + '/' + model_vars['model_file']        
-        ll = []
-        num_iters = 0
-        prog = re.compile(u'\<([^\)]+)\>')
-        ll_prog = re.compile(r'(\d+)')
-        command = [
-            'mallet',
-            'train-topics',
-            '--input', mallet_file,
-            '--num-topics', str(num_topics),
-            '--num-iterations', str(self.num_iterations),
-            '--optimize-interval', str(self.optimize_interval),
-            '--output-state', subdir + '/' + model_vars['model_state'],
-            '--output-topic-keys', subdir + '/' + model_vars['model_keys'],
-            '--output-doc-topics', subdir + '/' + model_vars['model_composition'],
-            '--word-topic-counts-file', subdir + '/' + model_vars['model_counts'],
-            '--output-topic-docs', subdir + '/' + model_vars['model_topic_docs']
-        ]
-        if self.use_random_seed == True:
-            command = command + ['--random-seed', str(self.random_seed)]
-        if self.generate_diagnostics == True:
-            command = command + ['--diagnostics-file', subdir + '/' + model_vars['diagnostics_file']]
-        self.train_command = ' '.join(command)
-        command = shlex.split(self.train_command)
-        # Simply capture the output and print it at the end
-        if capture_output == True:
-            output = check_output(command, stderr=STDOUT)
-            print(output.decode())
-            if log_file is not None:
-                with open(log_file, 'w') as f:
-                    f.write(output.decode())
-        # Otherwise, monitor the MALLET output in real time
-        else:
-            if progress_bar is not False and display_output == False:
-                pbar = IntProgress(min=0, max=100) # instantiate the progress bar
-                percent = ipywidgets.HTML(value='0%')
-                display(HBox([Label('topics' + str(num_topics)), pbar, percent]))
-            p = Popen(command, stdout=PIPE, stderr=STDOUT)
-            while p.poll() is None:
-                l = p.stdout.readline().decode()
-                if display_output == True:
-                    print(l, end='')
-                if log_file is not None:
-                    with open(log_file, 'a') as f:
-                        f.write(l)
-                # Keep track of LL/topic.
-                try:
-                    this_ll = float(re.findall('([-+]\d+\.\d+)', l)[0])
-                    ll.append(this_ll)
-                except IndexError:  # Not every line will match.
-                    pass
-                # Keep track of modeling progress
-                try:
-                    this_iter = float(prog.match(l).groups()[0])
-                    progress = int(100. * this_iter/self.num_iterations)
-                    if progress_bar is not False and display_output == False:
-                        pbar.value = progress
-                        percent.value = '{0}%'.format(progress)
-                    else:
-                        if progress % 10 == 0:
-                            print('Modeling progress: {0}%.\r'.format(progress)),
-                except AttributeError:  # Not every line will match.
-                    pass
-            num_iters += self.num_iterations
-        display(HTML('<h4>Training of topics' + num_topics + ' complete.</h4>'))
-        print('Time elapsed: %s' % timer.get_time_elapsed())
+        state_file = subdir + '/' + model_vars['model_state']
+        if not os.path.isfile(state_file):
+            get_reporter().error('Could not save the arrays for topics' + num_topics + ' because MALLET did not create its state file.')
+            return False
+        with span('save_model_arrays', topics=num_topics):
+            save_model_arrays(state_file, subdir + '/' + model_vars['model_composition'])
+        return True
 
     def train_models(self, models=None, display_output=False, capture_output=False, progress_bar=True, log_file=None):
         """Train imported data for multiple models.
         
         Parameters:
         - models (list): A list of model numbers to be imported. By default this is the number given when the object was initialised.       
+
+        Returns:
+        - list: The models that could not be trained.
         """
         if models is None:
             models = self.num_topics
+        failed = []
         for topic_num in models:
-            display(HTML('<h4>Training topics' + str(topic_num) + '...</h4>'))
+            get_reporter().heading('Training topics' + str(topic_num) + '...')
             try:
                 result = self.train(str(topic_num),
                                     display_output,
                                     capture_output=capture_output,
                                     progress_bar=progress_bar,
                                     log_file=log_file)
-            except RuntimeError:
-                display(HTML('<p style="color: red;">Error! Training failed for topics' + str(topic_num) + '.</p>'))
+            except (RuntimeError, CalledProcessError):
+                get_reporter().error('Error! Training failed for topics' + str(topic_num) + '.')
+                failed.append(topic_num)
+        return failed
+
+    def sweep_models(self, models=None, initial_iterations=100, keep=0.5, metric='coherence'):
+        """Train several models with a successive-halving schedule to choose the number of topics.
+
+        All the models are trained for `initial_iterations` iterations. The models are then ranked by `metric`
+        and only the best `keep` of them (at least one) are trained further, from their saved state, until they
+        have been trained for `initial_iterations / keep` iterations in all. This is repeated, each time
+        dividing the number of models and multiplying the number of iterations, until the remaining models have
+        been trained for `num_iterations`. Once a single model is left, it is trained for the rest of the
+        iterations straight away. The LL/token trajectory and the quality of each model at each step are saved
+        in `sweep.json` in the collection's models directory.
+
+        Parameters:
+        - models (list): A list of model numbers to be trained. By default this is the number given when the object was initialised.
+        - initial_iterations (int): The number of iterations all the models are trained for.
+        - keep (float): The fraction of the models kept at each step, between 0 and 1.
+        - metric (str): How to rank the models: by the mean coherence of their topics (`coherence`, from the
+          diagnostics file) or by their LL/token (`ll`). LL/token usually improves as the number of topics grows,
+          so it is more useful for comparing models with similar numbers of topics.
+
+        Returns:
+        - dict: The results of the sweep: the metric, the best model (`best`, None if no model could be trained)
+          and, for each model, its LL/token trajectory, its quality after each step and whether it was
+          `finished`, `pruned` or `failed`.
+        """
+        if not 0 < keep < 1:
+            raise ValueError('keep must be between 0 and 1.')
+        if metric not in SWEEP_METRICS:
+            raise ValueError('metric must be one of ' + ', '.join(SWEEP_METRICS) + '.')
+        if models is None:
+            models = self.num_topics
+        candidates = [str(topic_num) for topic_num in models]
+        results = {topic_num: {'status': 'running', 'steps': [], 'll': []} for topic_num in candidates}
+        def score(topic_num):
+            value = results[topic_num]['steps'][-1][metric]
+            return -math.inf if value is None else value
+        budget = min(initial_iterations, self.num_iterations)
+        # the arrays are only saved for the models that are trained to the end
+        generate_arrays = self.generate_arrays
+        self.generate_arrays = False
+        try:
+            with span('sweep', collection=self.collection, metric=metric) as timer:
+                while candidates:
+                    for topic_num in list(candidates):
+                        subdir = self.model_dir + '/' + self.collection + '/topics' + topic_num
+                        state_file = subdir + '/' + self.model_vars[topic_num]['model_state']
+                        input_state = None
+                        if self.iterations_trained.get(topic_num, 0) > 0:
+                            # MALLET writes the new state file over the one it continues from
+                            input_state = subdir + '/resume-' + self.model_vars[topic_num]['model_state']
+                            shutil.copyfile(state_file, input_state)
+                        get_reporter().heading('Training topics' + topic_num + ' to ' + str(budget) + ' iterations...')
+                        try:
+                            self.train(topic_num, num_iterations=budget - self.iterations_trained.get(topic_num, 0),
+                                       input_state=input_state)
+                        except (RuntimeError, CalledProcessError):
+                            get_reporter().error('Error! Training failed for topics' + topic_num + '.')
+                            results[topic_num]['status'] = 'failed'
+                            candidates.remove(topic_num)
+                            continue
+                        finally:
+                            if input_state is not None and os.path.exists(input_state):
+                                os.remove(input_state)
+                        quality = model_quality(subdir + '/' + self.model_vars[topic_num]['diagnostics_file'],
+                                                self.ll[topic_num])
+                        quality['iterations'] = budget
+                        results[topic_num]['steps'].append(quality)
+                        results[topic_num]['ll'] = self.ll[topic_num]
+                    if budget >= self.num_iterations:
+                        break
+                    # keep the best models and train them for longer
+                    ranked = sorted(candidates, key=score, reverse=True)
+                    num_keep = max(1, int(math.ceil(len(ranked) * keep)))
+                    for topic_num in ranked[num_keep:]:
+                        results[topic_num]['status'] = 'pruned'
+                        get_reporter().info('Stopped training topics' + topic_num + ' after ' + str(budget) +
+                                            ' iterations (' + metric + ': ' + str(results[topic_num]['steps'][-1][metric]) + ').')
+                    candidates = ranked[:num_keep]
+                    if len(candidates) == 1:
+                        budget = self.num_iterations
+                    else:
+                        budget = min(self.num_iterations, max(budget + 1, int(budget / keep)))
+                timer.add(len(results))
+        finally:
+            self.generate_arrays = generate_arrays
+        for topic_num in candidates:
+            results[topic_num]['status'] = 'finished'
+            if self.generate_arrays == True:
+                self.save_arrays(topic_num)
+        best = max(candidates, key=score) if candidates else None
+        sweep = {'metric': metric, 'initial_iterations': initial_iterations, 'keep': keep,
+                 'num_iterations': self.num_iterations, 'best': best, 'models': results}
+        path = self.model_dir + '/' + self.collection + '/' + SWEEP_FILE
+        with open(path + '.tmp', 'w') as f:
+            json.dump(sweep, f, indent=4)
+        os.replace(path + '.tmp', path)
+        update_catalog(self.model_dir, self.collection, list(results), self.model_vars)
+        for topic_num in results:
+            steps = results[topic_num]['steps']
+            get_reporter().text('topics' + topic_num + ': ' + results[topic_num]['status'] +
+                                (' after %d iterations (coherence: %s, LL/token: %s)' %
+                                 (steps[-1]['iterations'], steps[-1]['coherence'], steps[-1]['ll']) if steps else ''))
+        if best is None:
+            get_reporter().error('Error! No model could be trained.')
+        else:
+            get_reporter().heading('The best model by ' + metric + ' is topics' + best + '.')
+        return sweep
+
+def main(argv=None):
+    """Import or train models from the command line."""
+    parser = argparse.ArgumentParser(description='Import data to MALLET and train topic models.')
+    parser.add_argument('stage', choices=['import', 'train', 'all', 'sweep'],
+                        help='import the doc-terms file, train the imported models, both, or import the doc-terms '
+                             'file and sweep the numbers of topics (see Mallet.sweep_models())')
+    parser.add_argument('--model-dir', required=True, help='the folder containing the collections\' models')
+    parser.add_argument('--collection', required=True, help='the name of the collection')
+    parser.add_argument('--import-file', required=True, help='the doc-terms file to import')
+    parser.add_argument('--topics', type=int, nargs='+', required=True, help='the numbers of topics to model')
+    parser.add_argument('--iterations', type=int, default=1000, help='the number of iterations (default: 1000)')
+    parser.add_argument('--optimize-interval', type=int, default=10,
+                        help='the hyperparameter optimization interval (default: 10)')
+    parser.add_argument('--optimize-burn-in', type=int, default=200,
+                        help='the number of iterations before hyperparameters are optimized (default: 200)')
+    parser.add_argument('--random-seed', type=int, default=10, help='the random seed (default: 10)')
+    parser.add_argument('--log-file', help='a file to save the MALLET output to')
+    parser.add_argument('--initial-iterations', type=int, default=100,
+                        help='sweep: the number of iterations all the models are trained for (default: 100)')
+    parser.add_argument('--keep', type=float, default=0.5,
+                        help='sweep: the fraction of the models kept at each step (default: 0.5)')
+    parser.add_argument('--metric', choices=SWEEP_METRICS, default='coherence',
+                        help='sweep: how to rank the models (default: coherence)')
+    parser.add_argument('--no-arrays', action='store_true',
+                        help='do not save the trained models\' results as memory-mappable arrays')
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+    setup_reporting(args)
+    mallet = Mallet(args.topics, args.model_dir, args.import_file, args.collection,
+                    num_iterations=args.iterations, optimize_interval=args.optimize_interval,
+                    optimize_burn_in=args.optimize_burn_in, random_seed=args.random_seed, generate_arrays=not args.no_arrays)
+    failed = []
+    if args.stage in ('import', 'all', 'sweep'):
+        failed = mallet.import_models()
+    if args.stage == 'sweep':
+        models = [topic_num for topic_num in args.topics if topic_num not in failed]
+        sweep = mallet.sweep_models(models, args.initial_iterations, args.keep, args.metric)
+        return 1 if failed or sweep['best'] is None else 0
+    if args.stage in ('train', 'all'):
+        models = [topic_num for topic_num in args.topics if topic_num not in failed]
+        failed += mallet.train_models(models, log_file=args.log_file)
+    return 1 if failed else 0
+
+# The notebooks load this script with `%run`, which also runs it as `__main__`
+if __name__ == '__main__' and not in_ipython():
+    sys.exit(main(sys.argv[1:]))
@@ -0,0 +1,96 @@
+"""mallet_state.py.
+
+Count the topic assignments in a MALLET state file.
+
+The gzipped state file lists the topic assigned to every token in every document. It is by far the
+largest output of a topic model. This script reads it once and reduces it to a matrix of token counts
+for each document and topic and a matrix of token counts for each topic and word type. These counts
+are saved next to the state file as arrays (see `model_arrays.py`) and used both to scale the topics
+(`scale_topics.py`) and to create dfr-browser data files (`dfr-browser/scripts/dfrb_data.py`).
+
+For use with model_topics.ipynb v 2.1.
+
+"""
+
+import gzip
+import numpy as np
+import pandas as pd
+from scipy import sparse
+
+
+def extract_params(statefile):
+    """Extract the alpha and beta values from the statefile.
+
+    Parameters:
+    - statefile (str): Path to statefile produced by MALLET.
+    
+    Returns:
+    - tuple: alpha (list), beta
+    """
+    with gzip.open(statefile, 'r') as state:
+        # only read the header lines, not the whole file
+        params = [state.readline().decode('utf8').strip() for i in range(3)][1:3]
+    return (list(params[0].split(":")[1].split(" ")), float(params[1].split(":")[1]))
+
+
+def aggregate_state(state_file, chunksize=1000000):
+    """Count the topic assignments in a MALLET state file in a single pass.
+
+    The state file is read in chunks, so the token-level data is never held in memory all at once.
+
+    Parameters:
+    - state_file (str): Path to statefile produced by MALLET.
+    - chunksize (int): Number of tokens to read at a time.
+
+    Returns:
+    - dict: alpha (list), beta (float), doc_topic (sparse matrix of token counts for each document
+      and topic), topic_term (sparse matrix of token counts for each topic and word type) and vocab
+      (list of word types in MALLET type index order).
+    """
+    params = extract_params(state_file)
+    alpha = [float(x) for x in params[0][1:]]
+    beta = params[1]
+    K = len(alpha)
+    doc_topic_keys = []
+    doc_topic_counts = []
+    topic_term_keys = []
+    topic_term_counts = []
+    vocab = {}
+    reader = pd.read_csv(state_file, compression='gzip', sep=' ', skiprows=[1, 2],
+                         usecols=['#doc', 'typeindex', 'type', 'topic'], dtype={'type': str},
+                         keep_default_na=False, chunksize=chunksize)
+    for chunk in reader:
+        doc = chunk['#doc'].to_numpy(dtype=np.int64)
+        typeindex = chunk['typeindex'].to_numpy(dtype=np.int64)
+        topic = chunk['topic'].to_numpy(dtype=np.int64)
+        # count each (doc, topic) and (topic, type) pair in the chunk
+        keys, counts = np.unique(doc * K + topic, return_counts=True)
+        doc_topic_keys.append(keys)
+        doc_topic_counts.append(counts)
+        keys, counts = np.unique(typeindex * K + topic, return_counts=True)
+        topic_term_keys.append(keys)
+        topic_term_counts.append(counts)
+        # record the word for each new type index
+        types, first = np.unique(typeindex, return_index=True)
+        words = chunk['type'].to_numpy()
+        for t, i in zip(types, first):
+            if t not in vocab:
+                vocab[t] = words[i]
+    doc_topic_keys = np.concatenate(doc_topic_keys) if doc_topic_keys else np.zeros(0, dtype=np.int64)
+    topic_term_keys = np.concatenate(topic_term_keys) if topic_term_keys else np.zeros(0, dtype=np.int64)
+    num_docs = int(doc_topic_keys.max() // K) + 1 if len(doc_topic_keys) else 0
+    num_types = max(vocab) + 1 if vocab else 0
+    # duplicate pairs from different chunks are summed when converting to csr
+    doc_topic = sparse.coo_matrix((np.concatenate(doc_topic_counts) if doc_topic_counts else [],
+                                   (doc_topic_keys // K, doc_topic_keys % K)),
+                                  shape=(num_docs, K), dtype=np.int64).tocsr()
+    topic_term = sparse.coo_matrix((np.concatenate(topic_term_counts) if topic_term_counts else [],
+                                    (topic_term_keys % K, topic_term_keys // K)),
+                                   shape=(K, num_types), dtype=np.int64).tocsr()
+    return {'alpha': alpha,
+            'beta': beta,
+            'doc_topic': doc_topic,
+            'topic_term': topic_term,
+            'vocab': [vocab.get(t, '') for t in range(num_types)]
+        }
+
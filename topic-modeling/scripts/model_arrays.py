@@ -0,0 +1,247 @@
+"""model_arrays.py.
+
+Save the results of a topic model as binary arrays that can be memory-mapped.
+
+MALLET writes its results as text (the composition, topic counts and keys files) and as the gzipped state
+file, which have to be parsed every time they are used. After a model is trained, `save_model_arrays()`
+converts them once into a folder of `.npy` arrays saved next to the state file (`topic-stateN-arrays`, for
+instance):
+
+- `doc_topics.npy`: the proportion of each topic in each document (float32, documents x topics), as in the
+  composition file.
+- `dt_data.npy`, `dt_indices.npy`, `dt_indptr.npy`: the number of tokens assigned to each topic in each
+  document, as a compressed sparse row matrix (documents x topics).
+- `tw_data.npy`, `tw_indices.npy`, `tw_indptr.npy`: the number of tokens of each word type assigned to each
+  topic, as a compressed sparse row matrix (topics x word types), as in the topic counts file.
+- `docs.txt` and `vocab.txt`: the name of each document and each word type, one per line, in the order of
+  the rows and columns of the arrays.
+- `index.json`: the shapes and types of the arrays, the hyperparameters of the model and the size and
+  modification time of the state file the arrays were made from. It is written last, so the arrays are
+  only used once they are complete.
+
+`load_model_arrays()` memory-maps the arrays, so even a model of a million documents is loaded at once and
+only the parts that are used are read from disk. It returns the same counts as `aggregate_state()`, so the
+arrays can be used by `scale()`, by the `dfr-browser` module and in notebooks in place of the state file.
+
+Sample usage:
+save_model_arrays('models/c33/topics25/topic-state25.gz', 'models/c33/topics25/composition25.txt')
+arrays = load_model_arrays('models/c33/topics25/topic-state25.gz')
+arrays['doc_topics'][arrays['docs'].index(name)]
+
+For use with model_topics.ipynb v 2.1.
+
+"""
+
+import json
+import os
+import shutil
+import numpy as np
+from scipy import sparse
+
+from mallet_state import aggregate_state
+from model_catalog import ARRAYS_INDEX, state_arrays_dir
+
+ARRAYS_VERSION = 1
+
+def _index_dtype(*arrays):
+    """Return int32 if the values of the index arrays of a sparse matrix fit in it, and int64 otherwise.
+
+    scipy keeps int32 indices as they are, so the memory-mapped arrays are not copied when they are loaded.
+    """
+    limit = np.iinfo(np.int32).max
+    return np.int32 if all(len(a) == 0 or a.max() <= limit for a in arrays) else np.int64
+
+def _save_csr(matrix, array_dir, prefix):
+    """Save a sparse matrix as three `.npy` arrays and return their description for the index."""
+    matrix = matrix.tocsr()
+    matrix.sort_indices()
+    dtype = _index_dtype(matrix.indices, matrix.indptr, np.array(matrix.shape))
+    files = {}
+    for name, values in [('data', matrix.data.astype(np.int32)), ('indices', matrix.indices.astype(dtype)),
+                         ('indptr', matrix.indptr.astype(dtype))]:
+        files[name] = prefix + '_' + name + '.npy'
+        np.save(os.path.join(array_dir, files[name]), values)
+    files['shape'] = list(matrix.shape)
+    return files
+
+def _load_csr(array_dir, files, mmap_mode):
+    """Load a sparse matrix saved by `_save_csr()`."""
+    arrays = [np.load(os.path.join(array_dir, files[name]), mmap_mode=mmap_mode)
+              for name in ('data', 'indices', 'indptr')]
+    return sparse.csr_matrix(tuple(arrays), shape=tuple(files['shape']), copy=False)
+
+def _write_lines(path, lines):
+    """Write one item per line."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for line in lines:
+            f.write(str(line) + '\n')
+
+def _read_lines(path):
+    """Read the items written by `_write_lines()`."""
+    with open(path, encoding='utf-8') as f:
+        return [line.rstrip('\n') for line in f]
+
+def _composition_rows(composition_file):
+    """Yield the fields of each document's line in a MALLET composition file, skipping comment lines."""
+    with open(composition_file, encoding='utf-8') as f:
+        for line in f:
+            if line.startswith('#') or not line.strip():
+                continue
+            yield line.rstrip('\n').split('\t')
+
+def save_composition(composition_file, num_topics, out_file):
+    """Save the topic proportions of a MALLET composition file as a float32 array.
+
+    Both the format of MALLET 2.0.8 and later (a proportion for each topic, in topic order) and that of
+    earlier versions (pairs of topic numbers and proportions, in order of proportion) are read. The array is
+    written a row at a time, so the proportions are never all held in memory.
+
+    Parameters:
+    - composition_file (str): Path to the composition file produced by MALLET.
+    - num_topics (int): The number of topics in the model.
+    - out_file (str): Path to the `.npy` file to write.
+
+    Returns:
+    - list: The names of the documents, in the order of the rows of the array, or None if the file is not in
+      either format.
+    """
+    num_docs = 0
+    for fields in _composition_rows(composition_file):
+        if len(fields) not in (num_topics + 2, 2 * num_topics + 2):
+            return None
+        num_docs = max(num_docs, int(fields[0]) + 1)
+    doc_topics = np.lib.format.open_memmap(out_file, mode='w+', dtype=np.float32, shape=(num_docs, num_topics))
+    names = [''] * num_docs
+    for fields in _composition_rows(composition_file):
+        doc = int(fields[0])
+        names[doc] = fields[1]
+        if len(fields) == num_topics + 2:
+            doc_topics[doc] = np.array(fields[2:], dtype=np.float32)
+        else:
+            doc_topics[doc, np.array(fields[2::2], dtype=np.int64)] = np.array(fields[3::2], dtype=np.float32)
+    doc_topics.flush()
+    del doc_topics
+    return names
+
+def _smoothed_doc_topics(doc_topic, alpha, out_file):
+    """Save the topic proportions of each document, computed from the counts as MALLET computes them."""
+    doc_topics = np.lib.format.open_memmap(out_file, mode='w+', dtype=np.float32, shape=doc_topic.shape)
+    alpha = np.asarray(alpha, dtype=np.float64)
+    for start in range(0, doc_topic.shape[0], 10000):
+        counts = doc_topic[start:start + 10000].toarray() + alpha
+        doc_topics[start:start + 10000] = counts / counts.sum(axis=1)[:, np.newaxis]
+    doc_topics.flush()
+    del doc_topics
+
+def save_model_arrays(state_file, composition_file=None, counts=None):
+    """Save the results of a model as memory-mappable arrays in the folder next to its state file.
+
+    Parameters:
+    - state_file (str): Path to the gzipped state file produced by MALLET.
+    - composition_file (str): Path to the composition file produced by MALLET. The topic proportions and
+      document names are taken from it if it is given and can be read. Otherwise the proportions are
+      computed from the counts and the documents are numbered.
+    - counts (dict): The output of `aggregate_state()` for the state file. If not given, the state file is read.
+
+    Returns:
+    - str: The folder the arrays were saved in.
+    """
+    if counts is None:
+        counts = aggregate_state(state_file)
+    array_dir = state_arrays_dir(state_file)
+    tmp_dir = array_dir + '.tmp'
+    if os.path.exists(tmp_dir):
+        shutil.rmtree(tmp_dir)
+    os.makedirs(tmp_dir)
+    num_topics = len(counts['alpha'])
+    doc_topic = counts['doc_topic']
+    names = None
+    if composition_file is not None and os.path.isfile(composition_file):
+        names = save_composition(composition_file, num_topics, os.path.join(tmp_dir, 'doc_topics.npy'))
+    if names is not None and len(names) >= doc_topic.shape[0]:
+        # documents at the end of the collection with no tokens are not in the state file
+        doc_topic = sparse.csr_matrix((doc_topic.data, doc_topic.indices,
+                                       np.pad(doc_topic.indptr, (0, len(names) - doc_topic.shape[0]), 'edge')),
+                                      shape=(len(names), num_topics))
+    else:
+        names = [str(doc) for doc in range(doc_topic.shape[0])]
+        _smoothed_doc_topics(doc_topic, counts['alpha'], os.path.join(tmp_dir, 'doc_topics.npy'))
+    _write_lines(os.path.join(tmp_dir, 'docs.txt'), names)
+    _write_lines(os.path.join(tmp_dir, 'vocab.txt'), counts['vocab'])
+    stat = os.stat(state_file)
+    index = {
+        'version': ARRAYS_VERSION,
+        'num_docs': doc_topic.shape[0],
+        'num_topics': num_topics,
+        'num_types': counts['topic_term'].shape[1],
+        'alpha': counts['alpha'],
+        'beta': counts['beta'],
+        'doc_topics': {'file': 'doc_topics.npy', 'dtype': 'float32', 'shape': [doc_topic.shape[0], num_topics]},
+        'doc_topic_counts': _save_csr(doc_topic, tmp_dir, 'dt'),
+        'topic_term_counts': _save_csr(counts['topic_term'], tmp_dir, 'tw'),
+        'docs': 'docs.txt',
+        'vocab': 'vocab.txt',
+        'state_file': {'file': os.path.basename(state_file), 'size': stat.st_size, 'mtime': stat.st_mtime}
+    }
+    with open(os.path.join(tmp_dir, ARRAYS_INDEX), 'w') as f:
+        json.dump(index, f, indent=4)
+    if os.path.exists(array_dir):
+        shutil.rmtree(array_dir)
+    os.replace(tmp_dir, array_dir)
+    return array_dir
+
+def load_arrays_index(state_file):
+    """Load the index of the arrays saved for a state file, or return None if there are none."""
+    try:
+        with open(os.path.join(state_arrays_dir(state_file), ARRAYS_INDEX)) as f:
+            index = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return index if index.get('version') == ARRAYS_VERSION else None
+
+def arrays_up_to_date(state_file):
+    """Return True if arrays have been saved for a state file since the state file last changed."""
+    index = load_arrays_index(state_file)
+    if index is None or not os.path.isfile(state_file):
+        return False
+    stat = os.stat(state_file)
+    return index['state_file']['size'] == stat.st_size and index['state_file']['mtime'] == stat.st_mtime
+
+def load_model_arrays(state_file, mmap_mode='r'):
+    """Load the arrays saved by `save_model_arrays()` for a state file.
+
+    Parameters:
+    - state_file (str): Path to the gzipped state file produced by MALLET. It does not need to exist.
+    - mmap_mode (str): How to memory-map the arrays (see `numpy.load()`), or None to read them into memory.
+
+    Returns:
+    - dict: The same structure returned by `aggregate_state()` (alpha, beta, doc_topic, topic_term and vocab),
+      with doc_topics (an array of the topic proportions of each document) and docs (the names of the
+      documents) added.
+    """
+    index = load_arrays_index(state_file)
+    if index is None:
+        raise FileNotFoundError('No arrays have been saved for ' + state_file + '.')
+    array_dir = state_arrays_dir(state_file)
+    return {'alpha': index['alpha'],
+            'beta': index['beta'],
+            'doc_topic': _load_csr(array_dir, index['doc_topic_counts'], mmap_mode),
+            'topic_term': _load_csr(array_dir, index['topic_term_counts'], mmap_mode),
+            'vocab': _read_lines(os.path.join(array_dir, index['vocab'])),
+            'doc_topics': np.load(os.path.join(array_dir, index['doc_topics']['file']), mmap_mode=mmap_mode),
+            'docs': _read_lines(os.path.join(array_dir, index['docs']))
+        }
+
+def model_counts(state_file, composition_file=None):
+    """Get the counts of a model from its arrays, saving the arrays first if they are missing or out of date.
+
+    Parameters:
+    - state_file (str): Path to the gzipped state file produced by MALLET.
+    - composition_file (str): Path to the composition file, used if the arrays have to be saved.
+
+    Returns:
+    - dict: The output of `load_model_arrays()`.
+    """
+    if not arrays_up_to_date(state_file):
+        save_model_arrays(state_file, composition_file)
+    return load_model_arrays(state_file)
@@ -0,0 +1,256 @@
+"""model_catalog.py.
+
+Keep a catalog of the topic models of a collection and the files produced for each model.
+
+The catalog is saved as `catalog.json` in the collection's models directory (`models/c33/catalog.json`, for
+instance). For each model it records the model's folder, the names of its MALLET files (the `model_vars` of
+a `Mallet` object) and the size, modification time and sha1 hash of each file that exists. `Mallet` writes
+the catalog when it sets up the model folders and after training, and `scale()` updates it after creating
+the `topic_scaled.csv` file, so other notebooks can find a model's files (and tell whether they have changed)
+without searching the model folders.
+
+Sample usage:
+catalog = load_catalog(model_dir, collection)
+state_file = artifact_path(model_dir, collection, '25', 'model_state')
+
+For use with model_topics.ipynb v 2.1.
+
+"""
+
+import hashlib
+import json
+import os
+import re
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    # not available on Windows
+    fcntl = None
+
+CATALOG_FILE = 'catalog.json'
+
+# Files created by the topic-modeling notebooks that are not MALLET output files
+EXTRA_FILES = {
+    'scaled': 'topic_scaled.csv',
+}
+
+# The index of the arrays saved by `save_model_arrays()`, in the folder next to the state file
+ARRAYS_INDEX = 'index.json'
+
+def default_model_vars(topic_num):
+    """Return the names of the files for a model with `topic_num` topics, as set by `Mallet.build_subdirs()`."""
+    topic_num = str(topic_num)
+    return {
+        'model_file': 'topics' + topic_num + '.mallet',
+        'model_state': 'topic-state' + topic_num + '.gz',
+        'model_keys': 'keys' + topic_num + '.txt',
+        'model_composition': 'composition' + topic_num + '.txt',
+        'model_counts': 'topic_counts' + topic_num + '.txt',
+        'diagnostics_file': 'diagnostics' + topic_num + '.xml',
+        'model_topic_docs': 'topic-docs' + topic_num + '.txt'
+    }
+
+def state_arrays_dir(state_file):
+    """Return the path of the folder of arrays saved alongside a MALLET state file (see `model_arrays.py`).
+
+    For example, the arrays for `topic-state25.gz` are saved in `topic-state25-arrays`.
+    """
+    return re.sub(r'\.gz$', '', state_file) + '-arrays'
+
+def catalog_path(model_dir, collection):
+    """Return the path to the catalog of a collection's models."""
+    return model_dir + '/' + collection + '/' + CATALOG_FILE
+
+def load_catalog(model_dir, collection):
+    """Load the catalog of a collection's models.
+
+    Returns an empty catalog if the collection does not have one yet.
+    """
+    try:
+        with open(catalog_path(model_dir, collection)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {'collection': collection, 'models': {}}
+
+def save_catalog(catalog, model_dir, collection):
+    """Save the catalog of a collection's models.
+
+    The catalog is written to a temporary file that then replaces the old catalog, so it is never
+    left half-written.
+    """
+    path = catalog_path(model_dir, collection)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(catalog, f, indent=4, sort_keys=True)
+    os.replace(path + '.tmp', path)
+
+@contextmanager
+def catalog_lock(model_dir, collection):
+    """Hold an exclusive lock on a collection's catalog while it is read, changed and saved.
+
+    Models of the same collection may be trained or scaled in separate processes at the same time (see the
+    pipeline module), so the lock stops one process from overwriting another's changes. No lock is taken
+    where `fcntl` is not available.
+    """
+    if fcntl is None:
+        yield
+        return
+    os.makedirs(model_dir + '/' + collection, exist_ok=True)
+    with open(catalog_path(model_dir, collection) + '.lock', 'w') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def file_info(path, previous=None):
+    """Get the size, modification time and sha1 hash of a file.
+
+    If `previous` (an earlier result for the same file) has the same size and modification time, its hash
+    is reused rather than reading the file again.
+    """
+    stat = os.stat(path)
+    info = {'size': stat.st_size, 'mtime': stat.st_mtime}
+    if previous is not None and previous.get('size') == stat.st_size and previous.get('mtime') == stat.st_mtime \
+            and 'sha1' in previous:
+        info['sha1'] = previous['sha1']
+        return info
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1048576), b''):
+            digest.update(block)
+    info['sha1'] = digest.hexdigest()
+    return info
+
+def update_model(catalog, model_dir, collection, topic_num, model_vars=None):
+    """Add a model to the catalog or update the information about its files.
+
+    Parameters:
+    - catalog (dict): The catalog returned by `load_catalog()`.
+    - model_dir (str): Path to the directory containing the models.
+    - collection (str): The name of the collection.
+    - topic_num (str or int): The number of topics in the model.
+    - model_vars (dict): The names of the model's files, replacing the names already in the catalog (by
+      default, the names used by `Mallet`).
+
+    Returns:
+    - dict: The model's entry in the catalog.
+    """
+    topic_num = str(topic_num)
+    entry = catalog['models'].setdefault(topic_num, {})
+    entry['dir'] = 'topics' + topic_num
+    if 'files' not in entry:
+        entry['files'] = default_model_vars(topic_num)
+    if model_vars is not None:
+        entry['files'].update(model_vars)
+    files = dict(EXTRA_FILES)
+    files.update(entry['files'])
+    if 'model_state' in files:
+        files['arrays'] = state_arrays_dir(files['model_state']) + '/' + ARRAYS_INDEX
+    subdir = model_dir + '/' + collection + '/' + entry['dir']
+    previous = entry.get('artifacts', {})
+    artifacts = {}
+    for key, file in files.items():
+        if os.path.isfile(subdir + '/' + file):
+            artifacts[key] = file_info(subdir + '/' + file, previous.get(key))
+            artifacts[key]['file'] = file
+    entry['artifacts'] = artifacts
+    return entry
+
+def update_catalog(model_dir, collection, models, model_vars=None):
+    """Add models to a collection's catalog, or update the information about their files, and save it.
+
+    The catalog is only locked and saved if the information about the models has changed.
+
+    Parameters:
+    - model_dir (str): Path to the directory containing the models.
+    - collection (str): The name of the collection.
+    - models (list): The numbers of topics of the models to update.
+    - model_vars (dict): The `model_vars` of a `Mallet` object, with the names of each model's files.
+
+    Returns:
+    - dict: The updated catalog.
+    """
+    catalog = load_catalog(model_dir, collection)
+    changed = {}
+    for topic_num in models:
+        topic_num = str(topic_num)
+        previous = json.dumps(catalog['models'].get(topic_num), sort_keys=True)
+        entry = update_model(catalog, model_dir, collection, topic_num,
+                             None if model_vars is None else model_vars.get(topic_num))
+        if json.dumps(entry, sort_keys=True) != previous:
+            changed[topic_num] = entry
+    if not changed:
+        return catalog
+    with catalog_lock(model_dir, collection):
+        # other processes may have changed other models since the catalog was loaded
+        catalog = load_catalog(model_dir, collection)
+        catalog['models'].update(changed)
+        save_catalog(catalog, model_dir, collection)
+    return catalog
+
+def scan_models(model_dir, collection):
+    """Find the models in a collection's models directory that are not in its catalog and add them.
+
+    For models trained before the catalog was introduced. Model folders are named `topicsN`; the files in
+    them are assumed to have the names used by `Mallet`.
+
+    Returns:
+    - dict: The updated catalog.
+    """
+    catalog = load_catalog(model_dir, collection)
+    collection_dir = model_dir + '/' + collection
+    found = []
+    if os.path.isdir(collection_dir):
+        for subdir in os.listdir(collection_dir):
+            if subdir.startswith('topics') and subdir[6:].isdigit() and os.path.isdir(collection_dir + '/' + subdir):
+                if subdir[6:] not in catalog['models']:
+                    found.append(subdir[6:])
+    if found:
+        catalog = update_catalog(model_dir, collection, found)
+    return catalog
+
+def sorted_models(catalog):
+    """Return the numbers of topics of the models in a catalog, from smallest to largest."""
+    return sorted(catalog['models'], key=int)
+
+def artifact_path(model_dir, collection, topic_num, key, catalog=None):
+    """Return the path to one of a model's files, or None if the file does not exist.
+
+    Parameters:
+    - model_dir (str): Path to the directory containing the models.
+    - collection (str): The name of the collection.
+    - topic_num (str or int): The number of topics in the model.
+    - key (str): The kind of file: one of the keys of `model_vars` (`model_state`, `model_keys`, etc.), `scaled`
+      or `arrays` (the index of the model's arrays).
+    - catalog (dict): The catalog returned by `load_catalog()`. Loaded if not given.
+    """
+    if catalog is None:
+        catalog = load_catalog(model_dir, collection)
+    entry = catalog['models'].get(str(topic_num))
+    if entry is None or key not in entry.get('artifacts', {}):
+        return None
+    return model_dir + '/' + collection + '/' + entry['dir'] + '/' + entry['artifacts'][key]['file']
+
+def cached_file_info(path):
+    """Look up a model file in the catalog of its collection.
+
+    Model files are stored in `{model_dir}/{collection}/topicsN`, so the catalog is found two folders up from
+    the file. Returns the catalog's information about the file (its size, modification time and hash), or
+    None if the file is not in a catalog.
+    """
+    subdir = os.path.dirname(os.path.abspath(path))
+    collection_dir = os.path.dirname(subdir)
+    try:
+        with open(collection_dir + '/' + CATALOG_FILE) as f:
+            catalog = json.load(f)
+    except (OSError, ValueError):
+        return None
+    for entry in catalog.get('models', {}).values():
+        if entry.get('dir') != os.path.basename(subdir):
+            continue
+        for info in entry.get('artifacts', {}).values():
+            if info.get('file') == os.path.basename(path):
+                return info
+    return None
@@ -0,0 +1,302 @@
+"""report.py.
+
+Report the progress, results and errors of the scripts, in a notebook or not.
+
+The scripts in this repo send their messages to the current reporter (see `set_reporter()`) rather than
+displaying HTML themselves, so they can be run from the notebooks, from the command line or from batch jobs.
+There are four reporters:
+
+- `NotebookReporter` displays messages as HTML and progress bars as widgets, as the notebooks always have.
+- `ConsoleReporter` prints plain text, with errors printed to stderr.
+- `SilentReporter` prints nothing, but keeps the messages in `records`.
+- `JsonReporter` keeps the messages and also writes each one to a stream or file as a line of JSON.
+
+By default, the notebook reporter is used when the scripts are run in a notebook and the console reporter is
+used otherwise. IPython and ipywidgets are only imported by the notebook reporter, when it first displays
+something.
+
+Errors that can happen once per document are counted with `count_error()` instead of being reported one at a
+time, and reported once per kind of error, with the number of times they happened, by `report_errors()`.
+
+Sample usage:
+set_reporter(ConsoleReporter())
+reporter = get_reporter()
+for file in files:
+    ...
+    reporter.count_error('Could not read file.', file)
+reporter.report_errors('See log file for more details.')
+reporter.heading('Done!')
+
+"""
+
+import html
+import json
+import sys
+from time import time
+
+class Progress:
+    """Report the progress of a long task, such as training a model, at each step of 10%."""
+
+    def __init__(self, reporter, label, total=100):
+        """Start reporting progress.
+
+        Parameters:
+        - reporter (Reporter): The reporter to report to.
+        - label (str): The name of the task.
+        - total (int): The value `update()` is called with when the task is finished.
+        """
+        self.reporter = reporter
+        self.label = label
+        self.total = total
+        self.percent = 0
+        self.reported = -1
+
+    def update(self, value):
+        """Set the progress of the task to `value` out of `total`."""
+        self.percent = min(100, int(100. * value / self.total)) if self.total else 100
+        step = self.percent - self.percent % 10
+        if step > self.reported:
+            self.reported = step
+            self.reporter.emit('progress', '%s: %d%%' % (self.label, step), label=self.label, percent=step)
+
+    def close(self):
+        """Finish reporting progress."""
+        pass
+
+class WidgetProgress(Progress):
+    """Show the progress of a task as a progress bar in a notebook."""
+
+    def __init__(self, reporter, label, total=100):
+        """Display the progress bar."""
+        super().__init__(reporter, label, total)
+        import ipywidgets
+        from IPython.display import display
+        self.bar = ipywidgets.IntProgress(min=0, max=100)
+        self.text = ipywidgets.HTML(value='0%')
+        display(ipywidgets.HBox([ipywidgets.Label(label), self.bar, self.text]))
+
+    def update(self, value):
+        """Move the progress bar to `value` out of `total`."""
+        self.percent = min(100, int(100. * value / self.total)) if self.total else 100
+        self.bar.value = self.percent
+        self.text.value = '{0}%'.format(self.percent)
+
+class Reporter:
+    """Report messages, progress and error counts.
+
+    Subclasses decide how messages are shown by overriding `emit()`. `num_errors` counts the errors reported,
+    so a command can tell whether its stage had errors.
+    """
+
+    def __init__(self):
+        """Create the reporter."""
+        self.errors = {}
+        self.num_errors = 0
+
+    def emit(self, level, text, **fields):
+        """Show a message.
+
+        Parameters:
+        - level (str): `heading` for the end of a stage, `info` for results, `text` for plain output such as
+          the output of a command or the time elapsed, `progress` for progress updates, or `warning` or
+          `error`.
+        - text (str): The message.
+        - fields: Other information about the message, for reporters that keep it.
+        """
+        raise NotImplementedError
+
+    def heading(self, text, **fields):
+        """Report the end of a stage, such as `Done!`."""
+        self.emit('heading', text, **fields)
+
+    def info(self, text, **fields):
+        """Report a result."""
+        self.emit('info', text, **fields)
+
+    def text(self, text, **fields):
+        """Report plain output."""
+        self.emit('text', text, **fields)
+
+    def warning(self, text, **fields):
+        """Report something that may need attention."""
+        self.emit('warning', text, **fields)
+
+    def error(self, text, **fields):
+        """Report an error."""
+        self.num_errors += 1
+        self.emit('error', text, **fields)
+
+    def progress(self, label, total=100):
+        """Return a `Progress` object to report the progress of a long task."""
+        return Progress(self, label, total)
+
+    def count_error(self, message, item=None):
+        """Count an error without reporting it yet (see `report_errors()`).
+
+        Parameters:
+        - message (str): The kind of error, such as `Could not read file.`.
+        - item (str): The document or file the error happened with. The first few are kept as examples.
+        """
+        error = self.errors.setdefault(message, {'count': 0, 'examples': []})
+        error['count'] += 1
+        if item is not None and len(error['examples']) < 3:
+            error['examples'].append(item)
+
+    def report_errors(self, hint=None):
+        """Report each kind of error counted with `count_error()` once, with the number of times it happened.
+
+        Parameters:
+        - hint (str): Added to each message, such as where to find more details.
+
+        Returns:
+        - dict: The number of times each kind of error happened. The counts are reset.
+        """
+        counts = {}
+        for message, error in self.errors.items():
+            text = 'Error! %s (%d %s)' % (message, error['count'], 'time' if error['count'] == 1 else 'times')
+            if hint is not None:
+                text += ' ' + hint
+            self.error(text, message=message, count=error['count'], examples=error['examples'])
+            counts[message] = error['count']
+        self.errors = {}
+        return counts
+
+class NotebookReporter(Reporter):
+    """Display messages as HTML in a notebook."""
+
+    STYLES = {
+        'heading': '<h4>%s</h4>',
+        'info': '<p><strong>%s</strong></p>',
+        'warning': '<p style="color: orange;">%s</p>',
+        'error': '<p style="color: red;">%s</p>'
+    }
+
+    def emit(self, level, text, **fields):
+        """Display the message."""
+        if level in self.STYLES:
+            from IPython.display import display, HTML
+            display(HTML(self.STYLES[level] % html.escape(text).replace('\n', '<br>')))
+        else:
+            print(text)
+
+    def progress(self, label, total=100):
+        """Return a progress bar."""
+        return WidgetProgress(self, label, total)
+
+class ConsoleReporter(Reporter):
+    """Print messages as plain text."""
+
+    def __init__(self, stream=None, error_stream=None):
+        """Create the reporter.
+
+        Parameters:
+        - stream (file): Where to print messages. Defaults to stdout.
+        - error_stream (file): Where to print warnings and errors. Defaults to stderr.
+        """
+        super().__init__()
+        self.stream = stream
+        self.error_stream = error_stream
+
+    def emit(self, level, text, **fields):
+        """Print the message."""
+        if level in ('warning', 'error'):
+            print(text, file=self.error_stream or sys.stderr)
+        else:
+            print(text, file=self.stream or sys.stdout)
+
+class SilentReporter(Reporter):
+    """Keep messages in `records` without showing them."""
+
+    def __init__(self):
+        """Create the reporter."""
+        super().__init__()
+        self.records = []
+
+    def emit(self, level, text, **fields):
+        """Keep the message."""
+        record = {'time': time(), 'level': level, 'text': text}
+        record.update(fields)
+        self.records.append(record)
+        return record
+
+class JsonReporter(SilentReporter):
+    """Keep messages and write each one as a line of JSON."""
+
+    def __init__(self, output=None):
+        """Create the reporter.
+
+        Parameters:
+        - output (str or file): The path of a file to append the messages to, or a stream to write them to.
+          Defaults to stdout.
+        """
+        super().__init__()
+        self.output = output
+
+    def emit(self, level, text, **fields):
+        """Keep the message and write it."""
+        line = json.dumps(super().emit(level, text, **fields), default=str) + '\n'
+        if isinstance(self.output, str):
+            with open(self.output, 'a') as f:
+                f.write(line)
+        else:
+            stream = self.output or sys.stdout
+            stream.write(line)
+            stream.flush()
+
+# The reporters that can be chosen on the command line
+REPORTERS = {
+    'console': ConsoleReporter,
+    'json': JsonReporter,
+    'silent': SilentReporter,
+    'notebook': NotebookReporter
+}
+
+def in_notebook():
+    """Return True if the code is running in a Jupyter kernel."""
+    return 'ipykernel' in sys.modules
+
+def in_ipython():
+    """Return True if the code is running in IPython, in a notebook or not.
+
+    Scripts loaded with `%run` are run as `__main__`, so they check this before running their command line.
+    """
+    if 'IPython' not in sys.modules:
+        return False
+    from IPython import get_ipython
+    return get_ipython() is not None
+
+def default_reporter():
+    """Return a notebook reporter in a notebook and a console reporter otherwise."""
+    return NotebookReporter() if in_notebook() else ConsoleReporter()
+
+_reporter = None
+
+def get_reporter():
+    """Return the reporter that messages are currently sent to."""
+    global _reporter
+    if _reporter is None:
+        _reporter = default_reporter()
+    return _reporter
+
+def set_reporter(reporter):
+    """Send messages to `reporter` from now on, and return the reporter used until now.
+
+    `reporter` may also be the name of one of the `REPORTERS`.
+    """
+    global _reporter
+    previous = get_reporter()
+    _reporter = REPORTERS[reporter]() if isinstance(reporter, str) else reporter
+    return previous
+
+def add_report_arguments(parser):
+    """Add the `--report` and `--trace` options shared by the command-line entry points to an argparse parser."""
+    parser.add_argument('--report', choices=list(REPORTERS), default='console',
+                        help='how to report progress and errors (default: console)')
+    parser.add_argument('--trace', help='a JSON-lines file to record the time taken by each stage in')
+
+def setup_reporting(args):
+    """Set the reporter and tracer chosen with the options added by `add_report_arguments()`."""
+    from timer import Tracer, set_tracer
+    set_reporter(args.report)
+    if args.trace:
+        set_tracer(Tracer(args.trace))
@@ -7,6 +7,9 @@ to transform MALLET data for use with pyLDAvis and uses code derived
 from pyLDAvis to calculate topic coordinates using MDS.
 and topic_scaled files below.
 
+The models of a collection can also be scaled from the command line:
+python scale_topics.py --model-dir models --collection c14 --topics 50 100
+
 For use with model_topics.ipynb v 2.1.
 
 """
@@ -16,24 +19,23 @@ For use with model_topics.ipynb v 2.1.
 
 
 # Python imports
-import gzip
+import argparse
+import importlib.util
 import logging
 import os
+import sys
 import numpy as np
 import pandas as pd
-import sklearn.preprocessing
-# Set fallback for MDS scaling
-try:
-    from sklearn.manifold import MDS, TSNE
-    sklearn_present = True
-except ImportError:
-    sklearn_present = False
-from IPython.display import display, HTML
 from past.builtins import basestring
-from scipy.stats import entropy
-from scipy.spatial.distance import pdist, squareform
 
-from timer import Timer
+from model_catalog import default_model_vars, load_catalog, update_catalog
+from mallet_state import aggregate_state
+from model_arrays import model_counts
+from report import add_report_arguments, get_reporter, in_ipython, setup_reporting
+from timer import span
+
+# Set fallback for MDS scaling. sklearn and scipy are slow to import, so they are only imported when they are used.
+sklearn_present = importlib.util.find_spec('sklearn') is not None
 
 def __num_dist_rows__(array, ndigits=2):
     return array.shape[0] - int((pd.DataFrame(array).sum(axis=1) < 0.999).sum())
@@ -81,6 +83,7 @@ def _input_validate(*args):
 
 
 def _jensen_shannon(_P, _Q):
+    from scipy.stats import entropy
     _M = 0.5 * (_P + _Q)
     return 0.5 * (entropy(_P, _M) + entropy(_Q, _M))
 
@@ -134,6 +137,7 @@ def js_PCoA(distributions):
     pcoa : array, shape (`n_dists`, 2)
 
     """
+    from scipy.spatial.distance import pdist, squareform
     dist_matrix = squareform(pdist(distributions, metric=_jensen_shannon))
     return _pcoa(dist_matrix)
 
@@ -155,6 +159,8 @@ def js_MMDS(distributions, **kwargs):
     mmds : array, shape (`n_dists`, 2)
 
     """
+    from scipy.spatial.distance import pdist, squareform
+    from sklearn.manifold import MDS
     dist_matrix = squareform(pdist(distributions, metric=_jensen_shannon))
     model = MDS(n_components=2, random_state=0, dissimilarity='precomputed', **kwargs)
     return model.fit_transform(dist_matrix)
@@ -177,6 +183,8 @@ def js_TSNE(distributions, **kwargs):
     tsne : array, shape (`n_dists`, 2)
 
     """
+    from scipy.spatial.distance import pdist, squareform
+    from sklearn.manifold import TSNE
     dist_matrix = squareform(pdist(distributions, metric=_jensen_shannon))
     model = TSNE(n_components=2, random_state=0, metric='precomputed', **kwargs)
     return model.fit_transform(dist_matrix)
@@ -289,20 +297,6 @@ def get_topic_coordinates(topic_term_dists, doc_topic_dists, doc_lengths, \
     return scaled_coordinates
 
 
-def extract_params(statefile):
-    """Extract the alpha and beta values from the statefile.
-
-    Parameters:
-    - statefile (str): Path to statefile produced by MALLET.
-    
-    Returns:
-    - tuple: alpha (list), beta
-    """
-    with gzip.open(statefile, 'r') as state:
-        params = [x.decode('utf8').strip() for x in state.readlines()[1:3]]
-    return (list(params[0].split(":")[1].split(" ")), float(params[1].split(":")[1]))
-
-
 def state_to_df(statefile):
     """Transform state file into pandas dataframe.
 
@@ -337,60 +331,89 @@ def pivot_and_smooth(df, smooth_value, rows_variable, cols_variable, values_vari
     matrix = df.pivot(index=rows_variable, columns=cols_variable, values=values_variable).fillna(value=0)
     matrix = matrix.values + smooth_value
 
-    normed = sklearn.preprocessing.normalize(matrix, norm='l1', axis=1)
+    normed = _normalize_rows(matrix)
 
     return pd.DataFrame(normed)
 
 
-def convert_mallet_data(state_file):
+def smooth(matrix, smooth_value):
+    """Add the priors to a matrix of counts and normalize it on the rows.
+
+    Parameters:
+    - matrix (array): matrix of counts
+    - smooth_value (float or list): value to add to the matrix to account for the priors
+
+    Returns:
+    - dataframe: pandas matrix that has been normalized on the rows.
+    """
+    normed = _normalize_rows(matrix + smooth_value)
+    return pd.DataFrame(normed)
+
+
+def _normalize_rows(matrix):
+    """Divide each row of a matrix by the sum of its absolute values.
+
+    Gives the same results as `sklearn.preprocessing.normalize(matrix, norm='l1', axis=1)`,
+    without importing sklearn.
+    """
+    matrix = np.asarray(matrix, dtype=np.float64)
+    norms = np.abs(matrix).sum(axis=1)
+    norms[norms == 0] = 1
+    return matrix / norms[:, np.newaxis]
+
+
+def convert_mallet_data(state_file=None, counts=None):
     """Convert Mallet data to a structure compatible with pyLDAvis.
 
     Parameters:
-    - output_state_file (string): Mallet state file
+    - state_file (string): Mallet state file
+    - counts (dict): The output of `aggregate_state()`. If given, the state file is not read.
 
     Returns:
     - data: dict containing pandas dataframes for the pyLDAvis prepare method.
     """
-    params = extract_params(state_file)
-    alpha = [float(x) for x in params[0][1:]]
-    beta = params[1]
-    df = state_to_df(state_file)
-    # Ensure that NaN is a string
-    df['type'] = df.type.astype(str)
-    # Get document lengths from statefile
-    docs = df.groupby('#doc')['type'].count().reset_index(name='doc_length')
-    # Get vocab and term frequencies from statefile
-    vocab = df['type'].value_counts().reset_index()
-    vocab.columns = ['type', 'term_freq']
-    vocab = vocab.sort_values(by='type', ascending=True)
-    phi_df = df.groupby(['topic', 'type'])['type'].count().reset_index(name='token_count')
-    phi_df = phi_df.sort_values(by='type', ascending=True)
-    phi = pivot_and_smooth(phi_df, beta, 'topic', 'type', 'token_count')
-    theta_df = df.groupby(['#doc', 'topic'])['topic'].count().reset_index(name='topic_count')
-    theta = pivot_and_smooth(theta_df, alpha, '#doc', 'topic', 'topic_count')
+    if counts is None:
+        counts = aggregate_state(state_file)
+    doc_topic = counts['doc_topic']
+    topic_term = counts['topic_term']
+    # Get document lengths, skipping documents with no tokens
+    doc_lengths = np.asarray(doc_topic.sum(axis=1)).ravel()
+    docs = np.flatnonzero(doc_lengths)
+    # Get vocab and term frequencies, sorted by word type
+    vocab = np.array(counts['vocab'], dtype=str)
+    order = np.argsort(vocab, kind='stable')
+    term_freq = np.asarray(topic_term.sum(axis=0)).ravel()
+    phi = smooth(topic_term[:, order].toarray(), counts['beta'])
+    theta = smooth(doc_topic[docs].toarray(), counts['alpha'])
     data = {'topic_term_dists': phi,
             'doc_topic_dists': theta,
-            'doc_lengths': list(docs['doc_length']),
-            'vocab': list(vocab['type']),
-            'term_frequency': list(vocab['term_freq'])
+            'doc_lengths': list(doc_lengths[docs]),
+            'vocab': list(vocab[order]),
+            'term_frequency': list(term_freq[order])
         }
     return data
 
 def get_model_vars(models, model_dir, collection):
     """Method for getting model_vars if a Mallet object does not exist.
+
+    The names of each model's files are taken from the collection's model catalog (see `model_catalog.py`),
+    or are the names used by `Mallet` if the model is not in the catalog.
     
     Parameters:
     - models (list): A list of model numbers
     - model_dir (str): Path to the directory containing the models
     
     Returns:
-    - model_vars (dict): A dict containing the model numbers and the names of their output_state files
+    - model_vars (dict): A dict containing the model numbers and the names of their output files
     """
+    catalog = load_catalog(model_dir, collection)
     model_vars = {}
     for topic_num in models:
         topic_num = str(topic_num)
-        subdir = model_dir + '/' + collection + '/topics' + topic_num
-        model_vars[topic_num] = {'model_state': 'topic-state' +topic_num + '.gz'}
+        if topic_num in catalog['models']:
+            model_vars[topic_num] = dict(catalog['models'][topic_num]['files'])
+        else:
+            model_vars[topic_num] = default_model_vars(topic_num)
     return model_vars
 
 def scale(models, model_dir, collection):
@@ -400,18 +423,47 @@ def scale(models, model_dir, collection):
     - models (list): A list of model numbers
     - model_dir (str): Path to the directory containing the models    
     """
-    timer = Timer()
-    for topic_num, metadata in models.items():
-        # Progress monitor
-        print('Processing topics' + topic_num + '...')
-        # Define file paths
-        model_state_path = model_dir + '/' + collection + '/topics' + topic_num + '/' + metadata['model_state']
-        topic_scaled_path = model_dir + '/' + collection + '/topics' + topic_num + '/topic_scaled.csv'
-        # Convert the mallet output_state file to a pyLDAvis data object
-        converted_data = convert_mallet_data(model_state_path)
-        # Get the topic coordinates in a dataframe
-        topic_coordinates = get_topic_coordinates(**converted_data)
-        # Save the topic coordinates to a CSV file
-        topic_coordinates.to_csv(topic_scaled_path, index=False, header=False)
-    display(HTML('<h4>Done!</h4>'))
-    print('Time elapsed: %s' % timer.get_time_elapsed())
+    with span('scale', collection=collection) as timer:
+        for topic_num, metadata in models.items():
+            # Progress monitor
+            get_reporter().text('Processing topics' + topic_num + '...')
+            # Define file paths
+            model_state_path = model_dir + '/' + collection + '/topics' + topic_num + '/' + metadata['model_state']
+            composition_path = model_dir + '/' + collection + '/topics' + topic_num + '/' + metadata['model_composition']
+            topic_scaled_path = model_dir + '/' + collection + '/topics' + topic_num + '/topic_scaled.csv'
+            with span('scale_model', topics=topic_num):
+                # Load the counts from the arrays saved after training. If they are missing or out of date,
+                # count the topic assignments in the state file and save the arrays, so that the dfr-browser
+                # files can be created from them without reading the state file again
+                with span('model_counts') as stage:
+                    counts = model_counts(model_state_path, composition_path)
+                    stage.add(int(counts['doc_topic'].sum()))
+                # Convert the counts to a pyLDAvis data object
+                with span('convert_mallet_data'):
+                    converted_data = convert_mallet_data(counts=counts)
+                # Get the topic coordinates in a dataframe
+                with span('get_topic_coordinates', items=int(topic_num)):
+                    topic_coordinates = get_topic_coordinates(**converted_data)
+                # Save the topic coordinates to a CSV file
+                topic_coordinates.to_csv(topic_scaled_path, index=False, header=False)
+                # Record the scaled file in the model catalog
+                update_catalog(model_dir, collection, [topic_num], {topic_num: metadata})
+            timer.add()
+        get_reporter().heading('Done!')
+        get_reporter().text('Time elapsed: %s' % timer.get_time_elapsed())
+
+def main(argv=None):
+    """Scale the topics of a collection's models from the command line."""
+    parser = argparse.ArgumentParser(description='Create the topic_scaled.csv files for topic models.')
+    parser.add_argument('--model-dir', required=True, help='the folder containing the collections\' models')
+    parser.add_argument('--collection', required=True, help='the name of the collection')
+    parser.add_argument('--topics', type=int, nargs='+', required=True, help='the numbers of topics of the models')
+    add_report_arguments(parser)
+    args = parser.parse_args(argv)
+    setup_reporting(args)
+    scale(get_model_vars(args.topics, args.model_dir, args.collection), args.model_dir, args.collection)
+    return 0
+
+# The notebooks load this script with `%run`, which also runs it as `__main__`
+if __name__ == '__main__' and not in_ipython():
+    sys.exit(main(sys.argv[1:]))
@@ -1,6 +1,42 @@
-"""timer.py."""
+"""timer.py.
 
-from time import time
+Time the stages of the notebooks.
+
+`Timer` measures the wall-clock time since it was started. `span()` extends it into named spans, which can be
+nested, and which record the wall-clock and CPU time of a stage, the peak memory used by the process, and the
+number of items (documents, words, models, etc.) processed and the rate at which they were processed. Spans are
+collected by a `Tracer`, which keeps them in memory and can also append them to a JSON-lines trace file as they
+finish. A tracer can also measure the peak memory allocated by Python and numpy in each span with `tracemalloc`,
+and profile the outermost spans with `cProfile`.
+
+The scripts in this repo record spans for their main stages with the current tracer (see `set_tracer()`), so
+the time a long run spends in each stage can be seen afterwards with `print_summary()` or by reading the trace
+file.
+
+Sample usage:
+set_tracer(Tracer('trace.jsonl'))
+with span('count_words', collection='c14') as s:
+    for row in rows:
+        ...
+        s.add()
+print_summary()
+
+"""
+
+import cProfile
+import json
+import os
+import sys
+import tracemalloc
+from contextlib import contextmanager
+from functools import wraps
+from time import process_time, time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
 
 class Timer:
     """Create a timer object."""
@@ -20,3 +56,223 @@ class Timer:
         h, m = divmod(m, 60)
         time_str = "%02d:%02d:%02d" % (h, m, s)
         return time_str
+
+def peak_rss():
+    """Return the peak resident memory of the process in bytes, or None if it cannot be measured."""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # reported in bytes on macOS and in kilobytes elsewhere
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+class Span(Timer):
+    """A timer for a named stage, which also records CPU time, memory and the number of items processed."""
+
+    def __init__(self, name, path, depth, items=0, attrs=None):
+        """Start the span.
+
+        Parameters:
+        - name (str): The name of the stage.
+        - path (str): The names of the span and the spans it is nested in, separated by `/`.
+        - depth (int): The number of spans it is nested in.
+        - items (int): The number of items processed so far.
+        - attrs (dict): Other information to record with the span (the collection or model, for instance).
+        """
+        super().__init__()
+        self.name = name
+        self.path = path
+        self.depth = depth
+        self.items = items
+        self.attrs = dict(attrs or {})
+        self.cpu_start = process_time()
+        self.peak_memory = 0
+
+    def add(self, items=1):
+        """Count items processed in the span."""
+        self.items += items
+
+    def set(self, **attrs):
+        """Record other information with the span."""
+        self.attrs.update(attrs)
+
+    def record(self, error=None):
+        """Return the information about the finished span as a dict."""
+        wall = time() - self.start
+        record = {
+            'name': self.name,
+            'path': self.path,
+            'depth': self.depth,
+            'pid': os.getpid(),
+            'start': self.start,
+            'wall': wall,
+            'cpu': process_time() - self.cpu_start,
+            'peak_rss': peak_rss(),
+            'items': self.items,
+            'throughput': self.items / wall if self.items and wall > 0 else None,
+            'status': 'ok' if error is None else 'error'
+        }
+        if error is not None:
+            record['error'] = type(error).__name__ + ': ' + str(error)
+        record.update(self.attrs)
+        return record
+
+class Tracer:
+    """Collect the spans recorded by `span()`."""
+
+    def __init__(self, trace_file=None, keep=True, memory=False, profile=False):
+        """Create a tracer.
+
+        Parameters:
+        - trace_file (str): Path to a JSON-lines file to append each span to when it finishes. Spans recorded in
+          worker processes are written to the same file.
+        - keep (bool): Keep the spans in memory (in `records`).
+        - memory (bool): Record the peak memory allocated by Python and numpy in each span (`peak_memory`), using
+          `tracemalloc`. This slows the code down.
+        - profile (bool): Profile each outermost span with `cProfile`. The profiles are kept in `profiles`, and
+          saved next to the trace file as `{trace_file}.{name}.prof` if there is one.
+        """
+        self.trace_file = trace_file
+        self.keep = keep
+        self.memory = memory
+        self.profile = profile
+        self.records = []
+        self.profiles = {}
+        self.stack = []
+        self.started_tracing = False
+
+    @contextmanager
+    def span(self, name, items=0, **attrs):
+        """Record a span for the code run in a `with` block.
+
+        Parameters:
+        - name (str): The name of the stage.
+        - items (int): The number of items the stage processes, if it is known in advance. Otherwise, count
+          them with the span's `add()` method.
+        - attrs: Other information to record with the span.
+
+        Yields:
+        - Span: The span.
+        """
+        parent = self.stack[-1] if self.stack else None
+        path = parent.path + '/' + name if parent else name
+        if self.memory:
+            if parent is None:
+                self.started_tracing = not tracemalloc.is_tracing()
+                if self.started_tracing:
+                    tracemalloc.start()
+            if parent is not None:
+                # the parent's peak so far, before it is reset for this span
+                parent.peak_memory = max(parent.peak_memory, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        current = Span(name, path, len(self.stack), items, attrs)
+        profiler = None
+        if self.profile and parent is None:
+            profiler = cProfile.Profile()
+            profiler.enable()
+        self.stack.append(current)
+        error = None
+        try:
+            yield current
+        except BaseException as err:
+            error = err
+            raise
+        finally:
+            if profiler is not None:
+                profiler.disable()
+            self.stack.pop()
+            record = current.record(error)
+            if self.memory:
+                current.peak_memory = max(current.peak_memory, tracemalloc.get_traced_memory()[1])
+                record['peak_memory'] = current.peak_memory
+                if parent is not None:
+                    parent.peak_memory = max(parent.peak_memory, current.peak_memory)
+                elif self.started_tracing:
+                    tracemalloc.stop()
+            if profiler is not None:
+                self.profiles[name] = profiler
+                if self.trace_file is not None:
+                    profiler.dump_stats(self.trace_file + '.' + name + '.prof')
+            self.emit(record)
+
+    def emit(self, record):
+        """Keep a finished span and append it to the trace file."""
+        if self.keep:
+            self.records.append(record)
+        if self.trace_file is not None:
+            # a single write per line, so lines from several processes are not interleaved
+            with open(self.trace_file, 'a') as f:
+                f.write(json.dumps(record, default=str) + '\n')
+
+    def current(self):
+        """Return the innermost span that has not finished, or None."""
+        return self.stack[-1] if self.stack else None
+
+    def summary(self):
+        """Total the spans recorded in memory by path.
+
+        Returns:
+        - list: For each path, in the order the spans first started, a dict with the number of spans (`count`),
+          their total wall-clock and CPU time, the total number of items and the overall throughput.
+        """
+        totals = {}
+        for record in self.records:
+            total = totals.setdefault(record['path'], {'path': record['path'], 'depth': record['depth'], 'count': 0,
+                                                       'wall': 0.0, 'cpu': 0.0, 'items': 0,
+                                                       'start': record['start']})
+            total['start'] = min(total['start'], record['start'])
+            total['count'] += 1
+            total['wall'] += record['wall']
+            total['cpu'] += record['cpu']
+            total['items'] += record['items'] or 0
+        for total in totals.values():
+            total['throughput'] = total['items'] / total['wall'] if total['items'] and total['wall'] > 0 else None
+        return sorted(totals.values(), key=lambda total: total['start'])
+
+_tracer = Tracer()
+
+def get_tracer():
+    """Return the tracer that spans are currently recorded with."""
+    return _tracer
+
+def set_tracer(tracer):
+    """Record spans with `tracer` from now on, and return the tracer used until now."""
+    global _tracer
+    previous = _tracer
+    _tracer = tracer
+    return previous
+
+def span(name, items=0, **attrs):
+    """Record a span with the current tracer (see `Tracer.span()`)."""
+    return _tracer.span(name, items, **attrs)
+
+def current_span():
+    """Return the innermost unfinished span of the current tracer, or None."""
+    return _tracer.current()
+
+def traced(name=None):
+    """Decorate a function so that each call is recorded as a span named after the function."""
+    def decorate(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name or func.__name__):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def print_summary(tracer=None):
+    """Print the time spent in each stage recorded by a tracer (by default, the current tracer)."""
+    if tracer is None:
+        tracer = _tracer
+    for total in tracer.summary():
+        line = '%s%s: %s (%.1f s, CPU %.1f s, %d calls' % ('  ' * total['depth'], total['path'].split('/')[-1],
+                                                            format_seconds(total['wall']), total['wall'],
+                                                            total['cpu'], total['count'])
+        if total['throughput'] is not None:
+            line += ', %d items, %.1f/s' % (total['items'], total['throughput'])
+        print(line + ')')
+
+def format_seconds(seconds):
+    """Format a number of seconds as hours, minutes, and seconds, as `Timer.get_time_elapsed()` does."""
+    m, s = divmod(seconds, 60)
+    h, m = divmod(m, 60)
+    return "%02d:%02d:%02d" % (h, m, s)